@@ -1,9 +1,60 @@
 from __future__ import annotations
 
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
 from app.db.session import engine
 from app.models.base import Base
 
+logger = logging.getLogger(__name__)
+
+
+def _ensure_columns(conn: Connection) -> None:
+    """
+    Миграций нет, а create_all не трогает существующие таблицы —
+    добавляем новые колонки через ALTER TABLE ADD COLUMN.
+    Только nullable или с server_default (иначе SQLite не даст добавить).
+    """
+    insp = inspect(conn)
+    existing_tables = set(insp.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            if not col.nullable and col.server_default is None:
+                logger.error(
+                    "init_db: cannot add NOT NULL column without server_default table=%s column=%s",
+                    table.name,
+                    col.name,
+                )
+                continue
+
+            ddl = CreateColumn(col).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            logger.info("init_db: added column table=%s column=%s", table.name, col.name)
+
+
+def _ensure_indexes(conn: Connection) -> None:
+    """
+    create_all не добавляет индексы к уже существующим таблицам —
+    досоздаём недостающие. IF NOT EXISTS, а не checkfirst: рефлексия
+    не видит индексы по выражениям (lower(username)).
+    """
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            conn.execute(CreateIndex(idx, if_not_exists=True))
+
 
 async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_ensure_columns)
+        await conn.run_sync(_ensure_indexes)
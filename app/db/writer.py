@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db.session import session_factory
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# операция записи: получает сессию writer'а, НЕ коммитит сама
+WriteOp = Callable[[AsyncSession], Awaitable[Any]]
+
+
+def group_commit_enabled() -> bool:
+    return (os.getenv("DB_GROUP_COMMIT") or "").strip().lower() in {"1", "true", "yes"}
+
+
+class GroupCommitWriter:
+    """
+    Group commit для SQLite: мелкие записи (счётчики, флаги, логи)
+    отправляются одной корутине-писателю, она выполняет пачку операций
+    в одной транзакции и делает один COMMIT (один fsync, один захват write-lock).
+    Future каждого вызывающего резолвится только после commit.
+
+    Если пачка упала (ошибка операции или commit) — откатываем её целиком
+    и прогоняем операции по одной, каждую в своей транзакции: ошибка
+    одной операции не роняет соседей.
+
+    Каждая операция попадает в закоммиченную транзакцию ровно один раз:
+    пачка выполняется отдельной задачей под shield, отмена writer'а её
+    дожидается и не повторяет. На это и рассчитаны неидемпотентные операции:
+    users.generated_* (+delta и stats.bump), payments.next_check
+    (check_attempts + 1), вставка admin_actions, bonus.start_pending
+    (результат — rowcount; повтор вернул бы False).
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        max_batch: int = 100,
+        max_delay_sec: float = 0.005,
+        maxsize: int = 10_000,
+    ) -> None:
+        self._sessionmaker = sessionmaker
+        self._max_batch = max(1, max_batch)
+        self._max_delay_sec = max(0.0, max_delay_sec)
+        self._queue: asyncio.Queue[tuple[WriteOp, asyncio.Future, str]] = asyncio.Queue(
+            maxsize=maxsize
+        )
+        self._running = False
+        # вынутое из очереди, но ещё не отданное в пачку — принадлежит writer'у,
+        # чтобы отмена посреди _collect ничего не потеряла
+        self._pending: list[tuple[WriteOp, asyncio.Future, str]] = []
+        self._inflight: asyncio.Task[None] | None = None
+
+        self.batches = 0
+        self.ops = 0
+        self.fallbacks = 0
+        self.failed = 0
+        self.max_batch_seen = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def submit(self, op: WriteOp, *, label: str = "write") -> Any:
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, fut, label))
+        return await fut
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._running,
+            "depth": self._queue.qsize(),
+            "batches": self.batches,
+            "ops": self.ops,
+            "avg_batch": round(self.ops / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "fallbacks": self.fallbacks,
+            "failed": self.failed,
+        }
+
+    async def _collect(self) -> None:
+        """Набирает пачку в self._pending."""
+        batch = self._pending
+        if not batch:
+            batch.append(await self._queue.get())
+        deadline = time.monotonic() + self._max_delay_sec
+        while len(batch) < self._max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run_batch(self, batch: list[tuple[WriteOp, asyncio.Future, str]]) -> None:
+        started = time.perf_counter()
+        results: list[Any] = []
+        try:
+            async with self._sessionmaker() as session:
+                for op, _, _ in batch:
+                    results.append(await op(session))
+                await session.commit()
+        except Exception:
+            logger.warning(
+                "db_writer: batch failed size=%s, retrying one by one",
+                len(batch),
+                exc_info=True,
+            )
+            self.fallbacks += 1
+            await self._run_individually(batch)
+            return
+
+        for (_, fut, _), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+        self.batches += 1
+        self.ops += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        logger.debug(
+            "db_writer: committed size=%s elapsed_ms=%.1f",
+            len(batch),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    async def _run_individually(
+        self, batch: list[tuple[WriteOp, asyncio.Future, str]]
+    ) -> None:
+        for op, fut, label in batch:
+            try:
+                async with self._sessionmaker() as session:
+                    result = await op(session)
+                    await session.commit()
+            except Exception as e:
+                self.failed += 1
+                logger.exception("db_writer: op failed label=%s", label)
+                if not fut.done():
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.ops += 1
+            if not fut.done():
+                fut.set_result(result)
+
+    async def run(self) -> None:
+        logger.info(
+            "db_writer: started max_batch=%s max_delay_ms=%.1f",
+            self._max_batch,
+            self._max_delay_sec * 1000,
+        )
+        self._running = True
+        try:
+            while True:
+                await self._collect()
+                batch, self._pending = self._pending, []
+                self._inflight = asyncio.create_task(self._run_batch(batch))
+                # отмена writer'а не должна прервать пачку между commit и future
+                await asyncio.shield(self._inflight)
+                self._inflight = None
+        except asyncio.CancelledError:
+            # shutdown: идущую пачку дожидаемся (не повторяем — она могла
+            # уже закоммититься), затем дописываем вынутое и остаток очереди
+            self._running = False
+            if self._inflight is not None:
+                await self._inflight
+                self._inflight = None
+            batch, self._pending = self._pending, []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            if batch:
+                await self._run_batch(batch)
+            raise
+        finally:
+            self._running = False
+
+
+_writer: GroupCommitWriter | None = None
+
+
+def get_group_writer() -> GroupCommitWriter | None:
+    return _writer
+
+
+def start_group_writer(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    *,
+    max_batch: int = 100,
+    max_delay_sec: float = 0.005,
+) -> asyncio.Task | None:
+    """
+    Запускает writer, если включён DB_GROUP_COMMIT. Иначе None —
+    submit_write пишет напрямую (как раньше).
+    """
+    global _writer
+    if not group_commit_enabled():
+        return None
+    _writer = GroupCommitWriter(
+        sessionmaker, max_batch=max_batch, max_delay_sec=max_delay_sec
+    )
+    return asyncio.create_task(_writer.run())
+
+
+async def submit_write(
+    op: Callable[[AsyncSession], Awaitable[T]],
+    *,
+    session: AsyncSession | None = None,
+    label: str = "write",
+) -> T:
+    """
+    Единая точка для мелких записей:
+    - writer запущен — операция уходит в общую транзакцию, ждём её commit
+    - иначе — выполняем в переданной сессии (или новой) и коммитим сразу
+
+    ⚠️ Через writer коммитится только сама операция, а не прочие
+    несохранённые изменения в session вызывающего кода.
+    """
+    writer = _writer
+    if writer is not None and writer.running:
+        return await writer.submit(op, label=label)
+
+    if session is not None:
+        result = await op(session)
+        await session.commit()
+        return result
+
+    async with session_factory() as own:
+        result = await op(own)
+        await own.commit()
+        return result
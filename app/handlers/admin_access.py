@@ -19,7 +19,7 @@ from app.repository.access import (
     give_subscription_plan,  # ✅ NEW
 )
 from app.repository.admin import is_admin
-from app.repository.admin_actions import log_admin_action
+from app.services.admin_action_buffer import enqueue_admin_action
 from app.repository.extra import get_all_plans  # ✅ NEW: планы из таблицы subscription
 from app.states.admin_access import AdminAccessFSM
 from app.utils.tg_edit import edit_text_safe
@@ -47,7 +47,7 @@ async def _ensure_admin(call_or_message, session: AsyncSession, action: str) ->
         return False
     if await is_admin(session, tg_id):
         data = getattr(call_or_message, "data", None) or getattr(call_or_message, "text", None) or ""
-        await log_admin_action(session, tg_id=tg_id, action=action, data=str(data))
+        enqueue_admin_action(tg_id=tg_id, action=action, data=str(data))
         return True
     logger.warning(
         "ADMIN_DENY action=%s tg_id=%s data=%s",
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import csv
+import io
 import logging
 import os
 import sys
 
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -19,11 +21,28 @@ from app.keyboards.admin import (
     admin_promo_kb,
 )
 from app.keyboards.confirm import yes_no_kb, ConfirmCallbacks
-from app.repository.admin import is_admin, get_users_page, get_users_stats
-from app.repository.admin_actions import log_admin_action
-from app.repository.promo import create_promo_code, get_last_promo_codes, PromoError
-from app.states.admin import AdminPromoFSM
+from app.repository.admin import (
+    is_admin,
+    get_users_keyset,
+    get_users_stats,
+    get_users_total,
+    search_users,
+)
+from app.db.writer import get_group_writer
+from app.repository.plans import reload_plan_catalog
+from app.services.admin_action_buffer import admin_action_buffer, enqueue_admin_action
+from app.services.channel_membership import membership_cache
+from app.services.scheduler import scheduler
+from app.repository import stats
+from app.repository.promo import (
+    create_promo_code,
+    generate_promo_codes,
+    get_last_promo_codes,
+    PromoError,
+)
+from app.states.admin import AdminPromoBulkFSM, AdminPromoFSM, AdminUsersSearchFSM
 from app.utils.tg_edit import edit_text_safe
+from app.utils.tracing import render_trace, trace_store
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -32,9 +51,7 @@ logger = logging.getLogger(__name__)
 async def _ensure_admin(call: CallbackQuery, session: AsyncSession, action: str) -> bool:
     tg_id = call.from_user.id
     if await is_admin(session, tg_id):
-        await log_admin_action(
-            session, tg_id=tg_id, action=action, data=str(call.data or "")
-        )
+        enqueue_admin_action(tg_id=tg_id, action=action, data=str(call.data or ""))
         return True
     logger.warning("ADMIN_DENY action=%s tg_id=%s data=%s", action, tg_id, call.data)
     await call.answer("Недостаточно прав", show_alert=True)
@@ -62,6 +79,63 @@ async def admin_restart(message: Message, session: AsyncSession) -> None:
     await _restart_process(message)
 
 
+@router.message(Command("plans_reload"))
+async def admin_plans_reload(message: Message, session: AsyncSession) -> None:
+    """
+    Перечитать таблицу subscription после ручного изменения планов.
+    """
+    tg_id = message.from_user.id
+    if not await is_admin(session, tg_id):
+        return
+    enqueue_admin_action(tg_id=tg_id, action="admin_panel.plans_reload", data=message.text)
+    catalog = await reload_plan_catalog(session)
+    lines = [
+        f"• <b>{_escape_html(p.name)}</b>: {p.duration_days} дн., "
+        f"🎬 {p.video_generations} / 🖼 {p.photo_generations}, {p.price} ₽"
+        for p in catalog.plans
+    ]
+    await message.answer(
+        f"✅ Планы перечитаны (версия <code>{catalog.version}</code>)\n" + "\n".join(lines)
+    )
+
+
+@router.message(Command("trace"))
+async def admin_trace(
+    message: Message, session: AsyncSession, command: CommandObject
+) -> None:
+    """
+    /trace <tg_id> [N] — дерево spans последних N генераций пользователя.
+    /trace <trace_id | kie_task_id> — один трейс.
+    Трейсы живут в памяти процесса — после рестарта история пустая.
+    """
+    tg_id = message.from_user.id
+    if not await is_admin(session, tg_id):
+        return
+    enqueue_admin_action(tg_id=tg_id, action="admin_panel.trace", data=message.text)
+
+    args = (command.args or "").split()
+    if not args:
+        await message.answer("Использование: /trace &lt;tg_id&gt; [N] или /trace &lt;trace_id | kie_task_id&gt;")
+        return
+
+    query = args[0]
+    if query.isdigit():
+        limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else 3
+        traces = trace_store.recent(int(query), span_name="generation", limit=max(1, min(limit, 10)))
+    else:
+        found = trace_store.find(query)
+        traces = [found] if found else []
+
+    if not traces:
+        await message.answer("Трейсов не найдено (хранятся в памяти до рестарта).")
+        return
+
+    text = "\n\n".join(render_trace(t) for t in reversed(traces))
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    await message.answer(f"<pre>{_escape_html(text)}</pre>")
+
+
 @router.callback_query(F.data == AdminCallbacks.STATS)
 async def admin_stats(call: CallbackQuery, session: AsyncSession) -> None:
     if not await _ensure_admin(call, session, "admin_panel.stats"):
@@ -69,54 +143,161 @@ async def admin_stats(call: CallbackQuery, session: AsyncSession) -> None:
     total_users, active_subs, total_photos, total_videos = await get_users_stats(
         session
     )
+    counters = await stats.get_counters(session)
+
+    daily_metrics = [
+        stats.NEW_USERS,
+        stats.PHOTOS_GENERATED,
+        stats.VIDEOS_GENERATED,
+        stats.PAYMENTS_CONFIRMED,
+        stats.REVENUE_RUB,
+    ]
+    daily = await stats.get_daily_totals(session, metrics=daily_metrics, days=7)
+    by_scenario_photo = await stats.get_daily_by_scenario(
+        session, metric=stats.PHOTOS_GENERATED, days=7
+    )
+    by_scenario_video = await stats.get_daily_by_scenario(
+        session, metric=stats.VIDEOS_GENERATED, days=7
+    )
+
+    rows = ["день   нов  фото видео опл  ₽"]
+    for day, m in sorted(daily.items(), reverse=True):
+        rows.append(
+            f"{day:%d.%m} {m[stats.NEW_USERS]:>5} {m[stats.PHOTOS_GENERATED]:>5} "
+            f"{m[stats.VIDEOS_GENERATED]:>5} {m[stats.PAYMENTS_CONFIRMED]:>3} "
+            f"{m[stats.REVENUE_RUB]}"
+        )
+
+    scenario_lines = [
+        f"• {name}: фото <code>{cnt}</code>" for name, cnt in by_scenario_photo.items()
+    ] + [
+        f"• {name}: видео <code>{cnt}</code>" for name, cnt in by_scenario_video.items()
+    ]
 
     text = (
         "📊 <b>Статистика</b>\n\n"
         f"👥 Всего пользователей: <code>{total_users}</code>\n"
         f"✅ Активных подписок: <code>{active_subs}</code>\n"
         f"🖼️ Сгенерировано фото: <code>{total_photos}</code>\n"
-        f"🎬 Сгенерировано видео: <code>{total_videos}</code>"
+        f"🎬 Сгенерировано видео: <code>{total_videos}</code>\n"
+        f"💳 Оплат: <code>{counters.get(stats.PAYMENTS_CONFIRMED, 0)}</code> "
+        f"на <code>{counters.get(stats.REVENUE_RUB, 0)} ₽</code>\n\n"
+        "<b>Последние 7 дней</b>\n"
+        f"<pre>{chr(10).join(rows)}</pre>"
+    )
+    if scenario_lines:
+        text += "\n<b>По сценариям (7 дней)</b>\n" + "\n".join(scenario_lines)
+
+    buf = admin_action_buffer.stats()
+    text += (
+        "\n\n🗂 Лог действий админов: "
+        f"в очереди <code>{buf['depth']}/{buf['maxsize']}</code>, "
+        f"записано <code>{buf['written']}</code>, "
+        f"отброшено <code>{buf['dropped']}</code>, "
+        f"ошибок <code>{buf['failed']}</code>"
+    )
+
+    writer = get_group_writer()
+    if writer is not None:
+        ws = writer.stats()
+        text += (
+            "\n💾 Group commit: "
+            f"транзакций <code>{ws['batches']}</code>, "
+            f"записей <code>{ws['ops']}</code>, "
+            f"средняя пачка <code>{ws['avg_batch']}</code>, "
+            f"ошибок <code>{ws['failed']}</code>"
+        )
+
+    sch = scheduler.stats()
+    text += (
+        "\n⏰ Планировщик: "
+        f"в очереди <code>{sch['queued']}</code>, "
+        f"выполняется <code>{sch['inflight']}</code>, "
+        f"выполнено <code>{sch['done']}</code>, "
+        f"ошибок <code>{sch['failed']}</code>"
+    )
+
+    ms = membership_cache.stats()
+    text += (
+        "\n📣 Кэш подписки на канал: "
+        f"записей <code>{ms['size']}</code>, "
+        f"попаданий <code>{ms['hits']}</code>, "
+        f"запросов <code>{ms['misses']}</code>, "
+        f"склеено <code>{ms['coalesced']}</code>, "
+        f"из апдейтов <code>{ms['events']}</code>"
     )
 
     await edit_text_safe(call, text, reply_markup=admin_menu_kb())
     await call.answer()
 
 
-def _parse_users_page(data: str) -> int:
+def _escape_html(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _parse_users_page(data: str) -> tuple[int, str | None, int | None]:
+    """
+    admin:users:page:<next|prev>:<cursor_id>:<page> -> (page, direction, cursor_id)
+    """
     try:
-        _, page = data.rsplit(":", 1)
-        return max(1, int(page))
+        direction, cursor, page = data.rsplit(":", 3)[1:]
+        if direction not in {"next", "prev"}:
+            raise ValueError(direction)
+        return max(1, int(page)), direction, int(cursor)
     except Exception:
-        return 1
+        return 1, None, None
+
+
+def _format_user_rows(rows) -> list[str]:
+    lines: list[str] = []
+    for uid, tg_id, username, created_at, photos, videos in rows:
+        uname = username or "-"
+        lines.append(
+            f"• id={uid} tg={tg_id} @{uname} ({created_at:%Y-%m-%d}) "
+            f"фото={int(photos or 0)} видео={int(videos or 0)}"
+        )
+    return lines
 
 
 async def _render_users_page(
-    call: CallbackQuery, session: AsyncSession, page: int
+    call: CallbackQuery,
+    session: AsyncSession,
+    page: int,
+    direction: str | None = None,
+    cursor_id: int | None = None,
 ) -> None:
     limit = 10
-    offset = (page - 1) * limit
-    rows, total_users = await get_users_page(session, limit=limit, offset=offset)
+    if direction == "prev":
+        rows, has_prev = await get_users_keyset(session, limit=limit, after_id=cursor_id)
+        has_next = True
+    else:
+        rows, has_next = await get_users_keyset(
+            session, limit=limit, before_id=cursor_id
+        )
+        has_prev = cursor_id is not None
 
     if not rows:
+        if page > 1:
+            # курсор устарел (например, пользователей удалили) — на первую страницу
+            await _render_users_page(call, session, page=1)
+            return
         text = "👥 <b>Пользователи</b>\n\nПока пусто 💤"
-        reply_markup = admin_menu_kb()
+        reply_markup = admin_users_nav_kb(
+            page=1, first_id=None, last_id=None, has_prev=False, has_next=False
+        )
     else:
-        lines: list[str] = []
-        for uid, tg_id, username, created_at, photos, videos in rows:
-            uname = username or "-"
-            lines.append(
-                f"• id={uid} tg={tg_id} @{uname} ({created_at:%Y-%m-%d}) "
-                f"фото={int(photos or 0)} видео={int(videos or 0)}"
-            )
-        total_pages = max(1, (total_users + limit - 1) // limit)
+        total_users = await get_users_total(session)
+        total_pages = max(page, (total_users + limit - 1) // limit)
         text = (
-            f"👥 <b>Пользователи</b> (стр. {page}/{total_pages})\n\n"
-            + "\n".join(lines)
+            f"👥 <b>Пользователи</b> (стр. {page}/{total_pages}, всего {total_users})\n\n"
+            + "\n".join(_format_user_rows(rows))
         )
         reply_markup = admin_users_nav_kb(
             page=page,
-            has_prev=page > 1,
-            has_next=offset + limit < total_users,
+            first_id=int(rows[0][0]),
+            last_id=int(rows[-1][0]),
+            has_prev=has_prev and page > 1,
+            has_next=has_next,
         )
 
     await edit_text_safe(call, text, reply_markup=reply_markup)
@@ -134,8 +315,51 @@ async def admin_users(call: CallbackQuery, session: AsyncSession) -> None:
 async def admin_users_page(call: CallbackQuery, session: AsyncSession) -> None:
     if not await _ensure_admin(call, session, "admin_panel.users_page"):
         return
-    page = _parse_users_page(call.data or "")
-    await _render_users_page(call, session, page=page)
+    page, direction, cursor_id = _parse_users_page(call.data or "")
+    await _render_users_page(
+        call, session, page=page, direction=direction, cursor_id=cursor_id
+    )
+
+
+@router.callback_query(F.data == AdminCallbacks.USERS_SEARCH)
+async def admin_users_search_start(
+    call: CallbackQuery, state: FSMContext, session: AsyncSession
+) -> None:
+    if not await _ensure_admin(call, session, "admin_panel.users_search"):
+        return
+    await state.clear()
+    await state.set_state(AdminUsersSearchFSM.query)
+    await edit_text_safe(
+        call,
+        "🔎 Введи tg_id, @username или начало username ✍️",
+    )
+    await call.answer()
+
+
+@router.message(AdminUsersSearchFSM.query)
+async def admin_users_search_in(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("Запрос пустой. Введи ещё раз ✍️")
+        return
+    await state.clear()
+
+    rows = await search_users(session, query, limit=20)
+    if not rows:
+        text = f"🔎 По запросу <code>{_escape_html(query)}</code> ничего не найдено"
+    else:
+        text = (
+            f"🔎 <b>Найдено</b> по <code>{_escape_html(query)}</code>: {len(rows)}\n\n"
+            + "\n".join(_format_user_rows(rows))
+        )
+    await message.answer(
+        text,
+        reply_markup=admin_users_nav_kb(
+            page=1, first_id=None, last_id=None, has_prev=False, has_next=False
+        ),
+    )
 
 
 @router.callback_query(F.data == AdminCallbacks.BACK)
@@ -329,3 +553,125 @@ async def admin_promo_confirm(
     await state.clear()
     await edit_text_safe(call, "✅ Промокод создан.", reply_markup=admin_menu_kb())
     await call.answer()
+
+
+PROMO_BULK_MAX = 10_000
+
+
+async def _read_int(message: Message, *, min_value: int, max_value: int) -> int | None:
+    try:
+        value = int((message.text or "").strip())
+    except Exception:
+        await message.answer("Нужно число. Введи ещё раз ✍️")
+        return None
+    if value < min_value or value > max_value:
+        await message.answer(f"Число должно быть от {min_value} до {max_value}")
+        return None
+    return value
+
+
+@router.callback_query(F.data == AdminCallbacks.BULK_PROMO)
+async def admin_promo_bulk_start(
+    call: CallbackQuery, state: FSMContext, session: AsyncSession
+) -> None:
+    if not await _ensure_admin(call, session, "admin_panel.bulk_promo"):
+        return
+    await state.clear()
+    await state.set_state(AdminPromoBulkFSM.count)
+    await edit_text_safe(
+        call,
+        f"🧬 Сколько одноразовых промокодов сгенерировать? (1–{PROMO_BULK_MAX})",
+    )
+    await call.answer()
+
+
+@router.message(AdminPromoBulkFSM.count)
+async def admin_promo_bulk_count(message: Message, state: FSMContext) -> None:
+    count = await _read_int(message, min_value=1, max_value=PROMO_BULK_MAX)
+    if count is None:
+        return
+    await state.update_data(count=count)
+    await state.set_state(AdminPromoBulkFSM.photo_count)
+    await message.answer("Сколько фото-генераций даёт каждый код?")
+
+
+@router.message(AdminPromoBulkFSM.photo_count)
+async def admin_promo_bulk_photo(message: Message, state: FSMContext) -> None:
+    count = await _read_int(message, min_value=0, max_value=1000)
+    if count is None:
+        return
+    await state.update_data(photo_count=count)
+    await state.set_state(AdminPromoBulkFSM.video_count)
+    await message.answer("Сколько видео-генераций даёт каждый код?")
+
+
+@router.message(AdminPromoBulkFSM.video_count)
+async def admin_promo_bulk_video(message: Message, state: FSMContext) -> None:
+    count = await _read_int(message, min_value=0, max_value=1000)
+    if count is None:
+        return
+    data = await state.get_data()
+    if count == 0 and int(data.get("photo_count") or 0) == 0:
+        await message.answer("Код должен давать хоть что-то. Введи число видео > 0")
+        return
+    await state.update_data(video_count=count)
+    await state.set_state(AdminPromoBulkFSM.prefix)
+    await message.answer("Префикс кодов (например BLOGGER-), или «-» без префикса")
+
+
+@router.message(AdminPromoBulkFSM.prefix)
+async def admin_promo_bulk_prefix(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
+    prefix = (message.text or "").strip()
+    if prefix == "-":
+        prefix = ""
+    if len(prefix) > 32:
+        await message.answer("Префикс слишком длинный (макс. 32). Введи ещё раз ✍️")
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    count = int(data.get("count") or 0)
+    photo_count = int(data.get("photo_count") or 0)
+    video_count = int(data.get("video_count") or 0)
+
+    await message.answer(f"Генерирую {count} кодов…")
+    try:
+        codes = await generate_promo_codes(
+            session,
+            count=count,
+            bonus_photo=photo_count,
+            bonus_video=video_count,
+            max_uses=1,
+            prefix=prefix,
+        )
+    except PromoError as e:
+        await message.answer(f"Ошибка: {e}", reply_markup=admin_menu_kb())
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["code", "bonus_photo", "bonus_video", "max_uses"])
+    for code in codes:
+        writer.writerow([code, photo_count, video_count, 1])
+
+    logger.info(
+        "admin_panel.bulk_promo: tg_id=%s count=%s prefix=%s photo=%s video=%s",
+        message.from_user.id,
+        len(codes),
+        prefix,
+        photo_count,
+        video_count,
+    )
+    await message.answer_document(
+        BufferedInputFile(
+            buf.getvalue().encode("utf-8"),
+            filename=f"promo_{prefix or 'codes'}_{len(codes)}.csv",
+        ),
+        caption=(
+            f"✅ Сгенерировано: <b>{len(codes)}</b>\n"
+            f"Каждый: 🖼 {photo_count} фото • 🎬 {video_count} видео, 1 активация"
+        ),
+        reply_markup=admin_menu_kb(),
+    )
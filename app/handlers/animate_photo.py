@@ -5,10 +5,10 @@ import logging
 from pathlib import Path
 
 import aiohttp
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.enums import ChatAction
 from aiogram.fsm.context import FSMContext
-from aiogram.types import BufferedInputFile, CallbackQuery, Message
+from aiogram.types import CallbackQuery, Message
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -26,7 +26,10 @@ from app.repository.generations import (
 from app.repository.users import increment_generated_videos
 from app.states.animate_photo import AnimatePhotoStates
 from app.utils.kie_kling_client import KieKlingClient
+from app.utils.log_pipeline import DEBUG_QUERIES
+from app.utils.metrics import generation_labels, generation_timer, timed_stage
 from app.utils.tg_edit import edit_text_safe
+from app.utils.tg_send import send_video_url
 from app.utils.progress_bar import progress_initial_text, progress_loop, stop_progress
 
 router = Router()
@@ -36,8 +39,10 @@ logger = logging.getLogger(__name__)
 _active_jobs: dict[int, asyncio.Task] = {}
 
 
-async def _download_telegram_file(bot_token: str, file_path: str) -> bytes:
-    url = f"https://api.telegram.org/file/bot{bot_token}/{file_path}"
+@timed_stage("tg_download")
+async def _download_telegram_file(bot: Bot, file_path: str) -> bytes:
+    # адрес файлового API — из сессии бота (учитывает свой Bot API сервер)
+    url = bot.session.api.file_url(bot.token, file_path)
     async with aiohttp.ClientSession(
         timeout=aiohttp.ClientTimeout(total=60)
     ) as session:
@@ -46,15 +51,6 @@ async def _download_telegram_file(bot_token: str, file_path: str) -> bytes:
             return await resp.read()
 
 
-async def _download_bytes(url: str, timeout_s: int = 180) -> bytes:
-    async with aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=timeout_s)
-    ) as session:
-        async with session.get(url) as resp:
-            resp.raise_for_status()
-            return await resp.read()
-
-
 async def _chat_action_loop(bot, chat_id: int, stop: asyncio.Event) -> None:
     while not stop.is_set():
         try:
@@ -107,16 +103,18 @@ async def animate_got_photo(message: Message, state: FSMContext) -> None:
         await message.answer("Не удалось получить файл из Telegram 😕 Попробуй ещё раз.")
         return
 
-    image_bytes = await _download_telegram_file(message.bot.token, file_path)
+    with generation_labels("animate"):
+        image_bytes = await _download_telegram_file(message.bot, file_path)
     filename = Path(file_path).name or "photo.jpg"
 
     client = KieKlingClient(settings.kie_api_key)
     try:
-        image_url = await client.upload_image_bytes(
-            image_bytes=image_bytes,
-            filename=filename,
-            upload_path=f"images/wearai/animate/{message.from_user.id}",
-        )
+        with generation_labels("animate"):
+            image_url = await client.upload_image_bytes(
+                image_bytes=image_bytes,
+                filename=filename,
+                upload_path=f"images/wearai/animate/{message.from_user.id}",
+            )
     except Exception as e:
         await message.answer(f"Ошибка загрузки фото в KIE 😕: {e}")
         await state.clear()
@@ -162,57 +160,62 @@ async def _run_video_job(
     client = KieKlingClient(settings.kie_api_key)
 
     try:
-        res = await client.wait_for_success(
-            task_id, poll_interval_s=10, max_wait_s=12 * 60
-        )
-
-        if res.state == "timeout":
-            await refund_video_generation(session, tg_id)
-            await stop_progress(stop, progress_task)
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=status_message_id,
-                text="Таймаут ожидания результата ⏳ Попробуйте ещё раз.",
+        with generation_timer("animate") as gen:
+            res = await client.wait_for_success(
+                task_id, poll_interval_s=10, max_wait_s=12 * 60
             )
-            return
 
-        if res.fail_msg:
-            await refund_video_generation(session, tg_id)
-            await stop_progress(stop, progress_task)
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=status_message_id,
-                text=f"Генерация завершилась ошибкой: {res.fail_msg}",
-            )
-            return
+            if res.state == "timeout":
+                gen.outcome = "timeout"
+                await refund_video_generation(session, tg_id)
+                await stop_progress(stop, progress_task)
+                await bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    text="Таймаут ожидания результата ⏳ Попробуйте ещё раз.",
+                )
+                return
+
+            if res.fail_msg:
+                gen.outcome = "kie_error"
+                await refund_video_generation(session, tg_id)
+                await stop_progress(stop, progress_task)
+                await bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    text=f"Генерация завершилась ошибкой: {res.fail_msg}",
+                )
+                return
+
+            if not res.result_url:
+                gen.outcome = "error"
+                await refund_video_generation(session, tg_id)
+                await stop_progress(stop, progress_task)
+                await bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    text="Готово, но не удалось найти ссылку на результат 😕",
+                )
+                return
+
+            direct_url = await client.to_direct_download_url(res.result_url)
 
-        if not res.result_url:
-            await refund_video_generation(session, tg_id)
             await stop_progress(stop, progress_task)
             await bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=status_message_id,
-                text="Готово, но не удалось найти ссылку на результат 😕",
+                text="✅ Готово! Отправляю видео…",
             )
-            return
-
-        direct_url = await client.to_direct_download_url(res.result_url)
-        video_bytes = await _download_bytes(direct_url, timeout_s=240)
-        video_file = BufferedInputFile(video_bytes, filename="animation.mp4")
-
-        await stop_progress(stop, progress_task)
-        await bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=status_message_id,
-            text="✅ Готово! Отправляю видео…",
-        )
-        await bot.send_video(
-            chat_id=chat_id,
-            video=video_file,
-            caption="Готово! Если нужно — дай следующий промпт ✍️",
-            supports_streaming=True,
+            await send_video_url(
+                bot,
+                chat_id,
+                url=direct_url,
+                filename="animation.mp4",
+                caption="Готово! Если нужно — дай следующий промпт ✍️",
+            )
+        await increment_generated_videos(
+            session=session, tg_id=tg_id, delta=1, scenario="animate"
         )
-        await increment_generated_videos(session=session, tg_id=tg_id, delta=1)
         await bot.send_message(
             chat_id=chat_id,
             text="Хотите ли что-то ещё сгенерировать?",
@@ -264,44 +267,45 @@ async def animate_got_prompt(
         await message.answer("Промпт пустой ✍️ Напиши, что должно происходить в видео.")
         return
 
-    # --- DEBUG (можно потом убрать) ---
-    logger.warning("ANIMATE_DEBUG tg_id=%s", tg_id)
-    db_user_id = await session.scalar(select(User.id).where(User.tg_id == tg_id))
-    logger.warning("ANIMATE_DEBUG db_user_id=%s", db_user_id)
-
-    if db_user_id:
-        row = await session.execute(
-            select(
-                UserSubscription.id,
-                UserSubscription.status,
-                UserSubscription.remaining_video,
-                UserSubscription.remaining_photo,
-                UserSubscription.expires_at,
-                Subscription.name,
+    # --- DEBUG: лишние SELECT'ы на горячем пути, только при DEBUG_QUERIES=1 ---
+    if DEBUG_QUERIES:
+        logger.warning("ANIMATE_DEBUG tg_id=%s", tg_id)
+        db_user_id = await session.scalar(select(User.id).where(User.tg_id == tg_id))
+        logger.warning("ANIMATE_DEBUG db_user_id=%s", db_user_id)
+
+        if db_user_id:
+            row = await session.execute(
+                select(
+                    UserSubscription.id,
+                    UserSubscription.status,
+                    UserSubscription.remaining_video,
+                    UserSubscription.remaining_photo,
+                    UserSubscription.expires_at,
+                    Subscription.name,
+                )
+                .select_from(UserSubscription)
+                .join(Subscription, Subscription.id == UserSubscription.subscription_id)
+                .where(UserSubscription.user_id == db_user_id)
+                .order_by(UserSubscription.activated_at.desc())
+                .limit(5)
             )
-            .select_from(UserSubscription)
-            .join(Subscription, Subscription.id == UserSubscription.subscription_id)
-            .where(UserSubscription.user_id == db_user_id)
-            .order_by(UserSubscription.activated_at.desc())
-            .limit(5)
-        )
-        logger.warning("ANIMATE_DEBUG last_subscriptions=%s", row.all())
-
-        row_active = await session.execute(
-            select(
-                UserSubscription.id,
-                UserSubscription.remaining_video,
-                UserSubscription.remaining_photo,
-                UserSubscription.expires_at,
-                Subscription.name,
+            logger.warning("ANIMATE_DEBUG last_subscriptions=%s", row.all())
+
+            row_active = await session.execute(
+                select(
+                    UserSubscription.id,
+                    UserSubscription.remaining_video,
+                    UserSubscription.remaining_photo,
+                    UserSubscription.expires_at,
+                    Subscription.name,
+                )
+                .select_from(UserSubscription)
+                .join(Subscription, Subscription.id == UserSubscription.subscription_id)
+                .where(UserSubscription.user_id == db_user_id, UserSubscription.status == 1)
+                .order_by(UserSubscription.activated_at.desc())
+                .limit(1)
             )
-            .select_from(UserSubscription)
-            .join(Subscription, Subscription.id == UserSubscription.subscription_id)
-            .where(UserSubscription.user_id == db_user_id, UserSubscription.status == 1)
-            .order_by(UserSubscription.activated_at.desc())
-            .limit(1)
-        )
-        logger.warning("ANIMATE_DEBUG active_subscription=%s", row_active.first())
+            logger.warning("ANIMATE_DEBUG active_subscription=%s", row_active.first())
     # --- /DEBUG ---
 
     try:
@@ -315,13 +319,14 @@ async def animate_got_prompt(
 
     client = KieKlingClient(settings.kie_api_key)
     try:
-        task_id = await client.create_kling_task(
-            prompt=prompt,
-            image_url=image_url,
-            duration="5",
-            negative_prompt="blur, distort, low quality, artifacts",
-            cfg_scale=1.0,
-        )
+        with generation_labels("animate"):
+            task_id = await client.create_kling_task(
+                prompt=prompt,
+                image_url=image_url,
+                duration="5",
+                negative_prompt="blur, distort, low quality, artifacts",
+                cfg_scale=1.0,
+            )
     except Exception as e:
         await refund_video_generation(session, tg_id)
         await message.answer(f"Не удалось запустить генерацию 😕: {e}")
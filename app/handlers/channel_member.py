@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import F, Router
+from aiogram.types import ChatMemberUpdated
+
+from app.services.channel_membership import is_member_status, membership_cache
+from app.services.free_channel_bonus import CHANNEL_ID
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+@router.chat_member(F.chat.id == CHANNEL_ID)
+async def channel_member_changed(event: ChatMemberUpdated) -> None:
+    """
+    Приходит, только если бот — админ канала. Держит кэш подписки
+    актуальным, так что «✅ Я подписался» почти не ходит в Bot API.
+    """
+    member = event.new_chat_member
+    tg_id = member.user.id
+    is_member = is_member_status(member.status, is_member=getattr(member, "is_member", None))
+    membership_cache.set_from_event(tg_id, is_member)
+    logger.debug(
+        "channel_member: tg_id=%s status=%s is_member=%s", tg_id, member.status, is_member
+    )
@@ -1,12 +1,8 @@
 # app/handlers/extra.py
 from __future__ import annotations
 
-import json
 import logging
-import os
-from dataclasses import dataclass
 
-import httpx
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -31,7 +27,7 @@ from app.services.free_channel_bonus import (
 )
 from app.repository.promo import redeem_promo_code, PromoError
 from app.models.payment import PaymentStatus
-from app.models.subscription import Subscription
+from app.repository.plans import PlanCatalog, PlanInfo, on_plan_catalog_change
 from app.repository.extra import (
     get_user,
     get_active_plan_name,
@@ -42,11 +38,11 @@ from app.repository.extra import (
 from app.repository.payments import (
     create_pending_payment,
     get_payment_by_id,
+    confirm_payment,
     mark_payment_status,
-    apply_plan_to_user,
 )
 from app.utils.tg_edit import edit_text_safe
-from app.services.platega import normalize_payment_status
+from app.services.platega import get_platega_client, normalize_payment_status
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -67,102 +63,6 @@ def _payment_tg_id(payment) -> int | None:
     )
 
 
-@dataclass
-class PlategaConfig:
-    base_url: str
-    merchant_id: str
-    secret: str
-    return_url: str
-    failed_url: str
-
-
-class PlategaClient:
-    def __init__(self, cfg: PlategaConfig) -> None:
-        self.cfg = cfg
-
-    async def create_payment_link(
-        self,
-        *,
-        amount: int,
-        currency: str,
-        description: str,
-        payload: dict,
-        payment_method: int = 2,
-    ) -> dict:
-        url = f"{self.cfg.base_url.rstrip('/')}/transaction/process"
-        headers = {
-            "Content-Type": "application/json",
-            "X-MerchantId": self.cfg.merchant_id,
-            "X-Secret": self.cfg.secret,
-        }
-        body = {
-            "paymentMethod": payment_method,
-            "paymentDetails": {"amount": amount, "currency": currency},
-            "description": description,
-            "return": self.cfg.return_url,
-            "failedUrl": self.cfg.failed_url,
-            "payload": json.dumps(payload, ensure_ascii=False),
-        }
-
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.post(url, headers=headers, json=body)
-
-        r.raise_for_status()
-        return r.json()
-
-    async def get_transaction_status(self, tx_id: str) -> str | None:
-        url = f"{self.cfg.base_url.rstrip('/')}/transaction/{tx_id}"
-        headers = {"X-MerchantId": self.cfg.merchant_id, "X-Secret": self.cfg.secret}
-
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(url, headers=headers)
-
-        if r.status_code != 200:
-            logger.warning(
-                "platega.get_transaction_status: non-200 status_code=%s tx_id=%s body=%s",
-                r.status_code,
-                tx_id,
-                (r.text or "")[:500],
-            )
-            return None
-
-        try:
-            data = r.json()
-        except Exception:
-            logger.exception(
-                "platega.get_transaction_status: invalid json tx_id=%s body=%s",
-                tx_id,
-                (r.text or "")[:500],
-            )
-            return None
-
-        status = data.get("status")
-        if not status and isinstance(data.get("transaction"), dict):
-            status = data["transaction"].get("status")
-        if not status and isinstance(data.get("data"), dict):
-            data_obj = data["data"]
-            status = data_obj.get("status")
-            if not status and isinstance(data_obj.get("transaction"), dict):
-                status = data_obj["transaction"].get("status")
-
-        return str(status) if status else None
-
-
-def build_platega_client() -> PlategaClient:
-    cfg = PlategaConfig(
-        base_url=os.getenv("PLATEGA_BASE_URL") or "https://app.platega.io",
-        merchant_id=os.getenv("PLATEGA_MERCHANT_ID") or "",
-        secret=os.getenv("PLATEGA_SECRET") or "",
-        return_url=os.getenv("PLATEGA_RETURN_URL") or "",
-        failed_url=os.getenv("PLATEGA_FAILED_URL") or "",
-    )
-
-    if not cfg.merchant_id or not cfg.secret:
-        raise RuntimeError("Platega env is not configured (MERCHANT_ID/SECRET).")
-
-    return PlategaClient(cfg)
-
-
 def _escape(s: str) -> str:
     return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
@@ -172,7 +72,7 @@ def _strike(text: str) -> str:
     return "".join(ch + "\u0336" for ch in text)
 
 
-def _table(plans: list[Subscription]) -> str:
+def _table(plans: list[PlanInfo]) -> str:
     by_name = {p.name: p for p in plans}
 
     lines = [
@@ -215,7 +115,7 @@ def _extra_text(
     )
 
 
-def _pitch(plan_name: str, plan: Subscription) -> str:
+def _pitch(plan_name: str, plan: PlanInfo) -> str:
     if plan_name == "Orbit":
         intro = "Ооо, <b>Orbit</b> — отличный выбор 🚀"
         vibe = "Это уверенный режим: тестишь идеи, делаешь карточки товара и вариации спокойно."
@@ -248,6 +148,24 @@ def _pitch(plan_name: str, plan: Subscription) -> str:
     )
 
 
+# таблица и описания пакетов рендерятся один раз на версию каталога планов
+_table_html = ""
+_pitches: dict[str, str] = {}
+
+
+def _render_plan_texts(catalog: PlanCatalog) -> None:
+    global _table_html, _pitches
+    _table_html = _table(list(catalog.plans))
+    _pitches = {
+        name: _pitch(name, plan)
+        for name in ("Orbit", "Nova", "Cosmic")
+        if (plan := catalog.by_name.get(name)) is not None
+    }
+
+
+on_plan_catalog_change(_render_plan_texts)
+
+
 @router.callback_query(F.data == ExtraCallbacks.TO_MENU)
 async def extra_to_menu(call: CallbackQuery) -> None:
     if call.message:
@@ -381,7 +299,7 @@ async def extra_free_check(call: CallbackQuery, session: AsyncSession) -> None:
         "В течение минуты придёт бесплатная генерация.",
     )
     await call.answer()
-    await schedule_bonus_grant(call.bot, tg_id, delay_s=60)
+    await schedule_bonus_grant(tg_id, delay_s=60)
 
 
 @router.callback_query(F.data == MenuCallbacks.EXTRA)
@@ -397,7 +315,8 @@ async def extra_open(call: CallbackQuery, session: AsyncSession) -> None:
             remaining_video, remaining_photo = await get_active_remaining(session, user.id)
 
         plans = await get_all_plans(session)
-        table_html = _table(plans)
+        # готовый рендер текущей версии каталога; до первого рендера — из plans
+        table_html = _table_html or _table(plans)
 
         if call.message:
             await edit_text_safe(
@@ -436,7 +355,7 @@ async def extra_want(call: CallbackQuery, session: AsyncSession) -> None:
     if call.message:
         await edit_text_safe(
             call,
-            _pitch(plan_name, plan),
+            _pitches.get(plan_name) or _pitch(plan_name, plan),
             reply_markup=extra_buy_kb(plan_name),
             parse_mode="HTML",
         )
@@ -488,7 +407,7 @@ async def extra_buy(call: CallbackQuery, session: AsyncSession) -> None:
     currency = "RUB"
 
     try:
-        client = build_platega_client()
+        client = get_platega_client()
     except Exception:
         logger.exception("extra_buy: platega client init failed")
         await call.answer("Платёжный сервис не настроен", show_alert=True)
@@ -601,7 +520,7 @@ async def extra_check_payment(call: CallbackQuery, session: AsyncSession) -> Non
         return
 
     try:
-        client = build_platega_client()
+        client = get_platega_client()
     except Exception:
         logger.exception("extra_check_payment: platega client init failed")
         await call.answer("Платёжный сервис не настроен", show_alert=True)
@@ -619,15 +538,18 @@ async def extra_check_payment(call: CallbackQuery, session: AsyncSession) -> Non
     )
 
     if status == "CONFIRMED":
-        plan = await get_plan(session, payment.plan_name)
-        if plan:
-            await apply_plan_to_user(session, call.from_user.id, plan)
-        await mark_payment_status(session, payment, PaymentStatus.CONFIRMED)
+        applied = await confirm_payment(session, payment, call.from_user.id)
+        if applied is None:
+            # параллельно подтвердил poller
+            await call.answer("✅ Уже подтверждено — пакет активирован", show_alert=True)
+            return
 
         if call.message:
             await edit_text_safe(
                 call,
-                "✅ Оплата подтверждена! Пакет активирован 🎉",
+                "✅ Оплата подтверждена! Пакет активирован 🎉"
+                if applied
+                else "✅ Оплата получена, но пакет не активировался автоматически. Напиши в поддержку — разберёмся 💬",
                 reply_markup=main_menu_kb(),
                 parse_mode="HTML",
             )
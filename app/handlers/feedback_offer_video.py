@@ -6,7 +6,7 @@ import uuid
 from pathlib import Path
 
 import aiohttp
-from aiogram import Router, F
+from aiogram import Bot, Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
@@ -16,14 +16,16 @@ from app.keyboards.menu import main_menu_kb
 from app.states.animate_photo import AnimatePhotoStates
 from app.states.feedback_flow import FeedbackFlow
 from app.utils.kie_kling_client import KieKlingClient
+from app.utils.generated_files import read_generated_file
 from app.utils.tg_edit import edit_text_safe
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-async def _download_telegram_file(bot_token: str, file_path: str) -> bytes:
-    url = f"https://api.telegram.org/file/bot{bot_token}/{file_path}"
+async def _download_telegram_file(bot: Bot, file_path: str) -> bytes:
+    # адрес файлового API — из сессии бота (учитывает свой Bot API сервер)
+    url = bot.session.api.file_url(bot.token, file_path)
     async with aiohttp.ClientSession(
         timeout=aiohttp.ClientTimeout(total=120)
     ) as session:
@@ -58,7 +60,7 @@ def _pick_best_output_file(fp: dict) -> tuple[str, str]:
     raise RuntimeError("Не удалось определить file_id результата генерации.")
 
 
-def _read_local_best_image_from_feedback(fp: dict) -> tuple[bytes, str, str]:
+async def _read_local_best_image_from_feedback(fp: dict) -> tuple[bytes, str, str]:
     best = fp.get("best_local_path")
     src_path: str | None = str(best) if isinstance(best, str) and best.strip() else None
 
@@ -73,10 +75,12 @@ def _read_local_best_image_from_feedback(fp: dict) -> tuple[bytes, str, str]:
         raise RuntimeError("Не найден локальный файл результата (best_local_path).")
 
     p = Path(src_path)
-    if not p.exists() or not p.is_file():
+    try:
+        data = await read_generated_file(p)
+    except OSError:
+        # вытеснен по квоте или удалён — дальше фолбэк на file_id в Telegram
         raise RuntimeError(f"Локальный файл результата не найден: {p}")
 
-    data = p.read_bytes()
     filename = p.name or "image.png"
     return data, filename, str(p)
 
@@ -99,7 +103,7 @@ async def _get_or_upload_kling_image_url(cb: CallbackQuery, state: FSMContext) -
     source_path: str | None = None
 
     try:
-        image_bytes, filename, source_path = _read_local_best_image_from_feedback(fp)
+        image_bytes, filename, source_path = await _read_local_best_image_from_feedback(fp)
         if (
             isinstance(cached_url, str)
             and cached_url.strip()
@@ -119,7 +123,7 @@ async def _get_or_upload_kling_image_url(cb: CallbackQuery, state: FSMContext) -
         tg_file = await cb.bot.get_file(file_id)
         if not tg_file.file_path:
             raise RuntimeError("Не удалось получить file_path из Telegram.")
-        image_bytes = await _download_telegram_file(cb.bot.token, tg_file.file_path)
+        image_bytes = await _download_telegram_file(cb.bot, tg_file.file_path)
         filename = Path(filename_from_payload).name or "image.jpg"
         source_path = f"tg:{file_id}"
 
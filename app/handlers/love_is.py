@@ -2,17 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from io import BytesIO
 import time
 import uuid
 
-import aiohttp
-
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, InputMediaPhoto, Message, BufferedInputFile
+from aiogram.types import CallbackQuery, InputMediaPhoto, Message
 from sqlalchemy.ext.asyncio import AsyncSession
-from PIL import Image
 
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
@@ -32,16 +28,18 @@ from app.repository.users import (
     upsert_user,
 )
 from app.services.album_collector import AlbumCollector
-from app.services.generation import generate_image_kie_from_telegram
+from app.services.generation import generate_image_urls_kie_from_telegram
+from app.services.transcoder import transcoder
 from app.states.love_is_flow import LoveIsFlow
 from app.utils.tg_edit import edit_text_safe
-from app.utils.tg_send import send_image_smart
+from app.utils.metrics import generation_timer
+from app.utils.tg_send import send_result_images, send_video_url
 from app.utils.progress_bar import (
     progress_initial_text,
     progress_loop,
     stop_progress,
 )
-from app.utils.generated_files import save_generated_image_bytes
+from app.utils.generated_files import read_generated_file
 from app.utils.content_media import send_content_photo
 from app.utils.kie_kling_client import KieKlingClient
 from app.db.config import settings
@@ -149,6 +147,7 @@ async def love_is_text_in(
 
     progress_task = asyncio.create_task(progress_loop(_update, stop))
 
+    charged = True  # списание выше; вернуть — ровно один раз
     sent_any = False
     try:
         prompt = (
@@ -174,34 +173,35 @@ async def love_is_text_in(
             "cartoon illustration, love is style, valentine postcard, hand-drawn, "
             "soft shading, clean lineart, cute couple."
         )
-        results = await generate_image_kie_from_telegram(
-            bot=message.bot,
-            session=session,
-            tg_id=tg_id,
-            prompt=prompt,
-            telegram_photo_file_ids=photos,
-            aspect_ratio="3:4",
-        )
-        if not results:
-            raise RuntimeError("KIE returned empty result")
-
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
-
-        first_path = ""
-        for filename, img_bytes in results:
-            local_path = save_generated_image_bytes(
-                img_bytes=img_bytes,
-                filename=filename,
-                scenario="love_is",
+        with generation_timer("love_is"):
+            results, from_memo = await generate_image_urls_kie_from_telegram(
+                bot=message.bot,
+                session=session,
                 tg_id=tg_id,
+                prompt=prompt,
+                telegram_photo_file_ids=photos,
+                aspect_ratio="3:4",
+            )
+            if from_memo:
+                # ту же задачу уже оплатил такой же запрос — это списание возвращаем
+                await refund_photo_generation(session, tg_id)
+                charged = False
+            if not results:
+                raise RuntimeError("KIE returned empty result")
+
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
+
+            delivered = await send_result_images(
+                message, results=results, scenario="love_is", keep_copy=True
             )
-            if not first_path:
-                first_path = local_path
-            await send_image_smart(message, img_bytes=img_bytes, filename=filename)
             sent_any = True
+            first_path = delivered[0].local_path
 
-        await increment_generated_photos(session=session, tg_id=tg_id, delta=1)
+        if not from_memo:  # результат из памяти засчитан первому запросу
+            await increment_generated_photos(
+                session=session, tg_id=tg_id, delta=1, scenario="love_is"
+            )
 
         if first_path:
             await state.update_data(love_is_image_path=first_path)
@@ -217,7 +217,7 @@ async def love_is_text_in(
 
     except Exception as e:
         logger.exception("LOVE_IS generation failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await message.answer(
@@ -228,38 +228,6 @@ async def love_is_text_in(
             await state.clear()
 
 
-def _compress_to_limit(data: bytes, max_bytes: int = _MAX_BYTES) -> bytes:
-    if len(data) <= max_bytes:
-        return data
-
-    img = Image.open(BytesIO(data))
-    img = img.convert("RGB")
-
-    quality = 90
-    scale = 1.0
-    while True:
-        buf = BytesIO()
-        w, h = img.size
-        if scale < 1.0:
-            img_resized = img.resize(
-                (int(w * scale), int(h * scale)), Image.LANCZOS
-            )
-        else:
-            img_resized = img
-
-        img_resized.save(buf, format="JPEG", quality=quality, optimize=True)
-        out = buf.getvalue()
-        if len(out) <= max_bytes:
-            return out
-
-        if quality > 40:
-            quality -= 10
-        else:
-            scale *= 0.9
-            if scale < 0.5:
-                return out
-
-
 @router.callback_query(LoveIsFlow.ready, F.data == LoveIsCallbacks.ANIMATE)
 async def love_is_animate(
     call: CallbackQuery, state: FSMContext, session: AsyncSession
@@ -289,14 +257,18 @@ async def love_is_animate(
         return
 
     try:
-        with open(path, "rb") as f:
-            img_bytes = f.read()
+        img_bytes = await read_generated_file(path)
     except Exception:
+        # файл мог быть вытеснен по квоте — генерацию уже списали
+        await refund_video_generation(session, tg_id)
         await call.message.answer("Не удалось открыть файл открытки 😕")
         await state.clear()
         return
 
-    img_bytes = _compress_to_limit(img_bytes)
+    try:
+        img_bytes = await transcoder.fit_jpeg(img_bytes, _MAX_BYTES)
+    except Exception:
+        logger.exception("love_is_animate: transcode failed tg_id=%s", tg_id)
     if len(img_bytes) > _MAX_BYTES:
         await refund_video_generation(session, tg_id)
         await call.message.answer("Не удалось сжать файл до 10 МБ 😕")
@@ -317,44 +289,49 @@ async def love_is_animate(
 
     try:
 
-        tag = f"{int(time.time()*1000)}_{uuid.uuid4().hex[:6]}"
-        image_url = await client.upload_image_bytes(
-            image_bytes=img_bytes,
-            filename=f"love_is_{tg_id}_{tag}.jpg",
-            upload_path=f"images/wearai/love_is/{tg_id}/{tag}",
-        )
-
-        task_id = await client.create_kling_task(
-            prompt="gentle romantic motion, subtle smiles, soft movement",
-            image_url=image_url,
-            duration="5",
-            negative_prompt="blur, distort, low quality, artifacts",
-            cfg_scale=1.0,
-        )
-
-        res = await client.wait_for_success(
-            task_id, poll_interval_s=10, max_wait_s=12 * 60
-        )
-        if res.state == "timeout":
-            raise RuntimeError("timeout")
-        if res.fail_msg:
-            raise RuntimeError(res.fail_msg)
-        if not res.result_url:
-            raise RuntimeError("no result url")
-
-        direct_url = await client.to_direct_download_url(res.result_url)
-        video_bytes = await _download_bytes(direct_url)
-        video_file = BufferedInputFile(video_bytes, filename="love_is.mp4")
+        with generation_timer("love_is_video") as gen:
+            tag = f"{int(time.time()*1000)}_{uuid.uuid4().hex[:6]}"
+            image_url = await client.upload_image_bytes(
+                image_bytes=img_bytes,
+                filename=f"love_is_{tg_id}_{tag}.jpg",
+                upload_path=f"images/wearai/love_is/{tg_id}/{tag}",
+            )
 
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю видео…")
+            task_id = await client.create_kling_task(
+                prompt="gentle romantic motion, subtle smiles, soft movement",
+                image_url=image_url,
+                duration="5",
+                negative_prompt="blur, distort, low quality, artifacts",
+                cfg_scale=1.0,
+            )
 
-        await call.message.answer_video(
-            video=video_file,
-            caption="Готово! 💞",
-            supports_streaming=True,
+            res = await client.wait_for_success(
+                task_id, poll_interval_s=10, max_wait_s=12 * 60
+            )
+            if res.state == "timeout":
+                gen.outcome = "timeout"
+                raise RuntimeError("timeout")
+            if res.fail_msg:
+                gen.outcome = "kie_error"
+                raise RuntimeError(res.fail_msg)
+            if not res.result_url:
+                raise RuntimeError("no result url")
+
+            direct_url = await client.to_direct_download_url(res.result_url)
+
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю видео…")
+
+            await send_video_url(
+                call.bot,
+                call.message.chat.id,
+                url=direct_url,
+                filename="love_is.mp4",
+                caption="Готово! 💞",
+            )
+        await increment_generated_videos(
+            session=session, tg_id=tg_id, delta=1, scenario="love_is"
         )
-        await increment_generated_videos(session=session, tg_id=tg_id, delta=1)
         await call.message.answer(
             "Хотите ли что-то ещё сгенерировать?",
             reply_markup=photo_menu_kb(),
@@ -367,11 +344,3 @@ async def love_is_animate(
     finally:
         await state.clear()
 
-
-async def _download_bytes(url: str, timeout_s: int = 240) -> bytes:
-    async with aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=timeout_s)
-    ) as session:
-        async with session.get(url) as resp:
-            resp.raise_for_status()
-            return await resp.read()
@@ -17,7 +17,7 @@ from app.repository.generations import (
 )
 from app.repository.users import increment_generated_photos, upsert_user
 from app.services.album_collector import AlbumCollector
-from app.services.generation import generate_image_kie_from_telegram
+from app.services.generation import generate_image_urls_kie_from_telegram
 from app.services.kie_ai import KieAIError
 from app.states.nano_banana_flow import NanoBananaFlow
 from app.utils.kie_errors import kie_error_to_user_text
@@ -28,7 +28,8 @@ from app.utils.progress_bar import (
 )
 from app.utils.content_media import send_content_photo
 from app.utils.tg_edit import edit_text_safe
-from app.utils.tg_send import send_image_smart
+from app.utils.metrics import generation_timer
+from app.utils.tg_send import send_result_images
 from app.utils.validators import MAX_TEXT_LEN, is_text_too_long
 
 router = Router()
@@ -145,30 +146,36 @@ async def nano_banana_prompt_in(
         await state.clear()
         return
 
+    charged = True  # списание выше; вернуть — ровно один раз
     sent_any = False
     try:
-        results = await generate_image_kie_from_telegram(
-            bot=message.bot,
-            session=session,
-            tg_id=tg_id,
-            prompt=prompt,
-            telegram_photo_file_ids=photos,
-            max_images=8,
-        )
+        with generation_timer("nano_banana"):
+            results, from_memo = await generate_image_urls_kie_from_telegram(
+                bot=message.bot,
+                session=session,
+                tg_id=tg_id,
+                prompt=prompt,
+                telegram_photo_file_ids=photos,
+                max_images=8,
+            )
+            if from_memo:
+                # ту же задачу уже оплатил такой же запрос — это списание возвращаем
+                await refund_photo_generation(session, tg_id)
+                charged = False
 
-        if not results:
-            raise RuntimeError("KIE returned empty result")
+            if not results:
+                raise RuntimeError("KIE returned empty result")
 
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
 
-        for filename, img_bytes in results:
-            await send_image_smart(
-                message, img_bytes=img_bytes, filename=filename
-            )
+            await send_result_images(message, results=results, scenario="nano_banana")
             sent_any = True
 
-        await increment_generated_photos(session=session, tg_id=tg_id, delta=1)
+        if not from_memo:  # результат из памяти засчитан первому запросу
+            await increment_generated_photos(
+                session=session, tg_id=tg_id, delta=1, scenario="nano_banana"
+            )
         await state.clear()
         await message.answer(
             "Хотите ли что-то ещё сгенерировать?",
@@ -178,7 +185,7 @@ async def nano_banana_prompt_in(
 
     except KieAIError as e:
         logger.warning("KIE rejected/failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(progress_msg, kie_error_to_user_text(e))
@@ -187,7 +194,7 @@ async def nano_banana_prompt_in(
 
     except Exception as e:
         logger.exception("NANO_BANANA generation failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(
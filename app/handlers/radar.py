@@ -18,13 +18,14 @@ from app.repository.generations import (
 )
 from app.repository.users import increment_generated_photos, upsert_user
 from app.services.album_collector import AlbumCollector
-from app.services.generation import generate_image_kie_from_telegram
+from app.services.generation import generate_image_urls_kie_from_telegram
 from app.services.kie_ai import KieAIError
 from app.states.radar_flow import RadarFlow
 from app.utils.kie_errors import kie_error_to_user_text
 from app.utils.progress_bar import progress_initial_text, progress_loop, stop_progress
 from app.utils.tg_edit import edit_text_safe
-from app.utils.tg_send import send_image_smart
+from app.utils.metrics import generation_timer
+from app.utils.tg_send import send_result_images
 from app.utils.validators import MAX_TEXT_LEN, is_text_too_long
 from app.utils.content_media import send_content_photo
 
@@ -308,27 +309,35 @@ async def radar_review_confirm(
         "Лица должны быть детально прорисованы на основе фотографий пользователя.\n"
     )
 
+    charged = True  # списание выше; вернуть — ровно один раз
     sent_any = False
     try:
-        results = await generate_image_kie_from_telegram(
-            bot=call.bot,
-            session=session,
-            tg_id=tg_id,
-            prompt=prompt,
-            telegram_photo_file_ids=photos,
-            max_images=8,
-        )
-        if not results:
-            raise RuntimeError("KIE returned empty result")
-
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
-
-        for filename, img_bytes in results:
-            await send_image_smart(call.message, img_bytes=img_bytes, filename=filename)
+        with generation_timer("radar"):
+            results, from_memo = await generate_image_urls_kie_from_telegram(
+                bot=call.bot,
+                session=session,
+                tg_id=tg_id,
+                prompt=prompt,
+                telegram_photo_file_ids=photos,
+                max_images=8,
+            )
+            if from_memo:
+                # ту же задачу уже оплатил такой же запрос — это списание возвращаем
+                await refund_photo_generation(session, tg_id)
+                charged = False
+            if not results:
+                raise RuntimeError("KIE returned empty result")
+
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
+
+            await send_result_images(call.message, results=results, scenario="radar")
             sent_any = True
 
-        await increment_generated_photos(session=session, tg_id=tg_id, delta=1)
+        if not from_memo:  # результат из памяти засчитан первому запросу
+            await increment_generated_photos(
+                session=session, tg_id=tg_id, delta=1, scenario="radar"
+            )
         await state.clear()
         await call.message.answer(
             "Хотите ли что-то ещё сгенерировать?",
@@ -338,7 +347,7 @@ async def radar_review_confirm(
 
     except KieAIError as e:
         logger.warning("RADAR KIE failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(progress_msg, kie_error_to_user_text(e))
@@ -347,7 +356,7 @@ async def radar_review_confirm(
 
     except Exception as e:
         logger.exception("RADAR generation failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import logging
+import re
+
+from aiogram import F, Router
+from aiogram.types import BufferedInputFile, CallbackQuery, URLInputFile
+
+from app.keyboards.result import ResultCallbacks
+from app.utils.generated_files import generated_store
+from app.utils.metrics import stage_timer
+from app.utils.tg_send import original_url
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[0-9a-f]{32}")
+
+
+@router.callback_query(F.data.startswith(ResultCallbacks.ORIGINAL_PREFIX))
+async def send_original(call: CallbackQuery) -> None:
+    """
+    «Оригинал» под превью: полный файл результата документом.
+    """
+    token = call.data.removeprefix(ResultCallbacks.ORIGINAL_PREFIX)
+    if not _TOKEN_RE.fullmatch(token):
+        await call.answer()
+        return
+    path = await generated_store.find(token)
+    if path is None and (remote := original_url(token)) is not None:
+        # фото ушло ссылкой, локальной копии нет — перекачиваем потоком с KIE
+        url, filename = remote
+        await call.answer("Отправляю оригинал…")
+        try:
+            with stage_timer("tg_send"):
+                await call.message.answer_document(URLInputFile(url, filename=filename, timeout=120))
+        except Exception as e:
+            # ссылки KIE временные
+            logger.warning("result_original: url fetch failed tg_id=%s err=%s", call.from_user.id, e)
+            await call.message.answer("Оригинал уже удалён — сгенерируй заново 🙌")
+            return
+        logger.info("result_original: sent by url tg_id=%s", call.from_user.id)
+        return
+    if path is None:
+        await call.answer("Оригинал уже удалён — сгенерируй заново 🙌", show_alert=True)
+        return
+
+    await call.answer("Отправляю оригинал…")
+    try:
+        data = await generated_store.read(path)
+    except OSError:
+        await call.message.answer("Оригинал уже удалён — сгенерируй заново 🙌")
+        return
+
+    with stage_timer("tg_send"):
+        await call.message.answer_document(
+            BufferedInputFile(data, filename=f"wearai_{token[:8]}{path.suffix or '.png'}"),
+        )
+    logger.info("result_original: sent tg_id=%s bytes=%s", call.from_user.id, len(data))
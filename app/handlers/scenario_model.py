@@ -24,14 +24,14 @@ from app.repository.generations import (
     NoGenerationsLeft,
 )
 from app.services.album_collector import AlbumCollector
-from app.services.generation import generate_image_kie_from_telegram
+from app.services.generation import generate_image_urls_kie_from_telegram
 from app.services.kie_ai import KieAIError
 from app.states.model_flow import ModelFlow
 from app.states.feedback_flow import FeedbackFlow
 from app.utils.tg_edit import edit_text_safe
-from app.utils.tg_send import send_image_smart
+from app.utils.metrics import generation_timer
+from app.utils.tg_send import send_result_images
 from app.utils.kie_errors import kie_error_to_user_text
-from app.utils.generated_files import save_generated_image_bytes
 from app.utils.progress_bar import (
     progress_initial_text,
     progress_loop,
@@ -315,60 +315,43 @@ async def review_confirmed(
         "Фотореализм, корректные пропорции, естественный свет, высокое качество."
     )
 
+    charged = True  # списание выше; вернуть — ровно один раз
     sent_any = False
     try:
-        results = await generate_image_kie_from_telegram(
-            bot=call.bot,
-            session=session,
-            tg_id=tg_id,  # тут именно tg_id нужен (photo_settings + tg download)
-            prompt=prompt,
-            telegram_photo_file_ids=product_photos,
-        )
+        with generation_timer("model"):
+            results, from_memo = await generate_image_urls_kie_from_telegram(
+                bot=call.bot,
+                session=session,
+                tg_id=tg_id,  # тут именно tg_id нужен (photo_settings + tg download)
+                prompt=prompt,
+                telegram_photo_file_ids=product_photos,
+            )
+            if from_memo:
+                # ту же задачу уже оплатил такой же запрос — это списание возвращаем
+                await refund_photo_generation(session, tg_id)
+                charged = False
 
-        if not results:
-            raise RuntimeError("KIE returned empty result")
+            if not results:
+                raise RuntimeError("KIE returned empty result")
 
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
-
-        output_files: list[dict[str, str]] = []
-        local_output_paths: list[str] = []
-        best_local_path: str = ""
-
-        for filename, img_bytes in results:
-            local_path = save_generated_image_bytes(
-                img_bytes=img_bytes,
-                filename=filename,
-                scenario="model",
-                tg_id=tg_id,
-            )
-            local_output_paths.append(local_path)
-            if not best_local_path:
-                best_local_path = local_path
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
 
-            sent = await send_image_smart(
-                call.message, img_bytes=img_bytes, filename=filename
+            delivered = await send_result_images(
+                call.message, results=results, scenario="model", keep_copy=True
             )
             sent_any = True
 
-            if getattr(sent, "photo", None):
-                output_files.append(
-                    {
-                        "kind": "photo",
-                        "file_id": sent.photo[-1].file_id,
-                        "filename": filename,
-                    }
-                )
-            elif getattr(sent, "document", None):
-                output_files.append(
-                    {
-                        "kind": "document",
-                        "file_id": sent.document.file_id,
-                        "filename": filename,
-                    }
-                )
-
-        await increment_generated_photos(session=session, tg_id=tg_id, delta=1)
+            output_files: list[dict[str, str]] = [
+                f for d in delivered if (f := d.output_file()) is not None
+            ]
+            local_output_paths: list[str] = [d.local_path for d in delivered if d.local_path]
+            best_local_path: str = local_output_paths[0] if local_output_paths else ""
+
+        if not from_memo:  # результат из памяти засчитан первому запросу
+            await increment_generated_photos(
+                session=session, tg_id=tg_id, delta=1, scenario="model"
+            )
 
         await state.set_data(
             {
@@ -400,7 +383,7 @@ async def review_confirmed(
 
     except KieAIError as e:
         logger.warning("KIE rejected/failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(
@@ -410,7 +393,7 @@ async def review_confirmed(
 
     except Exception as e:
         logger.exception("MODEL generation failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)
         await stop_progress(stop, progress_task)
         await edit_text_safe(
@@ -21,13 +21,14 @@ from app.repository.generations import (
     refund_photo_generation,
     NoGenerationsLeft,
 )
-from app.services.generation import generate_image_kie_from_telegram
+from app.services.generation import generate_image_urls_kie_from_telegram
 from app.services.kie_ai import KieAIError
 from app.states.tryon_flow import TryOnFlow
 from app.states.feedback_flow import FeedbackFlow
 from app.utils.kie_errors import kie_error_to_user_text
 from app.utils.tg_edit import edit_text_safe
-from app.utils.tg_send import send_image_smart
+from app.utils.metrics import generation_timer
+from app.utils.tg_send import send_result_images
 from app.utils.validators import MAX_TEXT_LEN, is_text_too_long
 from app.utils.progress_bar import (
     progress_initial_text,
@@ -35,7 +36,6 @@ from app.utils.progress_bar import (
     stop_progress,
 )
 from app.utils.content_media import send_content_album
-from app.utils.generated_files import save_generated_image_bytes
 
 
 router = Router()
@@ -218,60 +218,43 @@ async def tryon_desc_in(
         f"\nUser instruction (RU): {style_prompt}\n"
     )
 
+    charged = True  # списание выше; вернуть — ровно один раз
     sent_any = False
     try:
-        results = await generate_image_kie_from_telegram(
-            bot=message.bot,
-            session=session,
-            tg_id=tg_id,  # ✅ тут тоже tg_id
-            prompt=prompt,
-            telegram_photo_file_ids=[user_photo, item_photo],
-        )
+        with generation_timer("tryon"):
+            results, from_memo = await generate_image_urls_kie_from_telegram(
+                bot=message.bot,
+                session=session,
+                tg_id=tg_id,  # ✅ тут тоже tg_id
+                prompt=prompt,
+                telegram_photo_file_ids=[user_photo, item_photo],
+            )
+            if from_memo:
+                # ту же задачу уже оплатил такой же запрос — это списание возвращаем
+                await refund_photo_generation(session, tg_id)
+                charged = False
 
-        if not results:
-            raise RuntimeError("KIE returned empty result")
+            if not results:
+                raise RuntimeError("KIE returned empty result")
 
-        await stop_progress(stop, progress_task)
-        await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
-
-        output_files: list[dict[str, str]] = []
-        local_output_paths: list[str] = []
-        best_local_path: str = ""
-
-        for filename, img_bytes in results:
-            local_path = save_generated_image_bytes(
-                img_bytes=img_bytes,
-                filename=filename,
-                scenario="tryon",
-                tg_id=tg_id,
-            )
-            local_output_paths.append(local_path)
-            if not best_local_path:
-                best_local_path = local_path
+            await stop_progress(stop, progress_task)
+            await edit_text_safe(progress_msg, "✅ Готово! Отправляю результат…")
 
-            sent = await send_image_smart(
-                message, img_bytes=img_bytes, filename=filename
+            delivered = await send_result_images(
+                message, results=results, scenario="tryon", keep_copy=True
             )
             sent_any = True
 
-            if getattr(sent, "photo", None):
-                output_files.append(
-                    {
-                        "kind": "photo",
-                        "file_id": sent.photo[-1].file_id,
-                        "filename": filename,
-                    }
-                )
-            elif getattr(sent, "document", None):
-                output_files.append(
-                    {
-                        "kind": "document",
-                        "file_id": sent.document.file_id,
-                        "filename": filename,
-                    }
-                )
-
-        await increment_generated_photos(session=session, tg_id=tg_id, delta=1)
+            output_files: list[dict[str, str]] = [
+                f for d in delivered if (f := d.output_file()) is not None
+            ]
+            local_output_paths: list[str] = [d.local_path for d in delivered if d.local_path]
+            best_local_path: str = local_output_paths[0] if local_output_paths else ""
+
+        if not from_memo:  # результат из памяти засчитан первому запросу
+            await increment_generated_photos(
+                session=session, tg_id=tg_id, delta=1, scenario="tryon"
+            )
 
         await state.set_data(
             {
@@ -305,7 +288,7 @@ async def tryon_desc_in(
 
     except KieAIError as e:
         logger.warning("TRYON KIE failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)  # ✅ tg_id
         await stop_progress(stop, progress_task)
         await message.answer(kie_error_to_user_text(e))
@@ -313,7 +296,7 @@ async def tryon_desc_in(
 
     except Exception as e:
         logger.exception("TRYON generation failed: %s", e)
-        if not sent_any:
+        if charged and not sent_any:
             await refund_photo_generation(session, tg_id)  # ✅ tg_id
         await stop_progress(stop, progress_task)
         await message.answer(
@@ -1,10 +1,8 @@
 # app/handlers/start.py
 from __future__ import annotations
 
-import os
 import logging
 
-import httpx
 from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
@@ -18,14 +16,13 @@ from app.repository.referrals import parse_referrer_tg_id, process_referral_for_
 from app.repository.photo_settings import ensure_photo_settings
 from app.repository.generations import ensure_default_subscription
 from app.services.free_channel_bonus import schedule_free_bonus_reminder
-from app.repository.extra import get_plan
 from app.repository.payments import (
     get_latest_pending_payment,
+    confirm_payment,
     mark_payment_status,
-    apply_plan_to_user,
 )
 from app.models.payment import PaymentStatus
-from app.services.platega import normalize_payment_status
+from app.services.platega import get_platega_client, normalize_payment_status
 from app.utils.tg_edit import edit_text_safe
 from app.utils.content_media import send_content_photo
 
@@ -45,55 +42,20 @@ async def _hard_reset_user_runtime_caches(*, chat_id: int) -> None:
 
 
 async def _platega_get_status(tx_id: str) -> str | None:
-    base_url = os.getenv("PLATEGA_BASE_URL") or "https://app.platega.io"
-    merchant_id = os.getenv("PLATEGA_MERCHANT_ID") or ""
-    secret = os.getenv("PLATEGA_SECRET") or ""
-
-    if not merchant_id or not secret:
+    try:
+        client = get_platega_client()
+    except Exception:
         logger.error(
             "start._platega_get_status: missing PLATEGA_MERCHANT_ID/PLATEGA_SECRET"
         )
         return None
 
-    url = f"{base_url.rstrip('/')}/transaction/{tx_id}"
-    headers = {"X-MerchantId": merchant_id, "X-Secret": secret}
-
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(url, headers=headers)
+        raw_status = await client.get_transaction_status(tx_id)
     except Exception:
         logger.exception("start._platega_get_status: request failed tx_id=%s", tx_id)
         return None
 
-    if r.status_code != 200:
-        logger.warning(
-            "start._platega_get_status: non-200 status_code=%s tx_id=%s body=%s",
-            r.status_code,
-            tx_id,
-            (r.text or "")[:500],
-        )
-        return None
-
-    try:
-        data = r.json()
-    except Exception:
-        logger.exception(
-            "start._platega_get_status: invalid json tx_id=%s body=%s",
-            tx_id,
-            (r.text or "")[:500],
-        )
-        return None
-
-    status = data.get("status")
-    if not status and isinstance(data.get("transaction"), dict):
-        status = data["transaction"].get("status")
-    if not status and isinstance(data.get("data"), dict):
-        data_obj = data["data"]
-        status = data_obj.get("status")
-        if not status and isinstance(data_obj.get("transaction"), dict):
-            status = data_obj["transaction"].get("status")
-
-    raw_status = str(status) if status else None
     normalized = normalize_payment_status(raw_status)
     logger.info(
         "start._platega_get_status: tx_id=%s raw_status=%s normalized=%s",
@@ -136,7 +98,7 @@ async def cmd_start(message: Message, state: FSMContext, session: AsyncSession)
             session, new_user=user, referrer_tg_id=ref_tg_id
         )
     if created:
-        await schedule_free_bonus_reminder(message.bot, message.from_user.id, delay_s=600)
+        await schedule_free_bonus_reminder(message.from_user.id, delay_s=600)
 
     # --- если вернулись из оплаты: проверяем PENDING и пытаемся подтвердить ---
     if start_payload in {"pay_ok", "pay_fail"}:
@@ -163,21 +125,12 @@ async def cmd_start(message: Message, state: FSMContext, session: AsyncSession)
         status = await _platega_get_status(pending.platega_transaction_id)
 
         if status == "CONFIRMED":
-            plan = await get_plan(session, pending.plan_name)
-            if not plan:
-                logger.error(
-                    "start.cmd_start: plan not found in DB plan_name=%s payment_id=%s",
-                    pending.plan_name,
-                    pending.id,
-                )
-            else:
-                # apply_plan_to_user уже с логированием и реальным начислением
-                await apply_plan_to_user(session, message.from_user.id, plan)
-
-            await mark_payment_status(session, pending, PaymentStatus.CONFIRMED)
-
+            # None — параллельно подтвердил poller, пакет уже начислен
+            applied = await confirm_payment(session, pending, message.from_user.id)
             await message.answer(
-                "✅ Оплата подтверждена! Пакет активирован 🎉",
+                "✅ Оплата подтверждена! Пакет активирован 🎉"
+                if applied is not False
+                else "✅ Оплата получена, но пакет не активировался автоматически. Напиши в поддержку — разберёмся 💬",
                 reply_markup=main_menu_kb(),
             )
             return
@@ -8,6 +8,7 @@ class AdminCallbacks:
     STATS = "admin:stats"
     USERS = "admin:users"
     USERS_PAGE = "admin:users:page"
+    USERS_SEARCH = "admin:users:search"
     ACCESS = "admin:access"
     BROADCAST = "admin:broadcast"
 
@@ -17,13 +18,17 @@ class AdminCallbacks:
     PROMO = "admin:promo"
     CREATE_PROMO = "admin:promo:create"
     LIST_PROMO = "admin:promo:list"
+    BULK_PROMO = "admin:promo:bulk"
     PROMO_TYPE = "admin:promo:type"
 
     BACK = "admin:back"
 
     @staticmethod
-    def users_page(page: int) -> str:
-        return f"{AdminCallbacks.USERS_PAGE}:{page}"
+    def users_page(page: int, direction: str, cursor_id: int) -> str:
+        """
+        direction: "next" (id < cursor_id) / "prev" (id > cursor_id)
+        """
+        return f"{AdminCallbacks.USERS_PAGE}:{direction}:{cursor_id}:{page}"
 
     @staticmethod
     def promo_type(kind: str) -> str:
@@ -57,6 +62,7 @@ def admin_menu_kb() -> InlineKeyboardMarkup:
 def admin_promo_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="➕ Создать промокод", callback_data=AdminCallbacks.CREATE_PROMO)
+    kb.button(text="🧬 Сгенерировать пачку (CSV)", callback_data=AdminCallbacks.BULK_PROMO)
     kb.button(text="📋 Просмотреть промокоды", callback_data=AdminCallbacks.LIST_PROMO)
     kb.button(text="⬅️ Назад", callback_data=AdminCallbacks.BACK)
     kb.adjust(1)
@@ -91,16 +97,28 @@ def admin_access_kb() -> InlineKeyboardMarkup:
 
 
 def admin_users_nav_kb(
-    *, page: int, has_prev: bool, has_next: bool
+    *,
+    page: int,
+    first_id: int | None,
+    last_id: int | None,
+    has_prev: bool,
+    has_next: bool,
 ) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    if has_prev:
-        kb.button(text="⬅️ Назад", callback_data=AdminCallbacks.users_page(page - 1))
-    if has_next:
-        kb.button(text="➡️ Вперёд", callback_data=AdminCallbacks.users_page(page + 1))
+    if has_prev and first_id is not None:
+        kb.button(
+            text="⬅️ Назад",
+            callback_data=AdminCallbacks.users_page(page - 1, "prev", first_id),
+        )
+    if has_next and last_id is not None:
+        kb.button(
+            text="➡️ Вперёд",
+            callback_data=AdminCallbacks.users_page(page + 1, "next", last_id),
+        )
+    kb.button(text="🔎 Поиск", callback_data=AdminCallbacks.USERS_SEARCH)
     kb.button(text="⬅️ В админку", callback_data=AdminCallbacks.BACK)
     if has_prev and has_next:
-        kb.adjust(2, 1)
+        kb.adjust(2, 1, 1)
     else:
         kb.adjust(1)
     return kb.as_markup()
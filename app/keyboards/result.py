@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+
+class ResultCallbacks:
+    # + первые 32 hex sha256 оригинала в хранилище генераций
+    ORIGINAL_PREFIX = "orig:"
+
+
+def original_kb(token: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📎 Оригинал", callback_data=f"{ResultCallbacks.ORIGINAL_PREFIX}{token}")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def originals_kb(items: list[tuple[int, str]]) -> InlineKeyboardMarkup:
+    """
+    Под альбомом: (номер картинки, токен) -> «📎 1», «📎 2» …
+    """
+    kb = InlineKeyboardBuilder()
+    for n, token in items:
+        kb.button(text=f"📎 {n}", callback_data=f"{ResultCallbacks.ORIGINAL_PREFIX}{token}")
+    kb.adjust(5)
+    return kb.as_markup()
@@ -1,4 +1,5 @@
 from .db import DbSessionMiddleware
+from .trace import TraceMiddleware
 from .user_log import UserActionLogMiddleware
 
-__all__ = ["DbSessionMiddleware", "UserActionLogMiddleware"]
+__all__ = ["DbSessionMiddleware", "TraceMiddleware", "UserActionLogMiddleware"]
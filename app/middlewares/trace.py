@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.utils.tracing import use_trace
+
+
+class TraceMiddleware(BaseMiddleware):
+    """
+    Свой trace_id на каждый апдейт (contextvar): попадает во все строки лога,
+    в фоновые задачи, созданные хендлером, и в задачи планировщика.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_id = None
+        kind = "update"
+        if isinstance(event, Update):
+            kind = event.event_type
+            user = getattr(event.event, "from_user", None)
+            tg_id = user.id if user else None
+
+        with use_trace(tg_id=tg_id, kind=kind):
+            return await handler(event, data)
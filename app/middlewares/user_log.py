@@ -4,7 +4,9 @@ import logging
 from typing import Any, Awaitable, Callable, Dict, Optional
 
 from aiogram import BaseMiddleware
-from aiogram.types import CallbackQuery, Message, TelegramObject
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from app.utils.log_pipeline import kv
 
 log = logging.getLogger("user_actions")
 
@@ -23,14 +25,18 @@ class UserActionLogMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        try:
-            self._log_event(event)
-        except Exception:
-            log.exception("Failed to log user action")
+        if log.isEnabledFor(logging.INFO):
+            try:
+                self._log_event(event)
+            except Exception:
+                log.exception("Failed to log user action")
 
         return await handler(event, data)
 
     def _log_event(self, event: TelegramObject) -> None:
+        # middleware висит на dp.update — сначала достаём само событие
+        if isinstance(event, Update):
+            event = event.message or event.callback_query or event
         if isinstance(event, Message):
             self._log_message(event)
             return
@@ -46,13 +52,16 @@ class UserActionLogMiddleware(BaseMiddleware):
         has_photo = bool(message.photo)
         text = message.text or message.caption or ""
 
+        # строка собирается в потоке логгера (app/utils/log_pipeline.py)
         log.info(
-            "MSG | tg_id=%s | username=%s | chat_id=%s | has_photo=%s | text=%s",
-            user.id,
-            user.username,
-            message.chat.id if message.chat else None,
-            has_photo,
-            _short(text),
+            "MSG",
+            extra=kv(
+                tg_id=user.id,
+                username=user.username,
+                chat_id=message.chat.id if message.chat else None,
+                has_photo=has_photo,
+                text=_short(text),
+            ),
         )
 
     def _log_callback(self, call: CallbackQuery) -> None:
@@ -61,9 +70,11 @@ class UserActionLogMiddleware(BaseMiddleware):
         msg_id: Optional[int] = call.message.message_id if call.message else None
 
         log.info(
-            "CBQ | tg_id=%s | username=%s | msg_id=%s | data=%s",
-            user.id,
-            user.username,
-            msg_id,
-            _short(data, 200),
+            "CBQ",
+            extra=kv(
+                tg_id=user.id,
+                username=user.username,
+                msg_id=msg_id,
+                data=_short(data, 200),
+            ),
         )
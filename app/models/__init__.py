@@ -7,6 +7,8 @@ from .referral import Referral
 from .promo_code import PromoCode
 from .promo_redemption import PromoRedemption
 from .admin_action_log import AdminActionLog
+from .stats import StatsCounter, StatsDaily
+from .scheduled_job import ScheduledJob
 
 __all__ = [
     "Base",
@@ -18,4 +20,7 @@ __all__ = [
     "PromoCode",
     "PromoRedemption",
     "AdminActionLog",
+    "StatsCounter",
+    "StatsDaily",
+    "ScheduledJob",
 ]
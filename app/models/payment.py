@@ -4,7 +4,7 @@ from __future__ import annotations
 import enum
 from datetime import datetime, timezone
 
-from sqlalchemy import BigInteger, DateTime, Enum, Integer, String
+from sqlalchemy import BigInteger, DateTime, Enum, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
@@ -15,10 +15,16 @@ class PaymentStatus(str, enum.Enum):
     CONFIRMED = "CONFIRMED"
     CANCELED = "CANCELED"
     CHARGEBACK = "CHARGEBACK"
+    # брошенный PENDING: так и не подтвердился за PAYMENTS_EXPIRE_AFTER_HOURS
+    EXPIRED = "EXPIRED"
 
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # poller: WHERE status='PENDING' AND next_check_at<=now ORDER BY next_check_at
+        Index("ix_payments_status_next_check", "status", "next_check_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 
@@ -49,3 +55,11 @@ class Payment(Base):
     confirmed_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
+
+    # расписание polling'а: NULL = проверить как можно скорее
+    next_check_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    check_attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class ScheduledJob(Base):
+    """
+    Отложенная/периодическая задача планировщика (app/services/scheduler.py).
+    - одноразовая: interval_sec и cron пустые, после успеха строка удаляется
+    - периодическая: interval_sec или cron, после запуска run_at сдвигается
+    """
+
+    __tablename__ = "scheduled_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    # ключ дедупликации: одна задача на key (например "bonus_grant:<tg_id>")
+    key: Mapped[str | None] = mapped_column(String(128), nullable=True, unique=True)
+    payload: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON
+
+    run_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+    interval_sec: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    cron: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    # lease: пока locked_until в будущем, задачу выполняет кто-то другой;
+    # упал процесс — lease истечёт и задача выполнится снова (at-least-once)
+    locked_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, Date, DateTime, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class StatsCounter(Base):
+    """
+    Итоговые счётчики для админ-статистики (users_total, photos_generated, ...).
+    Обновляются инкрементально в тех же транзакциях, что и сами события.
+    """
+
+    __tablename__ = "stats_counters"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+
+class StatsDaily(Base):
+    """
+    Дневные роллапы: (день по UTC+3, метрика, сценарий/план) -> значение.
+    scenario = "" — без разбивки.
+    """
+
+    __tablename__ = "stats_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(32), primary_key=True)
+    scenario: Mapped[str] = mapped_column(
+        String(32), primary_key=True, default="", server_default=""
+    )
+    value: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
@@ -3,7 +3,16 @@ from __future__ import annotations
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.base import Base
@@ -66,3 +75,7 @@ class User(Base):
         back_populates="user",
         cascade="all, delete-orphan",
     )
+
+
+# поиск в админке: lower(username) = :q / диапазон [q, q+"\uffff") для префикса
+Index("ix_users_username_lower", func.lower(User.username))
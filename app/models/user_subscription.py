@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, SmallInteger, func
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, SmallInteger, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.base import Base
@@ -10,6 +10,10 @@ from app.models.base import Base
 
 class UserSubscription(Base):
     __tablename__ = "user_subscription"
+    __table_args__ = (
+        # expirer: WHERE status=1 AND expires_at<=now ORDER BY id
+        Index("ix_user_subscription_status_expires", "status", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
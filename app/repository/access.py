@@ -8,9 +8,10 @@ from sqlalchemy import delete, select, update, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.admin import Admin
-from app.models.subscription import Subscription
 from app.models.user import User
 from app.models.user_subscription import UserSubscription
+from app.repository import stats
+from app.repository.plans import get_plan_by_id, get_plans
 
 logger = logging.getLogger(__name__)
 
@@ -63,26 +64,25 @@ async def _get_active_user_subscription(
 
 async def give_subscription_plan(
     session: AsyncSession, user: User, subscription_id: int
-) -> None:
+) -> bool:
     """
     ✅ Выдать конкретную подписку (без выдачи по дням):
-    - находим Subscription по subscription_id
+    - находим план по subscription_id (каталог планов в памяти)
     - деактивируем текущую активную подписку пользователя (status=0)
     - создаём новую активную подписку (status=1)
     - выставляем remaining_video/remaining_photo по лимитам плана
     - expires_at: now + duration_days (если duration_days==0 -> far future)
 
     ⚠️ ВАЖНО: НИКАКИХ used_photos/used_videos — их нет в твоей модели.
+    False — плана нет, ничего не выдано и не закоммичено.
     """
-    subscription = await session.scalar(
-        select(Subscription).where(Subscription.id == subscription_id)
-    )
+    subscription = await get_plan_by_id(session, subscription_id)
     if subscription is None:
         logger.warning(
             "give_subscription_plan: subscription not found subscription_id=%s",
             subscription_id,
         )
-        return
+        return False
 
     now = datetime.now(timezone.utc)
 
@@ -111,6 +111,9 @@ async def give_subscription_plan(
         status=1,
     )
     session.add(new_sub)
+    if not active_before:
+        await stats.bump_counter(session, stats.ACTIVE_SUBS)
+    await stats.bump_daily(session, stats.SUBS_ACTIVATED, scenario=subscription.name)
     await session.commit()
     await session.refresh(new_sub)
 
@@ -123,6 +126,7 @@ async def give_subscription_plan(
         new_sub.id,
         new_sub.expires_at,
     )
+    return True
 
 
 # ---- BACKWARD COMPAT (если где-то ещё вызывается give_subscription) ----
@@ -135,9 +139,8 @@ async def give_subscription(
     - дальше вызываем give_subscription_plan
     """
     if subscription_id is None:
-        subscription = await session.scalar(
-            select(Subscription).order_by(Subscription.id.asc()).limit(1)
-        )
+        plans = await get_plans(session)
+        subscription = plans[0] if plans else None
         if subscription is None:
             logger.warning("give_subscription: no subscriptions found")
             return
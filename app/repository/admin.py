@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.admin import Admin
 from app.models.user import User
-from app.models.user_subscription import UserSubscription
+from app.repository import stats
 
 
 async def is_admin(session: AsyncSession, tg_id: int) -> bool:
@@ -19,22 +19,15 @@ async def is_admin(session: AsyncSession, tg_id: int) -> bool:
 
 
 async def get_users_stats(session: AsyncSession) -> tuple[int, int, int, int]:
-    total_users = await session.scalar(select(func.count(User.id)))
-
-    active_subs = await session.scalar(
-        select(func.count(func.distinct(UserSubscription.user_id))).where(
-            UserSubscription.status == 1
-        )
-    )
-
-    total_photos = await session.scalar(select(func.sum(User.generated_photos)))
-    total_videos = await session.scalar(select(func.sum(User.generated_videos)))
-
+    """
+    Читаем готовые счётчики (stats_counters) — без full-scan агрегатов.
+    """
+    counters = await stats.get_counters(session)
     return (
-        int(total_users or 0),
-        int(active_subs or 0),
-        int(total_photos or 0),
-        int(total_videos or 0),
+        counters.get(stats.USERS_TOTAL, 0),
+        counters.get(stats.ACTIVE_SUBS, 0),
+        counters.get(stats.PHOTOS_GENERATED, 0),
+        counters.get(stats.VIDEOS_GENERATED, 0),
     )
 
 
@@ -45,23 +38,97 @@ async def get_all_user_tg_ids(session: AsyncSession) -> list[int]:
     return [int(tg_id) for tg_id in res.scalars().all() if tg_id]
 
 
-async def get_users_page(
+UserRow = tuple[int, int, str | None, object, int, int]
+
+_USER_ROW_COLUMNS = (
+    User.id,
+    User.tg_id,
+    User.username,
+    User.created_at,
+    User.generated_photos,
+    User.generated_videos,
+)
+
+
+async def get_users_total(session: AsyncSession) -> int:
+    """
+    Кол-во пользователей из счётчика stats_counters (без COUNT(*)).
+    """
+    return await stats.get_counter(session, stats.USERS_TOTAL)
+
+
+async def get_users_keyset(
     session: AsyncSession,
+    *,
     limit: int,
-    offset: int,
-) -> tuple[list[tuple[int, int, str | None, object, int, int]], int]:
-    total_users = await session.scalar(select(func.count(User.id)))
-    result = await session.execute(
-        select(
-            User.id,
-            User.tg_id,
-            User.username,
-            User.created_at,
-            User.generated_photos,
-            User.generated_videos,
+    before_id: int | None = None,
+    after_id: int | None = None,
+) -> tuple[list[UserRow], bool]:
+    """
+    Keyset-пагинация по users.id (новые сверху), без OFFSET:
+    - before_id: следующая страница — id < before_id
+    - after_id: предыдущая страница — id > after_id
+    - ни того, ни другого: первая страница
+    Возвращает (строки по убыванию id, есть ли ещё строки в этом направлении).
+    """
+    stmt = select(*_USER_ROW_COLUMNS)
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id).order_by(User.id.asc())
+    else:
+        if before_id is not None:
+            stmt = stmt.where(User.id < before_id)
+        stmt = stmt.order_by(User.id.desc())
+
+    rows = list((await session.execute(stmt.limit(limit + 1))).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+async def search_users(
+    session: AsyncSession, query: str, *, limit: int = 20
+) -> list[UserRow]:
+    """
+    Поиск для админки (всё по индексам):
+    - число -> tg_id (unique index) или users.id
+    - иначе username: сначала точное совпадение, затем префикс
+      (lower(username) в диапазоне [q, q + '\uffff') — range scan по ix_users_username_lower)
+    """
+    q = (query or "").strip()
+    if not q:
+        return []
+
+    if q.lstrip("-").isdigit():
+        num = int(q)
+        res = await session.execute(
+            select(*_USER_ROW_COLUMNS)
+            .where((User.tg_id == num) | (User.id == num))
+            .order_by(User.id.desc())
+            .limit(limit)
         )
-        .order_by(User.id.desc())
+        return list(res.all())
+
+    name = q.lstrip("@").lower()
+    if not name:
+        return []
+
+    uname = func.lower(User.username)
+    exact = list(
+        (
+            await session.execute(
+                select(*_USER_ROW_COLUMNS).where(uname == name).limit(limit)
+            )
+        ).all()
+    )
+    if exact:
+        return exact
+
+    res = await session.execute(
+        select(*_USER_ROW_COLUMNS)
+        .where(uname >= name, uname < name + "\uffff")
+        .order_by(uname.asc())
         .limit(limit)
-        .offset(offset)
     )
-    return result.all(), int(total_users or 0)
+    return list(res.all())
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.admin_action_log import AdminActionLog
@@ -13,25 +13,39 @@ def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
-async def log_admin_action(
+async def insert_admin_actions_batch(
     session: AsyncSession,
-    *,
-    tg_id: int,
-    action: str,
-    data: str | None = None,
-) -> None:
-    user_id = await session.scalar(select(User.id).where(User.tg_id == tg_id))
-    if not user_id:
-        return
-    session.add(
-        AdminActionLog(
-            user_id=int(user_id),
-            tg_id=tg_id,
-            action=action,
-            data=(data or "")[:1024] if data else None,
-        )
+    entries: list[tuple[int, str, str | None, datetime]],
+) -> int:
+    """
+    Пачка (tg_id, action, data, created_at) одним executemany-INSERT:
+    - user_id для всех tg_id — одним SELECT ... IN
+    - записи без пользователя пропускаем
+    Без commit. Возвращает кол-во вставленных строк.
+    """
+    if not entries:
+        return 0
+
+    tg_ids = {tg_id for tg_id, _, _, _ in entries}
+    res = await session.execute(
+        select(User.tg_id, User.id).where(User.tg_id.in_(tg_ids))
     )
-    await session.commit()
+    user_ids = {int(tg_id): int(uid) for tg_id, uid in res.all()}
+
+    rows = [
+        {
+            "user_id": user_ids[tg_id],
+            "tg_id": tg_id,
+            "action": action,
+            "data": (data or "")[:1024] if data else None,
+            "created_at": created_at,
+        }
+        for tg_id, action, data, created_at in entries
+        if tg_id in user_ids
+    ]
+    if rows:
+        await session.execute(insert(AdminActionLog), rows)
+    return len(rows)
 
 
 async def cleanup_admin_actions(session: AsyncSession, *, days: int = 30) -> int:
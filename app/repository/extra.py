@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.subscription import Subscription
 from app.models.user import User
 from app.models.user_subscription import UserSubscription
+from app.repository.plans import PlanInfo, get_plan_by_name, get_plans
 
 
 async def get_user(session: AsyncSession, tg_id: int) -> User | None:
@@ -46,12 +47,10 @@ async def get_active_remaining(session: AsyncSession, user_id: int) -> tuple[int
     return int(row[0]), int(row[1])
 
 
-async def get_plan(session: AsyncSession, plan_name: str) -> Subscription | None:
-    return await session.scalar(
-        select(Subscription).where(Subscription.name == plan_name)
-    )
+async def get_plan(session: AsyncSession, plan_name: str) -> PlanInfo | None:
+    # из каталога планов в памяти (app/repository/plans.py), без SELECT
+    return await get_plan_by_name(session, plan_name)
 
 
-async def get_all_plans(session: AsyncSession) -> list[Subscription]:
-    res = await session.execute(select(Subscription).order_by(Subscription.id.asc()))
-    return list(res.scalars().all())
+async def get_all_plans(session: AsyncSession) -> list[PlanInfo]:
+    return list(await get_plans(session))
@@ -1,14 +1,20 @@
 # app/repository/generations.py
 from __future__ import annotations
 
+import logging
 from datetime import datetime, timedelta, timezone
 
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.subscription import Subscription
 from app.models.user import User
 from app.models.user_subscription import UserSubscription
+from app.repository import stats
+from app.repository.plans import BASE_PLAN, LAUNCH_PLAN, get_plan_or_first
+from app.utils.log_pipeline import DEBUG_QUERIES, kv
+from app.utils.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 
 class NoGenerationsLeft(Exception):
@@ -46,32 +52,17 @@ async def _has_any_subscription(session: AsyncSession, user_id: int) -> bool:
 async def ensure_default_subscription(session: AsyncSession, tg_id: int) -> None:
     user_id = await _get_user_db_id(session, tg_id)
 
-    print(f"[DEBUG ensure_default_subscription] tg_id={tg_id} -> user_id={user_id}")
-
     if not user_id:
-        print(f"[DEBUG ensure_default_subscription] FAIL: no user for tg_id={tg_id}")
+        logger.debug("generations.ensure_default_subscription: no user tg_id=%s", tg_id)
         return
 
     active_id = await _get_active_us_id(session, user_id)
-    print(
-        f"[DEBUG ensure_default_subscription] user_id={user_id} active_us_id={active_id}"
-    )
     if active_id:
         return
 
     has_any = await _has_any_subscription(session, user_id)
-    target_name = "Launch" if not has_any else "Base"
-    sub = await session.scalar(
-        select(Subscription).where(Subscription.name == target_name).limit(1)
-    )
-    if not sub:
-        sub = await session.scalar(
-            select(Subscription).order_by(Subscription.id.asc()).limit(1)
-        )
-    print(
-        f"[DEBUG ensure_default_subscription] picked sub="
-        f"{getattr(sub, 'id', None)} {getattr(sub, 'name', None)}"
-    )
+    target_name = LAUNCH_PLAN if not has_any else BASE_PLAN
+    sub = await get_plan_or_first(session, target_name)
     if not sub:
         return
 
@@ -93,40 +84,29 @@ async def ensure_default_subscription(session: AsyncSession, tg_id: int) -> None
             status=1,
         )
     )
+    await stats.bump_counter(session, stats.ACTIVE_SUBS)
+    await stats.bump_daily(session, stats.SUBS_ACTIVATED, scenario=sub.name)
     await session.commit()
 
-    print(
-        "[DEBUG ensure_default_subscription] CREATED default sub "
-        f"user_id={user_id} sub_id={sub.id} expires_at={expires.isoformat()} "
-        f"photo={int(sub.photo_generations)} video={int(sub.video_generations)}"
+    logger.info(
+        "generations.ensure_default_subscription: created",
+        extra=kv(user_id=user_id, plan=sub.name, expires_at=expires.isoformat()),
     )
 
 
+@traced("charge_photo")
 async def charge_photo_generation(session: AsyncSession, tg_id: int) -> None:
     now = _utcnow()
     user_id = await _get_user_db_id(session, tg_id)
-    print(
-        f"[DEBUG charge_photo] tg_id={tg_id} -> user_id={user_id} now_utc={now.isoformat()}"
-    )
-
     if not user_id:
-        print("[DEBUG charge_photo] FAIL: user not found")
+        logger.debug("generations.charge_photo: no user tg_id=%s", tg_id)
         raise NoGenerationsLeft()
 
     us_id = await _get_active_us_id(session, user_id)
-    print(f"[DEBUG charge_photo] active_us_id={us_id}")
-
     if not us_id:
-        print("[DEBUG charge_photo] FAIL: no active subscription")
+        logger.debug("generations.charge_photo: no active subscription tg_id=%s", tg_id)
         raise NoGenerationsLeft()
 
-    before = await session.scalar(
-        select(UserSubscription.remaining_photo, UserSubscription.expires_at).where(
-            UserSubscription.id == us_id
-        )
-    )
-    print(f"[DEBUG charge_photo] before (remaining_photo, expires_at) = {before}")
-
     new_left = await session.scalar(
         update(UserSubscription)
         .where(
@@ -138,33 +118,38 @@ async def charge_photo_generation(session: AsyncSession, tg_id: int) -> None:
         .values(remaining_photo=UserSubscription.remaining_photo - 1)
         .returning(UserSubscription.remaining_photo)
     )
-    print(f"[DEBUG charge_photo] update returning new_left={new_left}")
-
     if new_left is None:
-        cur = await session.scalar(
-            select(
-                UserSubscription.remaining_photo,
-                UserSubscription.remaining_video,
-                UserSubscription.expires_at,
-                UserSubscription.status,
-            ).where(UserSubscription.id == us_id)
-        )
-        print(f"[DEBUG charge_photo] FAIL cur row={cur}")
+        if DEBUG_QUERIES:
+            cur = (
+                await session.execute(
+                    select(
+                        UserSubscription.remaining_photo,
+                        UserSubscription.remaining_video,
+                        UserSubscription.expires_at,
+                        UserSubscription.status,
+                    ).where(UserSubscription.id == us_id)
+                )
+            ).first()
+            logger.info(
+                "generations.charge_photo: nothing left",
+                extra=kv(tg_id=tg_id, us_id=us_id, row=cur),
+            )
         raise NoGenerationsLeft()
 
+    await stats.bump_daily(session, stats.PHOTO_CHARGED)
     await session.commit()
-    print(f"[DEBUG charge_photo] COMMIT OK new_left={new_left}")
+    logger.debug(
+        "generations.charge_photo: ok", extra=kv(tg_id=tg_id, left=new_left)
+    )
 
 
+@traced("refund_photo")
 async def refund_photo_generation(session: AsyncSession, tg_id: int) -> None:
     user_id = await _get_user_db_id(session, tg_id)
-    print(f"[DEBUG refund_photo] tg_id={tg_id} -> user_id={user_id}")
-
     if not user_id:
         return
 
     us_id = await _get_active_us_id(session, user_id)
-    print(f"[DEBUG refund_photo] active_us_id={us_id}")
     if not us_id:
         return
 
@@ -173,35 +158,24 @@ async def refund_photo_generation(session: AsyncSession, tg_id: int) -> None:
         .where(UserSubscription.id == us_id, UserSubscription.status == 1)
         .values(remaining_photo=UserSubscription.remaining_photo + 1)
     )
+    await stats.bump_daily(session, stats.PHOTO_REFUNDED)
     await session.commit()
-    print("[DEBUG refund_photo] COMMIT OK +1")
+    logger.debug("generations.refund_photo: ok", extra=kv(tg_id=tg_id, us_id=us_id))
 
 
+@traced("charge_video")
 async def charge_video_generation(session: AsyncSession, tg_id: int) -> None:
     now = _utcnow()
     user_id = await _get_user_db_id(session, tg_id)
-    print(
-        f"[DEBUG charge_video] tg_id={tg_id} -> user_id={user_id} now_utc={now.isoformat()}"
-    )
-
     if not user_id:
-        print("[DEBUG charge_video] FAIL: user not found")
+        logger.debug("generations.charge_video: no user tg_id=%s", tg_id)
         raise NoGenerationsLeft()
 
     us_id = await _get_active_us_id(session, user_id)
-    print(f"[DEBUG charge_video] active_us_id={us_id}")
-
     if not us_id:
-        print("[DEBUG charge_video] FAIL: no active subscription")
+        logger.debug("generations.charge_video: no active subscription tg_id=%s", tg_id)
         raise NoGenerationsLeft()
 
-    before = await session.scalar(
-        select(UserSubscription.remaining_video, UserSubscription.expires_at).where(
-            UserSubscription.id == us_id
-        )
-    )
-    print(f"[DEBUG charge_video] before (remaining_video, expires_at) = {before}")
-
     new_left = await session.scalar(
         update(UserSubscription)
         .where(
@@ -213,33 +187,38 @@ async def charge_video_generation(session: AsyncSession, tg_id: int) -> None:
         .values(remaining_video=UserSubscription.remaining_video - 1)
         .returning(UserSubscription.remaining_video)
     )
-    print(f"[DEBUG charge_video] update returning new_left={new_left}")
-
     if new_left is None:
-        cur = await session.scalar(
-            select(
-                UserSubscription.remaining_photo,
-                UserSubscription.remaining_video,
-                UserSubscription.expires_at,
-                UserSubscription.status,
-            ).where(UserSubscription.id == us_id)
-        )
-        print(f"[DEBUG charge_video] FAIL cur row={cur}")
+        if DEBUG_QUERIES:
+            cur = (
+                await session.execute(
+                    select(
+                        UserSubscription.remaining_photo,
+                        UserSubscription.remaining_video,
+                        UserSubscription.expires_at,
+                        UserSubscription.status,
+                    ).where(UserSubscription.id == us_id)
+                )
+            ).first()
+            logger.info(
+                "generations.charge_video: nothing left",
+                extra=kv(tg_id=tg_id, us_id=us_id, row=cur),
+            )
         raise NoGenerationsLeft()
 
+    await stats.bump_daily(session, stats.VIDEO_CHARGED)
     await session.commit()
-    print(f"[DEBUG charge_video] COMMIT OK new_left={new_left}")
+    logger.debug(
+        "generations.charge_video: ok", extra=kv(tg_id=tg_id, left=new_left)
+    )
 
 
+@traced("refund_video")
 async def refund_video_generation(session: AsyncSession, tg_id: int) -> None:
     user_id = await _get_user_db_id(session, tg_id)
-    print(f"[DEBUG refund_video] tg_id={tg_id} -> user_id={user_id}")
-
     if not user_id:
         return
 
     us_id = await _get_active_us_id(session, user_id)
-    print(f"[DEBUG refund_video] active_us_id={us_id}")
     if not us_id:
         return
 
@@ -248,8 +227,9 @@ async def refund_video_generation(session: AsyncSession, tg_id: int) -> None:
         .where(UserSubscription.id == us_id, UserSubscription.status == 1)
         .values(remaining_video=UserSubscription.remaining_video + 1)
     )
+    await stats.bump_daily(session, stats.VIDEO_REFUNDED)
     await session.commit()
-    print("[DEBUG refund_video] COMMIT OK +1")
+    logger.debug("generations.refund_video: ok", extra=kv(tg_id=tg_id, us_id=us_id))
 
 
 async def grant_photo_generation(session: AsyncSession, tg_id: int, delta: int = 1) -> None:
@@ -4,14 +4,16 @@ from __future__ import annotations
 import logging
 from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.writer import submit_write
 from app.models.payment import Payment, PaymentStatus
-from app.models.subscription import Subscription
+from app.repository.plans import PlanInfo
 from app.models.user_subscription import UserSubscription
-from app.repository.extra import get_user  # tg_id -> users row
+from app.repository.extra import get_plan, get_user  # tg_id -> users row
 from app.repository.access import give_subscription_plan
+from app.repository import stats
 
 logger = logging.getLogger(__name__)
 
@@ -76,20 +78,93 @@ async def get_latest_pending_payment(
 
 
 async def get_pending_payments_batch(
-    session: AsyncSession, limit: int = 50
+    session: AsyncSession, limit: int = 50, *, now: datetime | None = None
 ) -> list[Payment]:
     """
-    Для фонового polling: взять пачку PENDING платежей.
+    Для фонового polling: взять пачку PENDING платежей, которым пора на проверку.
+    Сначала ещё ни разу не проверенные (next_check_at IS NULL), потом самые
+    «просроченные» по расписанию — так старые брошенные платежи не вытесняют
+    свежие, и наоборот.
     """
+    now = now or datetime.now(timezone.utc)
     q = await session.execute(
         select(Payment)
         .where(Payment.status == PaymentStatus.PENDING)
-        .order_by(desc(Payment.id))
+        .where((Payment.next_check_at.is_(None)) | (Payment.next_check_at <= now))
+        .order_by(Payment.next_check_at.asc().nulls_first(), Payment.id.asc())
         .limit(limit)
     )
     return list(q.scalars().all())
 
 
+def next_payment_check_delay(created_at: datetime, now: datetime) -> timedelta:
+    """
+    Backoff по возрасту платежа: свежие проверяем часто (пользователь как раз
+    платит), старые — всё реже.
+    """
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    age = now - created_at
+
+    if age < timedelta(minutes=10):
+        return timedelta(seconds=15)
+    if age < timedelta(hours=1):
+        return timedelta(minutes=1)
+    if age < timedelta(hours=6):
+        return timedelta(minutes=5)
+    return timedelta(minutes=15)
+
+
+async def schedule_next_payment_check(
+    session: AsyncSession, payment: Payment, *, now: datetime | None = None
+) -> None:
+    """
+    Платёж всё ещё PENDING — откладываем следующую проверку по backoff.
+    """
+    now = now or datetime.now(timezone.utc)
+    next_at = now + next_payment_check_delay(payment.created_at, now)
+    payment_id = payment.id
+
+    async def op(s: AsyncSession) -> None:
+        await s.execute(
+            update(Payment)
+            .where(Payment.id == payment_id)
+            .where(Payment.status == PaymentStatus.PENDING)
+            .values(
+                next_check_at=next_at,
+                check_attempts=Payment.check_attempts + 1,
+            )
+        )
+
+    await submit_write(op, session=session, label="payments.next_check")
+
+
+async def expire_stale_pending_payments(
+    session: AsyncSession, *, older_than: timedelta
+) -> int:
+    """
+    Брошенные платежи (PENDING дольше older_than) -> EXPIRED одним UPDATE.
+    """
+    cutoff = datetime.now(timezone.utc) - older_than
+    res = await session.execute(
+        update(Payment)
+        .where(Payment.status == PaymentStatus.PENDING)
+        .where(Payment.created_at < cutoff)
+        .values(status=PaymentStatus.EXPIRED)
+        .returning(Payment.id)
+    )
+    expired = len(res.scalars().all())
+    await session.commit()
+
+    if expired:
+        logger.info(
+            "payments.expire_stale_pending_payments: expired=%s cutoff=%s",
+            expired,
+            cutoff.isoformat(),
+        )
+    return expired
+
+
 async def get_payment_by_id(session: AsyncSession, payment_id: int) -> Payment | None:
     q = await session.execute(select(Payment).where(Payment.id == payment_id))
     return q.scalar_one_or_none()
@@ -106,6 +181,9 @@ async def mark_payment_status(
         status,
     )
 
+    if status == PaymentStatus.CONFIRMED and payment.status != PaymentStatus.CONFIRMED:
+        await _bump_confirmed_payment_stats(session, payment)
+
     payment.status = status
     if status == PaymentStatus.CONFIRMED:
         payment.confirmed_at = datetime.now(timezone.utc)
@@ -120,6 +198,48 @@ async def mark_payment_status(
     )
 
 
+async def _bump_confirmed_payment_stats(session: AsyncSession, payment: Payment) -> None:
+    await stats.bump(session, stats.PAYMENTS_CONFIRMED, scenario=payment.plan_name)
+    await stats.bump(
+        session, stats.REVENUE_RUB, int(payment.amount or 0), scenario=payment.plan_name
+    )
+
+
+async def claim_payment_status(
+    session: AsyncSession, payment: Payment, status: PaymentStatus
+) -> bool:
+    """
+    Атомарный переход PENDING/EXPIRED -> status (без commit).
+    EXPIRED тоже можно подтвердить: пользователь мог оплатить уже после того,
+    как poller перестал проверять платёж.
+    False — платёж уже обработал кто-то другой (poller / кнопка «Проверить оплату» / /start pay_ok),
+    значит второй раз пакет начислять нельзя.
+    """
+    values: dict = {"status": status}
+    if status == PaymentStatus.CONFIRMED:
+        values["confirmed_at"] = datetime.now(timezone.utc)
+
+    res = await session.execute(
+        update(Payment)
+        .where(Payment.id == payment.id)
+        .where(Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.EXPIRED]))
+        .values(**values)
+        .returning(Payment.id)
+    )
+    claimed = res.scalar_one_or_none() is not None
+    if claimed and status == PaymentStatus.CONFIRMED:
+        await _bump_confirmed_payment_stats(session, payment)
+
+    logger.info(
+        "payments.claim_payment_status: payment_id=%s tx_id=%s new=%s claimed=%s",
+        payment.id,
+        payment.platega_transaction_id,
+        status,
+        claimed,
+    )
+    return claimed
+
+
 async def _get_active_user_subscription(
     session: AsyncSession, user_id: int
 ) -> UserSubscription | None:
@@ -147,13 +267,15 @@ async def _get_active_user_subscription(
 
 
 async def apply_plan_to_user(
-    session: AsyncSession, tg_user_id: int, plan: Subscription
-) -> None:
+    session: AsyncSession, tg_user_id: int, plan: PlanInfo
+) -> bool:
     """
     ✅ FIXED: теперь это "апгрейд тарифа", а не просто донат-пакет:
     - меняем subscription_id активной подписки на выбранный план
     - выставляем remaining_video/photo под лимиты плана (или можно прибавлять — см. ниже)
     - если duration_days > 0 — ставим expires_at от max(now, текущий expires_at)
+    True — начислено (и закоммичено). False — начислять некому/нечего,
+    commit НЕ сделан: остальные изменения сессии фиксирует вызывающий.
     """
     logger.info(
         "payments.apply_plan_to_user: START tg_user_id=%s plan=%s plan_id=%s video=%s photo=%s duration_days=%s",
@@ -172,7 +294,7 @@ async def apply_plan_to_user(
                 "payments.apply_plan_to_user: user NOT FOUND by tg_user_id=%s",
                 tg_user_id,
             )
-            return
+            return False
 
         active = await _get_active_user_subscription(session, user.id)
         if not active:
@@ -181,8 +303,7 @@ async def apply_plan_to_user(
                 user.id,
                 tg_user_id,
             )
-            await give_subscription_plan(session, user, int(plan.id))
-            return
+            return await give_subscription_plan(session, user, int(plan.id))
 
         before_subscription_id = active.subscription_id
         before_video = int(active.remaining_video or 0)
@@ -209,6 +330,7 @@ async def apply_plan_to_user(
             base = expires if expires > now else now
             active.expires_at = base + timedelta(days=int(plan.duration_days))
 
+        await stats.bump_daily(session, stats.SUBS_ACTIVATED, scenario=plan.name)
         await session.commit()
 
         logger.info(
@@ -227,6 +349,7 @@ async def apply_plan_to_user(
             before_expires,
             active.expires_at,
         )
+        return True
 
     except Exception:
         logger.exception(
@@ -235,3 +358,34 @@ async def apply_plan_to_user(
             getattr(plan, "name", None),
         )
         raise
+
+
+async def confirm_payment(
+    session: AsyncSession, payment: Payment, tg_user_id: int
+) -> bool | None:
+    """
+    Подтвердить оплату и начислить пакет (poller / «Проверить оплату» / /start pay_ok).
+    None — платёж уже обработан другим путём (ничего не меняли).
+    True — пакет начислен; False — статус CONFIRMED зафиксирован, но пакет
+    не начислен (нет плана / пользователя) — нужен разбор вручную.
+    Переход статуса коммитится на любом пути: иначе откат вернул бы платёж
+    в PENDING, и его подтверждали бы (и слали «Оплата подтверждена») на каждой проверке.
+    """
+    if not await claim_payment_status(session, payment, PaymentStatus.CONFIRMED):
+        await session.rollback()
+        return None
+
+    applied = False
+    plan = await get_plan(session, payment.plan_name)
+    if plan:
+        applied = await apply_plan_to_user(session, tg_user_id, plan)
+    await session.commit()
+
+    if not applied:
+        logger.error(
+            "payments.confirm_payment: confirmed but plan NOT applied payment_id=%s plan_name=%s tg_user_id=%s",
+            payment.id,
+            payment.plan_name,
+            tg_user_id,
+        )
+    return applied
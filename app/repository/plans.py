@@ -0,0 +1,171 @@
+# app/repository/plans.py
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.subscription import Subscription
+
+logger = logging.getLogger(__name__)
+
+BASE_PLAN = "Base"
+LAUNCH_PLAN = "Launch"
+
+# промах по имени/id (имя приходит из callback data) перечитывает каталог
+# не чаще раза в интервал; мгновенно — /plans_reload
+MISS_RELOAD_INTERVAL_SEC = 60.0
+
+
+@dataclass(frozen=True, slots=True)
+class PlanInfo:
+    """
+    Неизменяемый снимок строки subscription. Поля совпадают с моделью,
+    поэтому PlanInfo можно передавать туда, где раньше был Subscription.
+    """
+
+    id: int
+    name: str
+    duration_days: int
+    video_generations: int
+    photo_generations: int
+    price: Decimal
+
+
+@dataclass(frozen=True, slots=True)
+class PlanCatalog:
+    plans: tuple[PlanInfo, ...] = ()  # по id ASC
+    version: int = 0
+    by_id: Mapping[int, PlanInfo] = field(default_factory=lambda: MappingProxyType({}))
+    by_name: Mapping[str, PlanInfo] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def build(cls, plans: list[PlanInfo], *, version: int) -> "PlanCatalog":
+        ordered = tuple(sorted(plans, key=lambda p: p.id))
+        return cls(
+            plans=ordered,
+            version=version,
+            by_id=MappingProxyType({p.id: p for p in ordered}),
+            by_name=MappingProxyType({p.name: p for p in ordered}),
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self.version > 0
+
+    def first(self) -> PlanInfo | None:
+        return self.plans[0] if self.plans else None
+
+
+# каталог на весь процесс: заменяется целиком, сам объект не мутирует
+_catalog = PlanCatalog()
+_listeners: list[Callable[[PlanCatalog], None]] = []
+_last_miss_reload = 0.0
+
+
+def plan_catalog() -> PlanCatalog:
+    return _catalog
+
+
+def on_plan_catalog_change(callback: Callable[[PlanCatalog], None]) -> None:
+    """
+    Подписка на замену каталога (например, пере-рендер текстов меню).
+    Если каталог уже загружен — callback вызывается сразу.
+    """
+    _listeners.append(callback)
+    if _catalog.loaded:
+        callback(_catalog)
+
+
+def _to_info(sub: Subscription) -> PlanInfo:
+    return PlanInfo(
+        id=int(sub.id),
+        name=str(sub.name),
+        duration_days=int(sub.duration_days or 0),
+        video_generations=int(sub.video_generations or 0),
+        photo_generations=int(sub.photo_generations or 0),
+        price=Decimal(sub.price or 0),
+    )
+
+
+async def reload_plan_catalog(session: AsyncSession) -> PlanCatalog:
+    """
+    Перечитывает subscription и атомарно подменяет каталог.
+    Вызывать после seed_subscriptions и после любых изменений планов.
+    """
+    global _catalog
+    res = await session.execute(select(Subscription).order_by(Subscription.id.asc()))
+    catalog = PlanCatalog.build(
+        [_to_info(s) for s in res.scalars().all()], version=_catalog.version + 1
+    )
+    _catalog = catalog
+
+    for callback in list(_listeners):
+        try:
+            callback(catalog)
+        except Exception:
+            logger.exception("plans.reload_plan_catalog: listener failed")
+
+    logger.info(
+        "plans.reload_plan_catalog: version=%s plans=%s",
+        catalog.version,
+        ",".join(p.name for p in catalog.plans),
+    )
+    return catalog
+
+
+async def _catalog_for(session: AsyncSession) -> PlanCatalog:
+    # скрипты/тесты без main: грузим лениво при первом обращении
+    if not _catalog.loaded:
+        return await reload_plan_catalog(session)
+    return _catalog
+
+
+async def _reload_on_miss(session: AsyncSession) -> PlanCatalog | None:
+    """
+    План могли добавить в БД в обход бота — перечитываем, но не чаще
+    MISS_RELOAD_INTERVAL_SEC: иначе каждый клик с чужим именем плана — SELECT,
+    новая версия каталога и пере-рендер у подписчиков.
+    """
+    global _last_miss_reload
+    now = time.monotonic()
+    if now - _last_miss_reload < MISS_RELOAD_INTERVAL_SEC:
+        return None
+    _last_miss_reload = now  # до await: параллельные промахи не перечитывают повторно
+    return await reload_plan_catalog(session)
+
+
+async def get_plan_by_name(session: AsyncSession, name: str) -> PlanInfo | None:
+    catalog = await _catalog_for(session)
+    plan = catalog.by_name.get(name)
+    if plan is None and (fresh := await _reload_on_miss(session)) is not None:
+        plan = fresh.by_name.get(name)
+    return plan
+
+
+async def get_plan_by_id(session: AsyncSession, plan_id: int) -> PlanInfo | None:
+    catalog = await _catalog_for(session)
+    plan = catalog.by_id.get(int(plan_id))
+    if plan is None and (fresh := await _reload_on_miss(session)) is not None:
+        plan = fresh.by_id.get(int(plan_id))
+    return plan
+
+
+async def get_plans(session: AsyncSession) -> tuple[PlanInfo, ...]:
+    return (await _catalog_for(session)).plans
+
+
+async def get_plan_or_first(session: AsyncSession, name: str) -> PlanInfo | None:
+    """
+    План по имени, а если его нет — самый первый по id (прежний fallback).
+    """
+    plan = await get_plan_by_name(session, name)
+    if plan is None:
+        plan = _catalog.first()
+    return plan
@@ -1,22 +1,29 @@
 from __future__ import annotations
 
-from sqlalchemy import select, update
+import secrets
+from dataclasses import dataclass
+
+from sqlalchemy import Integer, insert, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.promo_code import PromoCode
 from app.models.promo_redemption import PromoRedemption
 from app.models.user import User
-from app.repository.generations import (
-    ensure_default_subscription,
-    grant_photo_generation,
-    grant_video_generation,
-)
+from app.models.user_subscription import UserSubscription
+from app.repository.generations import ensure_default_subscription
 
 
 class PromoError(RuntimeError):
     pass
 
 
+def normalize_promo_code(code: str | None) -> str:
+    # коды храним и ищем в верхнем регистре: пользователи вводят как придётся
+    return (code or "").strip().upper()
+
+
 async def create_promo_code(
     session: AsyncSession,
     *,
@@ -25,7 +32,7 @@ async def create_promo_code(
     bonus_video: int,
     max_uses: int,
 ) -> PromoCode:
-    code = (code or "").strip()
+    code = normalize_promo_code(code)
     if not code:
         raise PromoError("Промокод пустой")
     if max_uses <= 0:
@@ -48,53 +55,163 @@ async def create_promo_code(
     return promo
 
 
+@dataclass(frozen=True)
+class PromoGrant:
+    code: str
+    bonus_photo: int
+    bonus_video: int
+
+
 async def redeem_promo_code(
     session: AsyncSession, *, tg_id: int, code: str
-) -> PromoCode:
-    code = (code or "").strip()
+) -> PromoGrant:
+    """
+    Активация одной транзакцией, без предварительных SELECT'ов:
+    1) UPDATE promo_codes ... WHERE code=:code AND used_count < max_uses RETURNING бонусы
+    2) INSERT INTO promo_redemptions SELECT :promo_id, users.id ... (уникальный
+       (promo_id, user_id) сам ловит повторную активацию)
+    3) UPDATE активной подписки: + бонусы
+    4) один COMMIT
+    Причину отказа выясняем только на редком пути ошибки.
+    """
+    code = normalize_promo_code(code)
     if not code:
         raise PromoError("Промокод пустой")
 
-    promo = await session.scalar(select(PromoCode).where(PromoCode.code == code))
-    if not promo:
-        raise PromoError("Промокод не найден")
+    # почти всегда no-op (у пользователя уже есть активная подписка)
+    await ensure_default_subscription(session, tg_id)
 
-    user = await session.scalar(select(User).where(User.tg_id == tg_id))
-    if not user:
-        raise PromoError("Пользователь не найден")
+    row = (
+        await session.execute(
+            update(PromoCode)
+            .where(PromoCode.code == code, PromoCode.used_count < PromoCode.max_uses)
+            .values(used_count=PromoCode.used_count + 1)
+            .returning(PromoCode.id, PromoCode.bonus_photo, PromoCode.bonus_video)
+        )
+    ).first()
+    if row is None:
+        await session.rollback()
+        promo_id = await session.scalar(select(PromoCode.id).where(PromoCode.code == code))
+        if not promo_id:
+            raise PromoError("Промокод не найден")
+        # повторный ввод своего же (уже исчерпанного) кода — не «лимит»
+        redeemed = await session.scalar(
+            select(PromoRedemption.id)
+            .join(User, User.id == PromoRedemption.user_id)
+            .where(PromoRedemption.promo_id == promo_id, User.tg_id == tg_id)
+            .limit(1)
+        )
+        if redeemed:
+            raise PromoError("Этот промокод уже активирован вами")
+        raise PromoError("Лимит активаций по промокоду исчерпан")
+
+    promo_id, bonus_photo, bonus_video = int(row[0]), int(row[1] or 0), int(row[2] or 0)
+    user_ids = select(User.id).where(User.tg_id == tg_id).scalar_subquery()
 
-    already = await session.scalar(
-        select(PromoRedemption.id).where(
-            PromoRedemption.promo_id == promo.id,
-            PromoRedemption.user_id == user.id,
+    try:
+        inserted = await session.execute(
+            insert(PromoRedemption).from_select(
+                ["promo_id", "user_id"],
+                select(literal(promo_id, Integer), User.id).where(User.tg_id == tg_id),
+            )
         )
-    )
-    if already:
+    except IntegrityError:
+        await session.rollback()
         raise PromoError("Этот промокод уже активирован вами")
 
-    if int(promo.used_count) >= int(promo.max_uses):
-        raise PromoError("Лимит активаций по промокоду исчерпан")
+    if inserted.rowcount != 1:
+        await session.rollback()
+        raise PromoError("Пользователь не найден")
 
-    await ensure_default_subscription(session, tg_id)
+    if bonus_photo > 0 or bonus_video > 0:
+        active_us_id = (
+            select(UserSubscription.id)
+            .where(UserSubscription.user_id == user_ids, UserSubscription.status == 1)
+            .order_by(UserSubscription.activated_at.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        await session.execute(
+            update(UserSubscription)
+            .where(UserSubscription.id == active_us_id)
+            .values(
+                remaining_photo=UserSubscription.remaining_photo + bonus_photo,
+                remaining_video=UserSubscription.remaining_video + bonus_video,
+            )
+        )
 
-    result = await session.execute(
-        update(PromoCode)
-        .where(PromoCode.id == promo.id, PromoCode.used_count < PromoCode.max_uses)
-        .values(used_count=PromoCode.used_count + 1)
-    )
-    if result.rowcount != 1:
-        raise PromoError("Лимит активаций по промокоду исчерпан")
-    session.add(
-        PromoRedemption(promo_id=promo.id, user_id=user.id)
-    )
     await session.commit()
+    return PromoGrant(code=code, bonus_photo=bonus_photo, bonus_video=bonus_video)
 
-    if promo.bonus_photo > 0:
-        await grant_photo_generation(session, tg_id, delta=int(promo.bonus_photo))
-    if promo.bonus_video > 0:
-        await grant_video_generation(session, tg_id, delta=int(promo.bonus_video))
 
-    return promo
+# без похожих символов (0/O, 1/I/L) — коды вводят руками
+PROMO_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+
+def _random_code(prefix: str, length: int) -> str:
+    return prefix + "".join(secrets.choice(PROMO_ALPHABET) for _ in range(length))
+
+
+async def generate_promo_codes(
+    session: AsyncSession,
+    *,
+    count: int,
+    bonus_photo: int,
+    bonus_video: int,
+    max_uses: int = 1,
+    prefix: str = "",
+    length: int = 8,
+    chunk_size: int = 500,
+) -> list[str]:
+    """
+    Пачка случайных промокодов (по умолчанию одноразовых):
+    multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING code чанками по chunk_size,
+    коллизии догенерируем, один COMMIT в конце.
+    """
+    prefix = normalize_promo_code(prefix)
+    if count <= 0:
+        raise PromoError("Количество должно быть > 0")
+    if max_uses <= 0:
+        raise PromoError("Количество активаций должно быть > 0")
+    if len(prefix) + length > 64:
+        raise PromoError("Слишком длинный промокод")
+
+    bonus_photo = max(0, int(bonus_photo))
+    bonus_video = max(0, int(bonus_video))
+
+    created: list[str] = []
+    attempts = 0
+    while len(created) < count:
+        attempts += 1
+        if attempts > 20:
+            raise PromoError("Не удалось сгенерировать уникальные коды — увеличь длину")
+
+        need = count - len(created)
+        codes = {_random_code(prefix, length) for _ in range(need)}
+        batch = list(codes)
+        for i in range(0, len(batch), chunk_size):
+            chunk = batch[i : i + chunk_size]
+            stmt = (
+                sqlite_insert(PromoCode)
+                .values(
+                    [
+                        {
+                            "code": c,
+                            "bonus_photo": bonus_photo,
+                            "bonus_video": bonus_video,
+                            "max_uses": int(max_uses),
+                            "used_count": 0,
+                        }
+                        for c in chunk
+                    ]
+                )
+                .on_conflict_do_nothing(index_elements=["code"])
+                .returning(PromoCode.code)
+            )
+            created.extend((await session.execute(stmt)).scalars().all())
+
+    await session.commit()
+    return created
 
 
 async def get_last_promo_codes(
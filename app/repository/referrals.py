@@ -3,15 +3,16 @@ from __future__ import annotations
 import logging
 from decimal import Decimal
 
-from sqlalchemy import desc, func, select, update
+from sqlalchemy import Integer, desc, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from app.models.subscription import Subscription
 from app.models.user import User
 from app.models.referral import Referral
 from app.models.user_subscription import UserSubscription
 from app.repository.access import give_subscription_plan
-from app.repository.users import get_user_by_tg_id
+from app.repository.plans import PlanInfo, get_plan_by_id, get_plan_by_name
 
 logger = logging.getLogger(__name__)
 
@@ -33,30 +34,29 @@ def parse_referrer_tg_id(start_payload: str) -> int | None:
     return int(ref) if ref.isdigit() else None
 
 
-async def _get_plan_by_name(session: AsyncSession, name: str) -> Subscription | None:
-    return await session.scalar(
-        select(Subscription).where(Subscription.name == name).limit(1)
-    )
-
-
-async def _get_active_plan(session: AsyncSession, user_id: int) -> Subscription | None:
-    q = await session.execute(
-        select(Subscription)
-        .select_from(UserSubscription)
-        .join(Subscription, Subscription.id == UserSubscription.subscription_id)
+async def _get_active_plan(session: AsyncSession, user_id: int) -> PlanInfo | None:
+    subscription_id = await session.scalar(
+        select(UserSubscription.subscription_id)
         .where(UserSubscription.user_id == user_id)
         .where(UserSubscription.status == 1)
         .order_by(desc(UserSubscription.id))
         .limit(1)
     )
-    return q.scalar_one_or_none()
+    if subscription_id is None:
+        return None
+    return await get_plan_by_id(session, int(subscription_id))
+
+
+REFERRAL_MILESTONES = {10: "Orbit", 50: "Nova"}
 
 
 async def get_referrals_count(session: AsyncSession, referrer_user_id: int) -> int:
+    """
+    Денормализованный счётчик users.referrals_count (ведётся атомарно
+    в process_referral_for_new_user) — без COUNT(*) по referrals.
+    """
     count = await session.scalar(
-        select(func.count())
-        .select_from(Referral)
-        .where(Referral.referrer_user_id == referrer_user_id)
+        select(User.referrals_count).where(User.id == referrer_user_id)
     )
     return int(count or 0)
 
@@ -67,40 +67,59 @@ async def process_referral_for_new_user(
     new_user: User,
     referrer_tg_id: int,
 ) -> None:
+    """
+    Одна транзакция на реферальную регистрацию:
+    1) INSERT INTO referrals SELECT users.id WHERE tg_id=:ref
+       ON CONFLICT(referred_user_id) DO NOTHING RETURNING referrer_user_id
+       (нет пригласившего / уже приглашён — просто ничего не вставится)
+    2) UPDATE users SET referrals_count = referrals_count + 1 ... RETURNING referrals_count
+    3) UPDATE users SET referred_by_id для нового пользователя
+    4) COMMIT
+    Награды (10 → Orbit, 50 → Nova) — по значению из RETURNING, без COUNT(*).
+    """
     if new_user.referred_by_id is not None:
         return
     if new_user.tg_id == referrer_tg_id:
         return
 
-    referrer = await get_user_by_tg_id(session, referrer_tg_id)
-    if referrer is None:
-        return
-
-    existing = await session.scalar(
-        select(Referral.id).where(Referral.referred_user_id == new_user.id)
+    referrer_id = await session.scalar(
+        sqlite_insert(Referral)
+        .from_select(
+            ["referrer_user_id", "referred_user_id"],
+            select(User.id, literal(new_user.id, Integer)).where(
+                User.tg_id == referrer_tg_id
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["referred_user_id"])
+        .returning(Referral.referrer_user_id)
     )
-    if existing is not None:
+    if referrer_id is None:
+        # commit, а не rollback: rollback сбросил бы загруженные объекты сессии хендлера
+        await session.commit()
         return
-
-    new_user.referred_by_id = referrer.id
-    session.add(
-        Referral(referrer_user_id=referrer.id, referred_user_id=new_user.id)
+    referrer_id = int(referrer_id)
+
+    count = int(
+        await session.scalar(
+            update(User)
+            .where(User.id == referrer_id)
+            .values(referrals_count=User.referrals_count + 1)
+            .returning(User.referrals_count)
+        )
     )
-    await session.commit()
-    await session.refresh(new_user)
-
-    count = await get_referrals_count(session, referrer.id)
     await session.execute(
         update(User)
-        .where(User.id == referrer.id)
-        .values(referrals_count=count)
+        .where(User.id == new_user.id, User.referred_by_id.is_(None))
+        .values(referred_by_id=referrer_id)
     )
     await session.commit()
-    if count not in {10, 50}:
+    set_committed_value(new_user, "referred_by_id", referrer_id)
+
+    target_name = REFERRAL_MILESTONES.get(count)
+    if target_name is None:
         return
 
-    target_name = "Orbit" if count == 10 else "Nova"
-    target_plan = await _get_plan_by_name(session, target_name)
+    target_plan = await get_plan_by_name(session, target_name)
     if target_plan is None:
         logger.warning(
             "referrals: target plan not found name=%s referrer_tg_id=%s",
@@ -109,7 +128,7 @@ async def process_referral_for_new_user(
         )
         return
 
-    active_plan = await _get_active_plan(session, referrer.id)
+    active_plan = await _get_active_plan(session, referrer_id)
     if active_plan is not None:
         try:
             active_price = Decimal(active_plan.price or 0)
@@ -121,6 +140,9 @@ async def process_referral_for_new_user(
         if active_plan.id > target_plan.id and active_price > target_price:
             return
 
+    referrer = await session.get(User, referrer_id)
+    if referrer is None:
+        return
     await give_subscription_plan(session, referrer, int(target_plan.id))
     logger.info(
         "referrals: awarded plan=%s to tg_id=%s for referrals_count=%s",
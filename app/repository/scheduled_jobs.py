@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import and_, case, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.scheduled_job import ScheduledJob
+
+
+@dataclass(frozen=True, slots=True)
+class ClaimedJob:
+    id: int
+    kind: str
+    key: str | None
+    payload: dict[str, Any]
+    interval_sec: int | None
+    cron: str | None
+    attempts: int
+
+
+def as_utc(dt: datetime) -> datetime:
+    # SQLite отдаёт DateTime без tzinfo — храним всегда в UTC
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+async def add_job(
+    session: AsyncSession,
+    *,
+    kind: str,
+    run_at: datetime,
+    key: str | None = None,
+    payload: dict[str, Any] | None = None,
+    interval_sec: int | None = None,
+    cron: str | None = None,
+    replace: bool = False,
+    run_now: bool = False,
+) -> int | None:
+    """
+    INSERT задачи. С key — дедупликация:
+    - replace=False: задача с таким key уже есть -> ничего не делаем (None)
+    - replace=True: обновляем расписание/payload существующей (для периодических);
+      run_at сохраняется, пока расписание то же, и берётся новый, если оно изменилось;
+      run_now=True — не позже переданного run_at (min из сохранённого и нового)
+    Без commit.
+    """
+    values = dict(
+        kind=kind,
+        key=key,
+        payload=json.dumps(payload, ensure_ascii=False) if payload else None,
+        run_at=run_at,
+        interval_sec=interval_sec,
+        cron=cron,
+    )
+    stmt = sqlite_insert(ScheduledJob).values(**values)
+    if key is not None:
+        if replace:
+            schedule_changed = or_(
+                ScheduledJob.interval_sec.is_distinct_from(stmt.excluded.interval_sec),
+                ScheduledJob.cron.is_distinct_from(stmt.excluded.cron),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["key"],
+                set_={
+                    "kind": stmt.excluded.kind,
+                    "run_at": case(
+                        (schedule_changed, stmt.excluded.run_at),
+                        (
+                            and_(
+                                literal(run_now),
+                                stmt.excluded.run_at < ScheduledJob.run_at,
+                            ),
+                            stmt.excluded.run_at,
+                        ),
+                        else_=ScheduledJob.run_at,
+                    ),
+                    "payload": stmt.excluded.payload,
+                    "interval_sec": stmt.excluded.interval_sec,
+                    "cron": stmt.excluded.cron,
+                },
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["key"])
+    job_id = await session.scalar(stmt.returning(ScheduledJob.id))
+    return int(job_id) if job_id is not None else None
+
+
+async def get_upcoming_jobs(
+    session: AsyncSession, *, until: datetime, now: datetime, limit: int = 1000
+) -> list[tuple[int, datetime]]:
+    """
+    (id, run_at) задач до until, которые никто не держит (lease истёк или пуст).
+    Использует индекс по run_at.
+    """
+    res = await session.execute(
+        select(ScheduledJob.id, ScheduledJob.run_at)
+        .where(ScheduledJob.run_at <= until)
+        .where(
+            or_(
+                ScheduledJob.locked_until.is_(None),
+                ScheduledJob.locked_until <= now,
+            )
+        )
+        .order_by(ScheduledJob.run_at.asc())
+        .limit(limit)
+    )
+    return [(int(job_id), as_utc(run_at)) for job_id, run_at in res.all()]
+
+
+async def claim_jobs(
+    session: AsyncSession,
+    job_ids: list[int],
+    *,
+    now: datetime,
+    lease_until: datetime,
+) -> list[ClaimedJob]:
+    """
+    Атомарно берём пачку задач в работу одним UPDATE ... RETURNING:
+    только наступившие и никем не занятые. Что не вернулось — уже забрали,
+    удалили или перенесли. Без commit.
+    """
+    if not job_ids:
+        return []
+    res = await session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.id.in_(job_ids))
+        .where(ScheduledJob.run_at <= now)
+        .where(
+            or_(
+                ScheduledJob.locked_until.is_(None),
+                ScheduledJob.locked_until <= now,
+            )
+        )
+        .values(locked_until=lease_until, attempts=ScheduledJob.attempts + 1)
+        .returning(
+            ScheduledJob.id,
+            ScheduledJob.kind,
+            ScheduledJob.key,
+            ScheduledJob.payload,
+            ScheduledJob.interval_sec,
+            ScheduledJob.cron,
+            ScheduledJob.attempts,
+        )
+    )
+    return [
+        ClaimedJob(
+            id=int(row.id),
+            kind=row.kind,
+            key=row.key,
+            payload=json.loads(row.payload) if row.payload else {},
+            interval_sec=row.interval_sec,
+            cron=row.cron,
+            attempts=int(row.attempts),
+        )
+        for row in res.all()
+    ]
+
+
+async def extend_lease(
+    session: AsyncSession, job_id: int, *, lease_until: datetime
+) -> None:
+    """
+    Продлить аренду выполняющейся задачи. Без commit.
+    """
+    await session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.id == job_id)
+        .where(ScheduledJob.locked_until.is_not(None))
+        .values(locked_until=lease_until)
+    )
+
+
+async def finish_job(
+    session: AsyncSession, job_id: int, *, next_run_at: datetime | None
+) -> None:
+    """
+    Успех: одноразовую задачу удаляем, периодическую переносим на next_run_at.
+    Без commit.
+    """
+    if next_run_at is None:
+        await session.execute(delete(ScheduledJob).where(ScheduledJob.id == job_id))
+        return
+    await session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.id == job_id)
+        .values(run_at=next_run_at, locked_until=None, attempts=0, last_error=None)
+    )
+
+
+async def delete_jobs(session: AsyncSession, job_ids: list[int]) -> None:
+    """
+    Пачка успешно выполненных одноразовых задач. Без commit.
+    """
+    if job_ids:
+        await session.execute(delete(ScheduledJob).where(ScheduledJob.id.in_(job_ids)))
+
+
+async def retry_job(
+    session: AsyncSession, job_id: int, *, run_at: datetime, error: str
+) -> None:
+    """
+    Ошибка: снимаем lease и ставим повтор на run_at. Без commit.
+    """
+    await session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.id == job_id)
+        .values(run_at=run_at, locked_until=None, last_error=error[:2000])
+    )
+
+
+async def count_jobs(session: AsyncSession) -> dict[str, int]:
+    res = await session.execute(
+        select(ScheduledJob.kind, func.count(ScheduledJob.id)).group_by(ScheduledJob.kind)
+    )
+    return {kind: int(cnt) for kind, cnt in res.all()}
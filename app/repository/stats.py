@@ -0,0 +1,242 @@
+# app/repository/stats.py
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.payment import Payment, PaymentStatus
+from app.models.stats import StatsCounter, StatsDaily
+from app.models.user import User
+from app.models.user_subscription import UserSubscription
+
+logger = logging.getLogger(__name__)
+
+# UTC+3 — дни в роллапах считаем по Москве
+TZ_MSK = timezone(timedelta(hours=3))
+
+# --- итоговые счётчики (stats_counters) ---
+USERS_TOTAL = "users_total"
+ACTIVE_SUBS = "active_subs"
+PHOTOS_GENERATED = "photos_generated"
+VIDEOS_GENERATED = "videos_generated"
+PAYMENTS_CONFIRMED = "payments_confirmed"
+REVENUE_RUB = "revenue_rub"
+
+# --- только дневные метрики (stats_daily) ---
+NEW_USERS = "new_users"
+PHOTO_CHARGED = "photo_charged"
+VIDEO_CHARGED = "video_charged"
+PHOTO_REFUNDED = "photo_refunded"
+VIDEO_REFUNDED = "video_refunded"
+SUBS_ACTIVATED = "subs_activated"
+SUBS_EXPIRED = "subs_expired"
+
+# служебная строка в stats_counters: backfill уже выполнен
+_BACKFILL_MARKER = "_backfilled"
+
+
+def today_msk() -> date:
+    return datetime.now(TZ_MSK).date()
+
+
+async def bump_counter(session: AsyncSession, name: str, delta: int = 1) -> None:
+    """
+    +delta к итоговому счётчику. Без commit — коммитит вызывающий код
+    вместе с самим событием.
+    """
+    if not delta:
+        return
+    stmt = sqlite_insert(StatsCounter).values(name=name, value=int(delta))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={
+            "value": StatsCounter.value + stmt.excluded.value,
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def bump_daily(
+    session: AsyncSession,
+    metric: str,
+    delta: int = 1,
+    *,
+    scenario: str = "",
+    day: date | None = None,
+) -> None:
+    """
+    +delta к дневному роллапу (metric, scenario). Без commit.
+    """
+    if not delta:
+        return
+    stmt = sqlite_insert(StatsDaily).values(
+        day=day or today_msk(),
+        metric=metric,
+        scenario=scenario or "",
+        value=int(delta),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "metric", "scenario"],
+        set_={"value": StatsDaily.value + stmt.excluded.value},
+    )
+    await session.execute(stmt)
+
+
+async def bump(
+    session: AsyncSession, metric: str, delta: int = 1, *, scenario: str = ""
+) -> None:
+    """
+    Итоговый счётчик + дневной роллап одной метрики.
+    """
+    await bump_counter(session, metric, delta)
+    await bump_daily(session, metric, delta, scenario=scenario)
+
+
+async def get_counters(session: AsyncSession) -> dict[str, int]:
+    res = await session.execute(select(StatsCounter.name, StatsCounter.value))
+    return {
+        name: int(value or 0)
+        for name, value in res.all()
+        if name != _BACKFILL_MARKER
+    }
+
+
+async def get_counter(session: AsyncSession, name: str) -> int:
+    value = await session.scalar(
+        select(StatsCounter.value).where(StatsCounter.name == name)
+    )
+    return int(value or 0)
+
+
+async def get_daily_totals(
+    session: AsyncSession, *, metrics: list[str], days: int = 7
+) -> dict[date, dict[str, int]]:
+    """
+    Последние days дней (включая сегодня): день -> {metric: value}
+    (сумма по всем сценариям). Пустые дни тоже возвращаются — с нулями.
+    """
+    end = today_msk()
+    start = end - timedelta(days=days - 1)
+
+    res = await session.execute(
+        select(StatsDaily.day, StatsDaily.metric, func.sum(StatsDaily.value))
+        .where(StatsDaily.day >= start, StatsDaily.metric.in_(metrics))
+        .group_by(StatsDaily.day, StatsDaily.metric)
+    )
+
+    out: dict[date, dict[str, int]] = {
+        start + timedelta(days=i): {m: 0 for m in metrics} for i in range(days)
+    }
+    for day, metric, value in res.all():
+        if day in out:
+            out[day][metric] = int(value or 0)
+    return out
+
+
+async def get_daily_by_scenario(
+    session: AsyncSession, *, metric: str, days: int = 7
+) -> dict[str, int]:
+    """
+    Сумма метрики за последние days дней с разбивкой по сценарию.
+    """
+    start = today_msk() - timedelta(days=days - 1)
+    res = await session.execute(
+        select(StatsDaily.scenario, func.sum(StatsDaily.value))
+        .where(StatsDaily.day >= start, StatsDaily.metric == metric)
+        .group_by(StatsDaily.scenario)
+        .order_by(func.sum(StatsDaily.value).desc())
+    )
+    return {scenario or "-": int(value or 0) for scenario, value in res.all()}
+
+
+async def backfill_stats_once(session: AsyncSession) -> bool:
+    """
+    Первый запуск со счётчиками: один раз считаем итоги полными агрегатами
+    (как раньше делал get_users_stats) и дневные роллапы по тем данным,
+    где есть дата (регистрации, подтверждённые оплаты).
+    """
+    done = await session.scalar(
+        select(StatsCounter.name).where(StatsCounter.name == _BACKFILL_MARKER)
+    )
+    if done is not None:
+        return False
+
+    total_users = await session.scalar(select(func.count(User.id)))
+    active_subs = await session.scalar(
+        select(func.count(func.distinct(UserSubscription.user_id))).where(
+            UserSubscription.status == 1
+        )
+    )
+    total_photos = await session.scalar(select(func.sum(User.generated_photos)))
+    total_videos = await session.scalar(select(func.sum(User.generated_videos)))
+    paid_count, paid_sum = (
+        await session.execute(
+            select(func.count(Payment.id), func.sum(Payment.amount)).where(
+                Payment.status == PaymentStatus.CONFIRMED
+            )
+        )
+    ).one()
+
+    for name, value in (
+        (USERS_TOTAL, total_users),
+        (ACTIVE_SUBS, active_subs),
+        (PHOTOS_GENERATED, total_photos),
+        (VIDEOS_GENERATED, total_videos),
+        (PAYMENTS_CONFIRMED, paid_count),
+        (REVENUE_RUB, paid_sum),
+        (_BACKFILL_MARKER, 1),
+    ):
+        # полные агрегаты уже включают всё, что успели насчитать инкрементально
+        stmt = sqlite_insert(StatsCounter).values(name=name, value=int(value or 0))
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["name"], set_={"value": stmt.excluded.value}
+            )
+        )
+
+    # дневные роллапы пересобираем с нуля по тем метрикам, что восстанавливаем
+    await session.execute(
+        delete(StatsDaily).where(
+            StatsDaily.metric.in_([NEW_USERS, PAYMENTS_CONFIRMED, REVENUE_RUB])
+        )
+    )
+
+    users_day = func.date(User.created_at, "+3 hours")
+    res = await session.execute(
+        select(users_day, func.count(User.id))
+        .where(User.created_at.is_not(None))
+        .group_by(users_day)
+    )
+    for day_str, cnt in res.all():
+        await bump_daily(session, NEW_USERS, int(cnt), day=date.fromisoformat(day_str))
+
+    paid_day = func.date(Payment.confirmed_at, "+3 hours")
+    res = await session.execute(
+        select(paid_day, Payment.plan_name, func.count(Payment.id), func.sum(Payment.amount))
+        .where(
+            Payment.status == PaymentStatus.CONFIRMED,
+            Payment.confirmed_at.is_not(None),
+        )
+        .group_by(paid_day, Payment.plan_name)
+    )
+    for day_str, plan_name, cnt, amount in res.all():
+        day = date.fromisoformat(day_str)
+        await bump_daily(session, PAYMENTS_CONFIRMED, int(cnt), scenario=plan_name, day=day)
+        await bump_daily(session, REVENUE_RUB, int(amount or 0), scenario=plan_name, day=day)
+
+    await session.commit()
+    logger.info(
+        "stats.backfill_stats_once: users=%s active_subs=%s photos=%s videos=%s payments=%s revenue=%s",
+        total_users,
+        active_subs,
+        total_photos,
+        total_videos,
+        paid_count,
+        paid_sum,
+    )
+    return True
@@ -6,7 +6,9 @@ from sqlalchemy import select, update
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.writer import submit_write
 from app.models.user import User
+from app.repository import stats
 
 
 async def get_user_by_tg_id(session: AsyncSession, tg_id: int) -> Optional[User]:
@@ -34,7 +36,10 @@ async def upsert_user(
             free_channel_reminder_sent=False,
         )
         stmt = stmt.on_conflict_do_nothing(index_elements=["tg_id"])
-        await session.execute(stmt)
+        result = await session.execute(stmt)
+        if result.rowcount == 1:
+            await stats.bump_counter(session, stats.USERS_TOTAL)
+            await stats.bump_daily(session, stats.NEW_USERS)
         await session.commit()
         user = await get_user_by_tg_id(session, tg_id)
         if user is None:
@@ -66,6 +71,9 @@ async def get_or_create_user(
         )
         stmt = stmt.on_conflict_do_nothing(index_elements=["tg_id"])
         result = await session.execute(stmt)
+        if result.rowcount == 1:
+            await stats.bump_counter(session, stats.USERS_TOTAL)
+            await stats.bump_daily(session, stats.NEW_USERS)
         await session.commit()
         user = await get_user_by_tg_id(session, tg_id)
         if user is None:
@@ -80,22 +88,28 @@ async def get_or_create_user(
     return user, created
 
 async def increment_generated_photos(
-    session: AsyncSession, tg_id: int, delta: int = 1
+    session: AsyncSession, tg_id: int, delta: int = 1, *, scenario: str = ""
 ) -> None:
-    await session.execute(
-        update(User)
-        .where(User.tg_id == tg_id)
-        .values(generated_photos=User.generated_photos + delta)
-    )
-    await session.commit()
+    async def op(s: AsyncSession) -> None:
+        await s.execute(
+            update(User)
+            .where(User.tg_id == tg_id)
+            .values(generated_photos=User.generated_photos + delta)
+        )
+        await stats.bump(s, stats.PHOTOS_GENERATED, delta, scenario=scenario)
+
+    await submit_write(op, session=session, label="users.generated_photos")
 
 
 async def increment_generated_videos(
-    session: AsyncSession, tg_id: int, delta: int = 1
+    session: AsyncSession, tg_id: int, delta: int = 1, *, scenario: str = ""
 ) -> None:
-    await session.execute(
-        update(User)
-        .where(User.tg_id == tg_id)
-        .values(generated_videos=User.generated_videos + delta)
-    )
-    await session.commit()
+    async def op(s: AsyncSession) -> None:
+        await s.execute(
+            update(User)
+            .where(User.tg_id == tg_id)
+            .values(generated_videos=User.generated_videos + delta)
+        )
+        await stats.bump(s, stats.VIDEOS_GENERATED, delta, scenario=scenario)
+
+    await submit_write(op, session=session, label="users.generated_videos")
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db.writer import submit_write
+from app.repository.admin_actions import insert_admin_actions_batch
+
+logger = logging.getLogger(__name__)
+
+
+class AdminActionBuffer:
+    """
+    Буфер логов действий админов:
+    - enqueue() не трогает БД (не стоит на пути ответа админу)
+    - writer пишет пачками: batch_size записей или раз в flush_interval_sec
+    - очередь ограничена: при переполнении запись отбрасывается (dropped++)
+    """
+
+    def __init__(self, *, maxsize: int = 1000) -> None:
+        self._queue: asyncio.Queue[tuple[int, str, str | None, datetime]] = (
+            asyncio.Queue(maxsize=maxsize)
+        )
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def enqueue(self, *, tg_id: int, action: str, data: str | None = None) -> bool:
+        try:
+            self._queue.put_nowait(
+                (int(tg_id), action, data, datetime.now(timezone.utc))
+            )
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(
+                    "admin_action_buffer: queue full, dropped=%s maxsize=%s",
+                    self.dropped,
+                    self._queue.maxsize,
+                )
+            return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "depth": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+    def _take(self, limit: int) -> list[tuple[int, str, str | None, datetime]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _flush(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        batch: list[tuple[int, str, str | None, datetime]],
+    ) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            async with sessionmaker() as session:
+                written = await submit_write(
+                    lambda s: insert_admin_actions_batch(s, batch),
+                    session=session,
+                    label="admin_actions",
+                )
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("admin_action_buffer: flush failed size=%s", len(batch))
+            return
+
+        self.written += written
+        self.flushes += 1
+        logger.debug(
+            "admin_action_buffer: flushed size=%s written=%s elapsed_ms=%.1f",
+            len(batch),
+            written,
+            (time.perf_counter() - started) * 1000,
+        )
+
+    async def run(
+        self,
+        *,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        batch_size: int = 50,
+        flush_interval_sec: float = 2.0,
+    ) -> None:
+        """
+        Бесконечный цикл writer'а. При отмене дописывает всё, что осталось в очереди.
+        """
+        logger.info(
+            "admin_action_buffer: started batch_size=%s flush_interval_sec=%s maxsize=%s",
+            batch_size,
+            flush_interval_sec,
+            self._queue.maxsize,
+        )
+        batch: list[tuple[int, str, str | None, datetime]] = []
+        flush: asyncio.Future | None = None
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = time.monotonic() + flush_interval_sec
+
+                # добираем до batch_size, но не дольше flush_interval_sec
+                while len(batch) < batch_size:
+                    batch.extend(self._take(batch_size - len(batch)))
+                    if len(batch) >= batch_size:
+                        break
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(self._queue.get(), timeout)
+                        )
+                    except asyncio.TimeoutError:
+                        break
+
+                # пачка уходит в запись ровно один раз: отмена не обрывает
+                # INSERT посреди и не отправляет ту же пачку повторно
+                flush = asyncio.ensure_future(self._flush(sessionmaker, batch))
+                batch = []
+                await asyncio.shield(flush)
+                flush = None
+        except asyncio.CancelledError:
+            # shutdown: дописываем начатую пачку, собранную, но не отправленную,
+            # и остаток очереди
+            if flush is not None:
+                await asyncio.gather(flush, return_exceptions=True)
+            await self._flush(sessionmaker, batch)
+            await self.drain(sessionmaker=sessionmaker, batch_size=batch_size)
+            raise
+
+    async def drain(
+        self,
+        *,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        batch_size: int = 50,
+    ) -> None:
+        pending = self._queue.qsize()
+        while True:
+            batch = self._take(batch_size)
+            if not batch:
+                break
+            await self._flush(sessionmaker, batch)
+        if pending:
+            logger.info(
+                "admin_action_buffer: drained pending=%s written_total=%s",
+                pending,
+                self.written,
+            )
+
+
+admin_action_buffer = AdminActionBuffer(
+    maxsize=int(os.getenv("ADMIN_ACTIONS_QUEUE_MAX", "1000"))
+)
+
+
+def enqueue_admin_action(*, tg_id: int, action: str, data: str | None = None) -> bool:
+    return admin_action_buffer.enqueue(tg_id=tg_id, action=action, data=data)
@@ -1,22 +1,34 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 
 from app.db import session_factory
 from app.repository.admin_actions import cleanup_admin_actions
+from app.services.scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
+ADMIN_LOG_CLEANUP_JOB = "admin_log_cleanup"
 
-async def run_admin_log_cleanup(*, interval_sec: int = 24 * 60 * 60) -> None:
-    logger.info("admin_log_cleanup: started interval_sec=%s", interval_sec)
-    while True:
-        try:
-            async with session_factory() as session:
-                deleted = await cleanup_admin_actions(session, days=30)
-                if deleted:
-                    logger.info("admin_log_cleanup: deleted=%s", deleted)
-        except Exception:
-            logger.exception("admin_log_cleanup: failed")
-        await asyncio.sleep(interval_sec)
+
+async def _cleanup_job(payload: dict) -> None:
+    async with session_factory() as session:
+        deleted = await cleanup_admin_actions(
+            session, days=int(payload.get("days") or 30)
+        )
+    if deleted:
+        logger.info("admin_log_cleanup: deleted=%s", deleted)
+
+
+def register_admin_log_cleanup_job() -> None:
+    scheduler.register(ADMIN_LOG_CLEANUP_JOB, _cleanup_job)
+
+
+async def schedule_admin_log_cleanup(*, interval_sec: int = 24 * 60 * 60) -> None:
+    # первый прогон — сразу на каждом старте, дальше раз в interval_sec
+    await scheduler.schedule_recurring(
+        ADMIN_LOG_CLEANUP_JOB,
+        interval_sec=interval_sec,
+        payload={"days": 30},
+        run_now=True,
+    )
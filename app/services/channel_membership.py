@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# подписан — можно верить подольше; не подписан — коротко,
+# чтобы только что подписавшийся не ждал (его обычно обновит chat_member)
+POSITIVE_TTL_SEC = 300.0
+NEGATIVE_TTL_SEC = 10.0
+# значение пришло из chat_member апдейта — это факт, а не опрос
+EVENT_TTL_SEC = 6 * 60 * 60.0
+
+MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+
+
+def is_member_status(status: Any, *, is_member: bool | None = None) -> bool:
+    """
+    restricted-участник тоже в канале, если is_member=True.
+    """
+    status = str(getattr(status, "value", status) or "")
+    if status in MEMBER_STATUSES:
+        return True
+    return status == "restricted" and bool(is_member)
+
+
+class MembershipCache:
+    """
+    Кэш «tg_id подписан на канал» в памяти процесса:
+    - разные TTL для положительного и отрицательного ответа
+    - одновременные проверки одного tg_id склеиваются в один get_chat_member
+    - chat_member апдейты канала пишут значение напрямую (set_from_event)
+    """
+
+    def __init__(
+        self,
+        *,
+        positive_ttl: float = POSITIVE_TTL_SEC,
+        negative_ttl: float = NEGATIVE_TTL_SEC,
+        event_ttl: float = EVENT_TTL_SEC,
+        maxsize: int = 50_000,
+    ) -> None:
+        self._positive_ttl = positive_ttl
+        self._negative_ttl = negative_ttl
+        self._event_ttl = event_ttl
+        self._maxsize = maxsize
+        self._entries: dict[int, tuple[bool, float]] = {}  # tg_id -> (member, expires_at)
+        self._inflight: dict[int, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.events = 0
+
+    def get(self, tg_id: int) -> bool | None:
+        entry = self._entries.get(tg_id)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(tg_id, None)
+            return None
+        return value
+
+    def set(self, tg_id: int, value: bool, *, ttl: float | None = None) -> None:
+        if ttl is None:
+            ttl = self._positive_ttl if value else self._negative_ttl
+        self._entries.pop(tg_id, None)  # в конец dict — самые свежие
+        self._entries[tg_id] = (value, time.monotonic() + ttl)
+        if len(self._entries) > self._maxsize:
+            self._evict()
+
+    def set_from_event(self, tg_id: int, value: bool) -> None:
+        self.events += 1
+        self.set(tg_id, value, ttl=self._event_ttl)
+
+    def invalidate(self, tg_id: int) -> None:
+        self._entries.pop(tg_id, None)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for tg_id in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+            del self._entries[tg_id]
+        # всё ещё много — выкидываем самые старые записи
+        while len(self._entries) > self._maxsize:
+            del self._entries[next(iter(self._entries))]
+
+    async def check(self, tg_id: int, fetch: Callable[[], Awaitable[bool]]) -> bool:
+        cached = self.get(tg_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._inflight.get(tg_id)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+
+        async def _fetch_and_store() -> bool:
+            try:
+                value = await fetch()
+                self.set(tg_id, value)
+                return value
+            finally:
+                self._inflight.pop(tg_id, None)
+
+        task = asyncio.create_task(_fetch_and_store())
+        self._inflight[tg_id] = task
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "events": self.events,
+        }
+
+
+membership_cache = MembershipCache()
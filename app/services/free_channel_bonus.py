@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 
 from aiogram import Bot
@@ -9,8 +8,12 @@ from sqlalchemy import update, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import session_factory
+from app.db.writer import submit_write
 from app.models.user import User
-from app.repository.generations import ensure_default_subscription, grant_photo_generation
+from app.models.user_subscription import UserSubscription
+from app.repository.generations import ensure_default_subscription
+from app.services.channel_membership import is_member_status, membership_cache
+from app.services.scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -18,62 +21,120 @@ CHANNEL_ID = -1003494890507
 CHANNEL_URL = "https://t.me/WearAIOfficial"
 
 
-async def is_user_in_channel(bot: Bot, tg_id: int) -> bool:
+async def _fetch_channel_membership(bot: Bot, tg_id: int) -> bool:
     try:
         member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=tg_id)
     except TelegramBadRequest as e:
         logger.warning("channel check failed tg_id=%s err=%s", tg_id, e)
         return False
-    status = getattr(member, "status", "") or ""
-    return status in {"member", "administrator", "creator"}
+    return is_member_status(
+        getattr(member, "status", ""), is_member=getattr(member, "is_member", None)
+    )
 
 
-async def mark_reminder_sent(session: AsyncSession, tg_id: int) -> None:
-    await session.execute(
-        update(User)
-        .where(User.tg_id == tg_id)
-        .values(free_channel_reminder_sent=True)
+async def is_user_in_channel(bot: Bot, tg_id: int) -> bool:
+    # кэш + склейка параллельных проверок; chat_member апдейты обновляют его сами
+    return await membership_cache.check(
+        tg_id, lambda: _fetch_channel_membership(bot, tg_id)
     )
-    await session.commit()
+
+
+async def mark_reminder_sent(session: AsyncSession, tg_id: int) -> None:
+    async def op(s: AsyncSession) -> None:
+        await s.execute(
+            update(User)
+            .where(User.tg_id == tg_id)
+            .values(free_channel_reminder_sent=True)
+        )
+
+    await submit_write(op, session=session, label="bonus.reminder_sent")
 
 
 async def start_bonus_pending(session: AsyncSession, tg_id: int) -> bool:
-    result = await session.execute(
-        update(User)
-        .where(
-            User.tg_id == tg_id,
-            User.free_channel_bonus_used.is_(False),
-            User.free_channel_bonus_pending.is_(False),
+    async def op(s: AsyncSession) -> bool:
+        result = await s.execute(
+            update(User)
+            .where(
+                User.tg_id == tg_id,
+                User.free_channel_bonus_used.is_(False),
+                User.free_channel_bonus_pending.is_(False),
+            )
+            .values(free_channel_bonus_pending=True)
         )
-        .values(free_channel_bonus_pending=True)
+        return result.rowcount == 1
+
+    return await submit_write(op, session=session, label="bonus.start_pending")
+
+
+async def bonus_already_used(session: AsyncSession, tg_id: int) -> bool:
+    used = await session.scalar(
+        select(User.free_channel_bonus_used).where(User.tg_id == tg_id)
     )
-    await session.commit()
-    return result.rowcount == 1
+    return bool(used)
 
 
-async def finish_bonus(session: AsyncSession, tg_id: int) -> None:
-    await session.execute(
+BONUS_GRANT_JOB = "free_bonus_grant"
+BONUS_REMINDER_JOB = "free_bonus_reminder"
+
+
+async def grant_bonus_once(session: AsyncSession, tg_id: int) -> bool:
+    """
+    Выдача бонуса одной транзакцией: флаг used + +1 фото к активной подписке.
+    Повторный запуск (планировщик at-least-once) ничего не выдаст повторно.
+    """
+    await ensure_default_subscription(session, tg_id)
+
+    user_id = await session.scalar(
         update(User)
-        .where(User.tg_id == tg_id)
+        .where(User.tg_id == tg_id, User.free_channel_bonus_used.is_(False))
         .values(free_channel_bonus_used=True, free_channel_bonus_pending=False)
+        .returning(User.id)
+    )
+    if user_id is None:
+        await session.commit()
+        return False
+
+    active_us_id = (
+        select(UserSubscription.id)
+        .where(UserSubscription.user_id == user_id, UserSubscription.status == 1)
+        .order_by(UserSubscription.activated_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    await session.execute(
+        update(UserSubscription)
+        .where(UserSubscription.id == active_us_id)
+        .values(remaining_photo=UserSubscription.remaining_photo + 1)
     )
     await session.commit()
+    return True
 
 
-async def bonus_already_used(session: AsyncSession, tg_id: int) -> bool:
-    used = await session.scalar(
-        select(User.free_channel_bonus_used).where(User.tg_id == tg_id)
+async def schedule_bonus_grant(tg_id: int, delay_s: int = 60) -> None:
+    await scheduler.schedule(
+        BONUS_GRANT_JOB,
+        delay_sec=delay_s,
+        key=f"{BONUS_GRANT_JOB}:{tg_id}",
+        payload={"tg_id": tg_id},
+    )
+
+
+async def schedule_free_bonus_reminder(tg_id: int, delay_s: int = 600) -> None:
+    await scheduler.schedule(
+        BONUS_REMINDER_JOB,
+        delay_sec=delay_s,
+        key=f"{BONUS_REMINDER_JOB}:{tg_id}",
+        payload={"tg_id": tg_id},
     )
-    return bool(used)
 
 
-async def schedule_bonus_grant(bot: Bot, tg_id: int, delay_s: int = 60) -> None:
-    async def _job() -> None:
-        await asyncio.sleep(delay_s)
+def register_bonus_jobs(bot: Bot) -> None:
+    async def _grant(payload: dict) -> None:
+        tg_id = int(payload["tg_id"])
         async with session_factory() as session:
-            await ensure_default_subscription(session, tg_id)
-            await grant_photo_generation(session, tg_id, delta=1)
-            await finish_bonus(session, tg_id)
+            granted = await grant_bonus_once(session, tg_id)
+        if not granted:
+            return
         try:
             await bot.send_message(
                 tg_id,
@@ -82,20 +143,17 @@ async def schedule_bonus_grant(bot: Bot, tg_id: int, delay_s: int = 60) -> None:
         except Exception:
             logger.exception("failed to send bonus message tg_id=%s", tg_id)
 
-    asyncio.create_task(_job())
-
-
-async def schedule_free_bonus_reminder(bot: Bot, tg_id: int, delay_s: int = 600) -> None:
-    async def _job() -> None:
-        await asyncio.sleep(delay_s)
+    async def _remind(payload: dict) -> None:
+        tg_id = int(payload["tg_id"])
         async with session_factory() as session:
-            used = await session.scalar(
-                select(User.free_channel_bonus_used).where(User.tg_id == tg_id)
-            )
-            sent = await session.scalar(
-                select(User.free_channel_reminder_sent).where(User.tg_id == tg_id)
-            )
-            if used or sent:
+            row = (
+                await session.execute(
+                    select(
+                        User.free_channel_bonus_used, User.free_channel_reminder_sent
+                    ).where(User.tg_id == tg_id)
+                )
+            ).first()
+            if row is None or row.free_channel_bonus_used or row.free_channel_reminder_sent:
                 return
             await mark_reminder_sent(session, tg_id)
 
@@ -109,7 +167,8 @@ async def schedule_free_bonus_reminder(bot: Bot, tg_id: int, delay_s: int = 600)
         except Exception:
             logger.exception("failed to send reminder tg_id=%s", tg_id)
 
-    asyncio.create_task(_job())
+    scheduler.register(BONUS_GRANT_JOB, _grant)
+    scheduler.register(BONUS_REMINDER_JOB, _remind)
 
 
 def free_channel_kb():
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import logging
+
+from app.services.scheduler import scheduler
+from app.utils.generated_files import generated_store
+
+logger = logging.getLogger(__name__)
+
+GENERATED_SWEEP_JOB = "generated_files_sweep"
+
+
+async def _sweep_job(payload: dict) -> None:
+    deleted, reclaimed = await generated_store.sweep()
+    logger.info(
+        "generated_sweeper: deleted=%s reclaimed_bytes=%s stored_bytes=%s "
+        "written_bytes_total=%s reclaimed_bytes_total=%s dedup_hits=%s",
+        deleted,
+        reclaimed,
+        generated_store.total_bytes,
+        generated_store.bytes_written,
+        generated_store.bytes_reclaimed,
+        generated_store.dedup_hits,
+    )
+
+
+def register_generated_sweep_job() -> None:
+    scheduler.register(GENERATED_SWEEP_JOB, _sweep_job)
+
+
+async def schedule_generated_sweep(*, interval_sec: int = 600) -> None:
+    # первый прогон сразу на каждом старте: индексирует файлы с прошлого запуска (сироты живут
+    # GENERATED_ORPHAN_TTL_HOURS, дальше — квота по LRU)
+    await scheduler.schedule_recurring(
+        GENERATED_SWEEP_JOB,
+        interval_sec=interval_sec,
+        run_now=True,
+    )
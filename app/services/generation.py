@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 from typing import Sequence
 
 from aiogram import Bot
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services.generation_memo import generation_memo, images_digest, normalize_prompt
 from app.services.kie_ai import KieAIClient, PhotoSettingsDTO, get_kie_api_key_from_env
+from app.utils.metrics import current_generation_labels, set_generation_resolution
 from app.utils.tg_files import tg_file_id_to_bytes
 
+logger = logging.getLogger(__name__)
+
 
 def _normalize_output_format(v: str) -> str:
     v = (v or "").strip().lower()
@@ -96,7 +102,7 @@ async def get_user_photo_settings(
     )
 
 
-async def generate_image_kie_from_telegram(
+async def generate_image_urls_kie_from_telegram(
     *,
     bot: Bot,
     session: AsyncSession,
@@ -107,9 +113,14 @@ async def generate_image_kie_from_telegram(
     resolution: str | None = None,
     output_format: str | None = None,
     max_images: int = 5,
-) -> list[tuple[str, bytes]]:
+) -> tuple[list[tuple[str, str]], bool]:
     """
-    Returns list of (filename, bytes) of generated images.
+    Returns (list of (filename, url) of generated images, from_memo) — без
+    скачивания: по URL результат может забрать сам Telegram (tg_send.send_image_url).
+    Тот же запрос в окне GENERATION_MEMO_TTL_SEC (те же фото, промпт, настройки)
+    новую задачу KIE не создаёт — ждёт идущую или берёт готовый результат.
+    from_memo=True: задачу оплатил другой запрос, своё списание хендлер
+    возвращает сам (биллинг здесь не трогаем).
     """
     settings = await get_user_photo_settings(session, tg_id)
     if aspect_ratio or resolution or output_format:
@@ -123,6 +134,8 @@ async def generate_image_kie_from_telegram(
             ),
         )
 
+    set_generation_resolution(settings.resolution)  # метка для метрик этапов
+
     kie = KieAIClient(api_key=get_kie_api_key_from_env())
 
     # 1) TG -> bytes (до max_images)
@@ -134,6 +147,41 @@ async def generate_image_kie_from_telegram(
         b = await tg_file_id_to_bytes(bot, fid, tg_id=tg_id)
         images_bytes.append(b)
 
+    labels = current_generation_labels()
+    memo_key = (
+        labels.scenario if labels is not None else "-",
+        tg_id,
+        normalize_prompt(prompt),
+        await asyncio.to_thread(images_digest, images_bytes),
+        settings.aspect_ratio,
+        settings.resolution,
+        settings.output_format,
+    )
+    result, from_memo = await generation_memo.run(
+        memo_key,
+        lambda: _run_kie_generation(
+            kie,
+            tg_id=tg_id,
+            prompt=prompt,
+            images_bytes=images_bytes,
+            settings=settings,
+        ),
+    )
+    if from_memo:
+        if labels is not None:
+            labels.outcome = "memo"
+        logger.info("generation.memo: hit tg_id=%s images=%s", tg_id, len(result))
+    return result, from_memo
+
+
+async def _run_kie_generation(
+    kie: KieAIClient,
+    *,
+    tg_id: int,
+    prompt: str,
+    images_bytes: list[bytes],
+    settings: PhotoSettingsDTO,
+) -> list[tuple[str, str]]:
     # 2) upload -> urls
     uploaded_urls: list[str] = []
     for i, b in enumerate(images_bytes, start=1):
@@ -157,10 +205,8 @@ async def generate_image_kie_from_telegram(
     # 4) wait -> result urls
     result_urls = await kie.wait_result_urls(task_id)
 
-    # 5) download results -> bytes
-    out: list[tuple[str, bytes]] = []
-    for idx, url in enumerate(result_urls, start=1):
-        img_bytes = await kie.download_bytes(url)
-        out.append((f"result_{idx}.{settings.output_format}", img_bytes))
+    return [
+        (f"result_{idx}.{settings.output_format}", url)
+        for idx, url in enumerate(result_urls, start=1)
+    ]
 
-    return out
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Sequence
+
+from app.utils.metrics import register
+
+logger = logging.getLogger(__name__)
+
+Result = list[tuple[str, str]]  # (filename, url) — как у generate_image_urls_kie_from_telegram
+
+
+def _ttl_sec() -> float:
+    # окно, в котором одинаковый запрос не запускает новую задачу KIE; 0 — выключено
+    return float(os.getenv("GENERATION_MEMO_TTL_SEC", "120"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join((prompt or "").split()).casefold()
+
+
+def images_digest(images: Sequence[bytes]) -> tuple[str, ...]:
+    return tuple(hashlib.sha256(b).hexdigest() for b in images)
+
+
+@dataclass(slots=True)
+class _Entry:
+    future: asyncio.Future[Result]
+    expires_at: float = 0.0  # 0 — ещё в работе
+
+
+class GenerationMemo:
+    """
+    Повтор той же генерации (двойной тап «✅ Всё верно», повторная отправка
+    после таймаута): пока первая задача KIE идёт — второй запрос ждёт её же,
+    после успеха ещё ttl секунд отдаём готовые ссылки. Ошибки не кешируем —
+    следующий запрос пойдёт в KIE заново.
+    Ключ собирает вызывающий (сценарий, пользователь, промпт, хеши входных фото,
+    настройки). Память процесса: после рестарта — обычная генерация.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[Hashable, _Entry] = {}
+        self.misses = 0
+        self.hits_inflight = 0
+        self.hits_cached = 0
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, e in self._entries.items() if e.expires_at and e.expires_at <= now]:
+            del self._entries[key]
+
+    async def run(
+        self, key: Hashable, produce: Callable[[], Awaitable[Result]]
+    ) -> tuple[Result, bool]:
+        """
+        Результат и признак «взят из памяти» (True — новой задачи не было).
+        """
+        ttl = _ttl_sec()
+        if ttl <= 0:
+            return await produce(), False
+
+        self._prune(time.monotonic())
+        while (entry := self._entries.get(key)) is not None:
+            if entry.future.done():
+                self.hits_cached += 1
+            else:
+                self.hits_inflight += 1
+            try:
+                # shield: отмена ожидающего не должна отменять чужую генерацию
+                return list(await asyncio.shield(entry.future)), True
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if not entry.future.cancelled() or (task is not None and task.cancelling()):
+                    raise
+                # отменили первый запрос, не нас — генерируем сами
+
+        self.misses += 1
+        entry = self._entries[key] = _Entry(future=asyncio.get_running_loop().create_future())
+        try:
+            result = await produce()
+        except BaseException as e:
+            self._entries.pop(key, None)
+            if isinstance(e, Exception):
+                entry.future.set_exception(e)
+                entry.future.exception()  # ждущих может не быть — не шумим в лог
+            else:
+                entry.future.cancel()
+            raise
+        entry.future.set_result(result)
+        entry.expires_at = time.monotonic() + ttl
+        return result, False
+
+    def render(self) -> list[str]:
+        name = "wearai_generation_memo_total"
+        lines = [
+            f"# HELP {name} Image generation requests by memo outcome",
+            f"# TYPE {name} counter",
+        ]
+        for result, value in (
+            ("miss", self.misses),
+            ("hit_inflight", self.hits_inflight),
+            ("hit_cached", self.hits_cached),
+        ):
+            lines.append(f'{name}{{result="{result}"}} {value}')
+        return lines
+
+
+generation_memo = GenerationMemo()
+register(generation_memo)
@@ -13,6 +13,9 @@ import httpx
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.utils.metrics import timed_stage
+from app.utils.tracing import annotate
+
 
 @dataclass(frozen=True)
 class PhotoSettingsDTO:
@@ -23,6 +26,10 @@ class PhotoSettingsDTO:
 
 DEFAULT_PHOTO_SETTINGS = PhotoSettingsDTO()
 
+# переопределяются для локальных заглушек (bench/)
+KIE_API_BASE = os.getenv("KIE_API_BASE", "https://api.kie.ai")
+KIE_UPLOAD_BASE = os.getenv("KIE_UPLOAD_BASE", "https://kieai.redpandaai.co")
+
 _ALLOWED_ASPECTS = {
     "1:1",
     "2:3",
@@ -190,8 +197,8 @@ class KieAIClient:
         self,
         api_key: str,
         *,
-        api_base: str = "https://api.kie.ai",
-        upload_base: str = "https://kieai.redpandaai.co",
+        api_base: str = KIE_API_BASE,
+        upload_base: str = KIE_UPLOAD_BASE,
         timeout_s: float = 60.0,
     ) -> None:
         if not api_key:
@@ -204,6 +211,7 @@ class KieAIClient:
     def _headers(self) -> dict[str, str]:
         return {"Authorization": f"Bearer {self.api_key}"}
 
+    @timed_stage("kie_upload")
     async def upload_image_bytes(
         self,
         *,
@@ -267,6 +275,7 @@ class KieAIClient:
 
             return dl
 
+    @timed_stage("kie_create_task")
     async def create_nano_banana_pro_task(
         self,
         *,
@@ -337,6 +346,7 @@ class KieAIClient:
             if not task_id:
                 raise KieAIError(f"createTask response has no taskId: {payload}")
 
+            annotate(kie_task_id=task_id)
             return task_id
 
     async def get_task(self, task_id: str) -> dict[str, Any]:
@@ -354,6 +364,7 @@ class KieAIClient:
 
             return payload
 
+    @timed_stage("kie_wait")
     async def wait_result_urls(
         self, task_id: str, *, max_wait_s: int = 600
     ) -> list[str]:
@@ -391,6 +402,7 @@ class KieAIClient:
 
         raise KieAIError(f"Task timeout after {max_wait_s}s (taskId={task_id})")
 
+    @timed_stage("result_download")
     async def download_bytes(self, url: str) -> bytes:
         async with httpx.AsyncClient(timeout=self.timeout) as client:
             resp = await client.get(url)
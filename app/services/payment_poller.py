@@ -3,18 +3,24 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from datetime import timedelta
 
 from aiogram import Bot
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.models.payment import PaymentStatus
-from app.repository.extra import get_plan
+from app.models.payment import Payment, PaymentStatus
 from app.repository.payments import (
+    claim_payment_status,
+    confirm_payment,
+    expire_stale_pending_payments,
     get_pending_payments_batch,
-    mark_payment_status,
-    apply_plan_to_user,
+    schedule_next_payment_check,
+)
+from app.services.platega import (
+    PlategaClient,
+    get_platega_client,
+    normalize_payment_status,
 )
-from app.services.platega import build_platega_client, normalize_payment_status
 
 logger = logging.getLogger(__name__)
 
@@ -34,32 +40,130 @@ def _payment_tg_id(p) -> int | None:
     )
 
 
+async def _check_payment(
+    *,
+    bot: Bot,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    client: PlategaClient,
+    p: Payment,
+) -> None:
+    """
+    Проверка одного платежа в своей сессии (проверки идут параллельно).
+    """
+    tg_id = _payment_tg_id(p)
+    if not tg_id:
+        logger.error(
+            "payment_poller: payment has no tg_id field payment_id=%s tx_id=%s attrs=%s",
+            getattr(p, "id", None),
+            getattr(p, "platega_transaction_id", None),
+            sorted(list(getattr(p, "__dict__", {}).keys())),
+        )
+        # без переноса строка с пустым/прошедшим next_check_at стояла бы в
+        # начале каждой пачки (nulls_first) до истечения — до 24ч
+        async with sessionmaker() as session:
+            await schedule_next_payment_check(session, p)
+        return
+
+    try:
+        raw_status = await client.get_transaction_status(p.platega_transaction_id)
+    except Exception:
+        logger.exception(
+            "payment_poller: status request failed payment_id=%s tx_id=%s",
+            p.id,
+            p.platega_transaction_id,
+        )
+        raw_status = None
+    status = normalize_payment_status(raw_status)
+
+    logger.info(
+        "payment_poller: check payment_id=%s tx_id=%s tg_id=%s attempts=%s raw_status=%s normalized=%s",
+        p.id,
+        p.platega_transaction_id,
+        tg_id,
+        p.check_attempts,
+        raw_status,
+        status,
+    )
+
+    async with sessionmaker() as session:
+        if status == "CONFIRMED":
+            applied = await confirm_payment(session, p, tg_id)
+            if applied is None:
+                # уже подтвердили в другом месте (кнопка / /start pay_ok)
+                return
+
+            try:
+                await bot.send_message(
+                    tg_id,
+                    "✅ Оплата подтверждена! Пакет активирован 🎉"
+                    if applied
+                    else "✅ Оплата получена, но пакет не активировался автоматически. Напиши в поддержку — разберёмся 💬",
+                )
+            except Exception:
+                logger.exception(
+                    "payment_poller: failed to notify tg_user_id=%s payment_id=%s",
+                    tg_id,
+                    p.id,
+                )
+
+        elif status in {"CANCELED", "CHARGEBACK"}:
+            await claim_payment_status(session, p, PaymentStatus(status))
+            await session.commit()
+
+        else:
+            # PENDING / None / неизвестно — следующая проверка по backoff
+            await schedule_next_payment_check(session, p)
+
+
 async def run_payment_poller(
     *,
     bot: Bot,
     sessionmaker: async_sessionmaker[AsyncSession],
     interval_sec: int = 20,
     batch_size: int = 50,
+    concurrency: int = 8,
+    expire_after_hours: int = 24,
 ) -> None:
     """
     Polling подтверждений платежей (без вебхуков):
-    - каждые interval_sec секунд берём batch_size платежей со статусом PENDING
-    - проверяем в Platega статус транзакции
+    - брошенные PENDING старше expire_after_hours -> EXPIRED
+    - берём до batch_size PENDING платежей, у которых подошёл next_check_at
+    - проверяем в Platega параллельно (не больше concurrency запросов одновременно)
     - при CONFIRMED: начисляем пакет, помечаем CONFIRMED, уведомляем пользователя
     - при CANCELED/CHARGEBACK: помечаем соответствующий статус
+    - иначе: откладываем следующую проверку (backoff по возрасту платежа)
+    Если пачка пришла полной — сразу берём следующую, не дожидаясь interval_sec.
     """
-    client = None
+    client: PlategaClient | None = None
+    sem = asyncio.Semaphore(max(1, concurrency))
+    expire_after = timedelta(hours=expire_after_hours)
     logger.info(
-        "payment_poller: started interval_sec=%s batch_size=%s",
+        "payment_poller: started interval_sec=%s batch_size=%s concurrency=%s expire_after_hours=%s",
         interval_sec,
         batch_size,
+        concurrency,
+        expire_after_hours,
     )
 
+    async def _guarded(p: Payment) -> None:
+        async with sem:
+            try:
+                await _check_payment(
+                    bot=bot, sessionmaker=sessionmaker, client=client, p=p
+                )
+            except Exception:
+                logger.exception(
+                    "payment_poller: error while processing payment_id=%s tx_id=%s",
+                    getattr(p, "id", None),
+                    getattr(p, "platega_transaction_id", None),
+                )
+
     while True:
+        pending: list[Payment] = []
         try:
             if client is None:
                 try:
-                    client = build_platega_client()
+                    client = get_platega_client()
                 except Exception:
                     logger.exception(
                         "payment_poller: platega client init failed (missing env?)"
@@ -68,79 +172,19 @@ async def run_payment_poller(
                     continue
 
             async with sessionmaker() as session:
+                await expire_stale_pending_payments(session, older_than=expire_after)
                 pending = await get_pending_payments_batch(session, limit=batch_size)
 
-                if pending:
-                    logger.info("payment_poller: pending_count=%s", len(pending))
-
-                for p in pending:
-                    try:
-                        tg_id = _payment_tg_id(p)
-                        if not tg_id:
-                            logger.error(
-                                "payment_poller: payment has no tg_id field payment_id=%s tx_id=%s attrs=%s",
-                                getattr(p, "id", None),
-                                getattr(p, "platega_transaction_id", None),
-                                sorted(list(getattr(p, "__dict__", {}).keys())),
-                            )
-                            continue
-
-                        raw_status = await client.get_transaction_status(
-                            p.platega_transaction_id
-                        )
-                        status = normalize_payment_status(raw_status)
-
-                        logger.info(
-                            "payment_poller: check payment_id=%s tx_id=%s tg_id=%s raw_status=%s normalized=%s",
-                            p.id,
-                            p.platega_transaction_id,
-                            tg_id,
-                            raw_status,
-                            status,
-                        )
-
-                        if status == "CONFIRMED":
-                            plan = await get_plan(session, p.plan_name)
-                            if plan:
-                                await apply_plan_to_user(session, tg_id, plan)
-                            else:
-                                logger.error(
-                                    "payment_poller: plan not found plan_name=%s payment_id=%s",
-                                    p.plan_name,
-                                    p.id,
-                                )
-
-                            await mark_payment_status(
-                                session, p, PaymentStatus.CONFIRMED
-                            )
-
-                            try:
-                                await bot.send_message(
-                                    tg_id,
-                                    "✅ Оплата подтверждена! Пакет активирован 🎉",
-                                )
-                            except Exception:
-                                logger.exception(
-                                    "payment_poller: failed to notify tg_user_id=%s payment_id=%s",
-                                    tg_id,
-                                    p.id,
-                                )
-
-                        elif status in {"CANCELED", "CHARGEBACK"}:
-                            await mark_payment_status(session, p, PaymentStatus(status))
-
-                        else:
-                            # PENDING / None / неизвестно — ничего не делаем
-                            pass
-
-                    except Exception:
-                        logger.exception(
-                            "payment_poller: error while processing payment_id=%s tx_id=%s",
-                            getattr(p, "id", None),
-                            getattr(p, "platega_transaction_id", None),
-                        )
+            if pending:
+                logger.info("payment_poller: due_count=%s", len(pending))
+                await asyncio.gather(*(_guarded(p) for p in pending))
 
         except Exception:
             logger.exception("payment_poller: loop error (session/batch)")
 
+        if len(pending) >= batch_size:
+            # backlog: добираем следующую пачку почти сразу
+            await asyncio.sleep(1)
+            continue
+
         await asyncio.sleep(interval_sec)
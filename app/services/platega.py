@@ -2,11 +2,14 @@
 from __future__ import annotations
 
 import json
+import logging
 import os
 from dataclasses import dataclass
 
 import httpx
 
+logger = logging.getLogger(__name__)
+
 PAID_STATUSES = {
     "CONFIRMED",
     "PAID",
@@ -36,8 +39,15 @@ class PlategaConfig:
 
 
 class PlategaClient:
-    def __init__(self, cfg: PlategaConfig) -> None:
+    """
+    Один httpx.AsyncClient на процесс: keep-alive соединения переиспользуются
+    между проверками статусов (раньше на каждый запрос был новый TLS-хендшейк).
+    """
+
+    def __init__(self, cfg: PlategaConfig, *, max_connections: int = 20) -> None:
         self.cfg = cfg
+        self._max_connections = max_connections
+        self._http: httpx.AsyncClient | None = None
 
     def _headers(self) -> dict[str, str]:
         return {
@@ -46,6 +56,22 @@ class PlategaClient:
             "X-Secret": self.cfg.secret,
         }
 
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=20,
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                ),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
     async def create_payment_link(
         self,
         *,
@@ -65,24 +91,38 @@ class PlategaClient:
             "payload": json.dumps(payload, ensure_ascii=False),
         }
 
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.post(url, headers=self._headers(), json=body)
+        r = await self._client().post(url, headers=self._headers(), json=body)
         r.raise_for_status()
         return r.json()
 
     async def get_transaction_status(self, tx_id: str) -> str | None:
         url = f"{self.cfg.base_url.rstrip('/')}/transaction/{tx_id}"
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(
-                url,
-                headers={
-                    "X-MerchantId": self.cfg.merchant_id,
-                    "X-Secret": self.cfg.secret,
-                },
-            )
+        r = await self._client().get(
+            url,
+            headers={
+                "X-MerchantId": self.cfg.merchant_id,
+                "X-Secret": self.cfg.secret,
+            },
+        )
         if r.status_code != 200:
+            logger.warning(
+                "platega.get_transaction_status: non-200 status_code=%s tx_id=%s body=%s",
+                r.status_code,
+                tx_id,
+                (r.text or "")[:500],
+            )
             return None
-        data = r.json() or {}
+
+        try:
+            data = r.json() or {}
+        except Exception:
+            logger.exception(
+                "platega.get_transaction_status: invalid json tx_id=%s body=%s",
+                tx_id,
+                (r.text or "")[:500],
+            )
+            return None
+
         status = data.get("status")
         if not status and isinstance(data.get("transaction"), dict):
             status = data["transaction"].get("status")
@@ -119,3 +159,24 @@ def build_platega_client() -> PlategaClient:
         raise RuntimeError("PLATEGA_MERCHANT_ID / PLATEGA_SECRET are required")
     # return_url/failed_url можно оставить пустыми, если тебе не важен редирект
     return PlategaClient(cfg)
+
+
+_shared_client: PlategaClient | None = None
+
+
+def get_platega_client() -> PlategaClient:
+    """
+    Общий (пуловый) клиент для poller'а и хендлеров.
+    Бросает RuntimeError, если Platega не настроена (как build_platega_client).
+    """
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = build_platega_client()
+    return _shared_client
+
+
+async def close_platega_client() -> None:
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
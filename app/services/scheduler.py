@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db import session_factory
+from app.repository.scheduled_jobs import (
+    ClaimedJob,
+    add_job,
+    claim_jobs,
+    delete_jobs,
+    extend_lease,
+    finish_job,
+    get_upcoming_jobs,
+    retry_job,
+)
+from app.utils.cron import next_cron_run, parse_cron
+from app.utils.tracing import current_trace_id, span, use_trace
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Scheduler:
+    """
+    Один планировщик на процесс вместо sleep-задачи на каждого пользователя:
+    - задачи хранятся в scheduled_jobs (переживают рестарт)
+    - ближайшие (в пределах horizon_sec) держим в heap и спим до первой
+    - перед запуском задачу «арендуем» (locked_until): упал процесс посреди
+      выполнения — после истечения lease задача запустится снова (at-least-once),
+      поэтому обработчики должны быть идемпотентными; пока обработчик работает,
+      lease продлевается (долгая задача не берётся повторно параллельно)
+    - одноразовые / периодические (interval_sec) / по cron (5 полей, МСК)
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        lease_sec: int = 900,
+        max_attempts: int = 5,
+    ) -> None:
+        self._sessionmaker = sessionmaker
+        self._lease = timedelta(seconds=lease_sec)
+        self._max_attempts = max(1, max_attempts)
+        self._handlers: dict[str, JobHandler] = {}
+
+        self._heap: list[tuple[datetime, int]] = []
+        self._queued: dict[int, datetime] = {}  # job_id -> run_at актуальной записи heap
+        self._horizon = timedelta(seconds=60)
+        self._wakeup = asyncio.Event()
+        self._refresh_requested = True
+        self._running = False
+        self._inflight: set[asyncio.Task] = set()
+        self._completed: list[tuple[ClaimedJob, datetime | None]] = []
+
+        self.done = 0
+        self.failed = 0
+
+    # ---- регистрация и постановка задач ----
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def schedule(
+        self,
+        kind: str,
+        *,
+        delay_sec: float = 0,
+        run_at: datetime | None = None,
+        key: str | None = None,
+        payload: dict[str, Any] | None = None,
+    ) -> int | None:
+        """
+        Одноразовая задача. С key повторная постановка — no-op (None).
+        trace_id текущего апдейта уходит в payload — задача продолжит его трейс.
+        """
+        run_at = run_at or _utcnow() + timedelta(seconds=delay_sec)
+        trace_id = current_trace_id()
+        if trace_id:
+            payload = {**(payload or {}), "trace_id": trace_id}
+        async with self._sessionmaker() as session:
+            job_id = await add_job(
+                session, kind=kind, run_at=run_at, key=key, payload=payload
+            )
+            await session.commit()
+        if job_id is not None:
+            self._push(job_id, run_at)
+        return job_id
+
+    async def schedule_recurring(
+        self,
+        kind: str,
+        *,
+        interval_sec: int | None = None,
+        cron: str | None = None,
+        key: str | None = None,
+        payload: dict[str, Any] | None = None,
+        run_now: bool = False,
+    ) -> int | None:
+        """
+        Периодическая задача (ровно одна на key, по умолчанию "recurring:<kind>").
+        Уже существующая сохраняет свой run_at — рестарт не сдвигает расписание;
+        изменились interval_sec / cron — run_at пересчитывается по новому;
+        run_now=True — прогон сразу и у существующей (на каждом старте).
+        """
+        if bool(interval_sec) == bool(cron):
+            raise ValueError("exactly one of interval_sec / cron is required")
+        if cron:
+            parse_cron(cron)  # ошибка в выражении — сразу при старте
+
+        now = _utcnow()
+        if run_now:
+            first_run = now
+        elif cron:
+            first_run = next_cron_run(cron, now)
+        else:
+            first_run = now + timedelta(seconds=int(interval_sec or 0))
+
+        async with self._sessionmaker() as session:
+            job_id = await add_job(
+                session,
+                kind=kind,
+                run_at=first_run,
+                key=key or f"recurring:{kind}",
+                payload=payload,
+                interval_sec=interval_sec or None,
+                cron=cron or None,
+                replace=True,
+                run_now=run_now,
+            )
+            await session.commit()
+        self._request_refresh()
+        return job_id
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._running,
+            "queued": len(self._queued),
+            "inflight": len(self._inflight),
+            "done": self.done,
+            "failed": self.failed,
+        }
+
+    # ---- внутреннее ----
+
+    def _push(self, job_id: int, run_at: datetime) -> None:
+        if run_at > _utcnow() + self._horizon:
+            return  # подтянется из БД при очередном refresh
+        if self._queued.get(job_id) == run_at:
+            return
+        self._queued[job_id] = run_at
+        heapq.heappush(self._heap, (run_at, job_id))
+        self._wakeup.set()
+
+    def _request_refresh(self) -> None:
+        self._refresh_requested = True
+        self._wakeup.set()
+
+    async def _refresh(self) -> None:
+        now = _utcnow()
+        async with self._sessionmaker() as session:
+            upcoming = await get_upcoming_jobs(
+                session, until=now + self._horizon, now=now
+            )
+        for job_id, run_at in upcoming:
+            self._push(job_id, run_at)
+
+    def _next_run(self, job: ClaimedJob, now: datetime) -> datetime | None:
+        if job.cron:
+            return next_cron_run(job.cron, now)
+        if job.interval_sec:
+            return now + timedelta(seconds=int(job.interval_sec))
+        return None
+
+    async def _execute(self, job: ClaimedJob) -> None:
+        try:
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                raise LookupError(f"no handler registered for kind={job.kind}")
+            with use_trace(
+                job.payload.get("trace_id"),
+                tg_id=job.payload.get("tg_id"),
+                kind=f"job:{job.kind}",
+            ), span(f"job:{job.kind}", attempt=job.attempts):
+                await handler(job.payload)
+        except asyncio.CancelledError:
+            # shutdown: lease истечёт, задача выполнится после рестарта
+            raise
+        except Exception as e:
+            self.failed += 1
+            await self._on_failure(job, e)
+            return
+
+        # фиксация успеха — пачкой в следующем _sync (вместе с арендой новых)
+        self._completed.append((job, self._next_run(job, _utcnow())))
+
+    async def _on_failure(self, job: ClaimedJob, error: Exception) -> None:
+        now = _utcnow()
+        next_run = self._next_run(job, now)
+        if job.attempts >= self._max_attempts:
+            logger.error(
+                "scheduler: job gave up id=%s kind=%s key=%s attempts=%s",
+                job.id,
+                job.kind,
+                job.key,
+                job.attempts,
+                exc_info=error,
+            )
+            async with self._sessionmaker() as session:
+                # одноразовую удаляем, периодическую — на следующий плановый запуск
+                await finish_job(session, job.id, next_run_at=next_run)
+                await session.commit()
+            if next_run is not None:
+                self._push(job.id, next_run)
+            return
+
+        retry_at = now + timedelta(seconds=min(30 * 2 ** (job.attempts - 1), 3600))
+        if next_run is not None:
+            retry_at = min(retry_at, next_run)
+        logger.warning(
+            "scheduler: job failed id=%s kind=%s attempt=%s retry_at=%s err=%r",
+            job.id,
+            job.kind,
+            job.attempts,
+            retry_at.isoformat(),
+            error,
+        )
+        async with self._sessionmaker() as session:
+            await retry_job(session, job.id, run_at=retry_at, error=repr(error))
+            await session.commit()
+        self._push(job.id, retry_at)
+
+    async def _keep_lease(self, job_id: int) -> None:
+        # продлеваем с запасом: три попытки до истечения текущей аренды
+        period = self._lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(period)
+            try:
+                async with self._sessionmaker() as session:
+                    await extend_lease(
+                        session, job_id, lease_until=_utcnow() + self._lease
+                    )
+                    await session.commit()
+            except Exception:
+                logger.warning(
+                    "scheduler: lease renewal failed job_id=%s", job_id, exc_info=True
+                )
+
+    async def _start(self, job: ClaimedJob) -> None:
+        keeper = asyncio.create_task(self._keep_lease(job.id))
+        try:
+            await self._execute(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # ошибка самого планировщика (БД) — lease истечёт, будет повтор
+            logger.exception("scheduler: execute failed job_id=%s", job.id)
+        finally:
+            # дожидаемся: продление не должно закоммититься после finish/retry
+            keeper.cancel()
+            await asyncio.gather(keeper, return_exceptions=True)
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        self._wakeup.set()  # освободилось место — можно запускать следующие
+
+    async def _sync(self, capacity: int) -> None:
+        """
+        Одна транзакция на тик: фиксируем завершённые задачи (DELETE одноразовых,
+        перенос периодических) и арендуем наступившие (не больше capacity).
+        """
+        completed, self._completed = self._completed, []
+        now = _utcnow()
+        job_ids: list[int] = []
+        while self._heap and self._heap[0][0] <= now and len(job_ids) < capacity:
+            run_at, job_id = heapq.heappop(self._heap)
+            if self._queued.get(job_id) != run_at:
+                continue  # устаревшая запись heap
+            del self._queued[job_id]
+            job_ids.append(job_id)
+        if not completed and not job_ids:
+            return
+
+        try:
+            async with self._sessionmaker() as session:
+                await delete_jobs(
+                    session, [job.id for job, next_run in completed if next_run is None]
+                )
+                for job, next_run in completed:
+                    if next_run is not None:
+                        await finish_job(session, job.id, next_run_at=next_run)
+                jobs = await claim_jobs(
+                    session, job_ids, now=now, lease_until=now + self._lease
+                )
+                await session.commit()
+        except Exception:
+            # завершённые попробуем зафиксировать в следующий тик,
+            # снятые с heap подтянет refresh (аренды не было)
+            self._completed[:0] = completed
+            raise
+
+        self.done += len(completed)
+        for job, next_run in completed:
+            if next_run is not None:
+                self._push(job.id, next_run)
+
+        for job in jobs:
+            task = asyncio.create_task(self._start(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._on_task_done)
+
+    async def _sync_shielded(self, capacity: int) -> None:
+        # отмена run() не должна обрывать транзакцию посреди UPDATE/COMMIT
+        step = asyncio.ensure_future(self._sync(capacity))
+        try:
+            await asyncio.shield(step)
+        except asyncio.CancelledError:
+            await asyncio.gather(step, return_exceptions=True)
+            raise
+
+    async def run(
+        self,
+        *,
+        horizon_sec: float = 60.0,
+        concurrency: int = 32,
+        shutdown_grace_sec: float = 10.0,
+    ) -> None:
+        self._horizon = timedelta(seconds=horizon_sec)
+        concurrency = max(1, concurrency)
+        loop = asyncio.get_running_loop()
+        next_refresh = 0.0
+
+        logger.info(
+            "scheduler: started horizon_sec=%s concurrency=%s kinds=%s",
+            horizon_sec,
+            concurrency,
+            ",".join(sorted(self._handlers)),
+        )
+        self._running = True
+        try:
+            while True:
+                self._wakeup.clear()
+
+                if self._refresh_requested or loop.time() >= next_refresh:
+                    self._refresh_requested = False
+                    try:
+                        await self._refresh()
+                    except Exception:
+                        logger.exception("scheduler: refresh failed")
+                    next_refresh = loop.time() + horizon_sec / 2
+
+                try:
+                    await self._sync_shielded(max(concurrency - len(self._inflight), 0))
+                except Exception:
+                    logger.exception("scheduler: sync failed")
+
+                timeout = max(next_refresh - loop.time(), 0.0)
+                if self._completed:
+                    timeout = 0.0
+                elif self._heap and len(self._inflight) < concurrency:
+                    due_in = (self._heap[0][0] - _utcnow()).total_seconds()
+                    timeout = min(timeout, max(due_in, 0.0))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._running = False
+            # даём текущим задачам доработать, остальные отменяем (lease -> повтор)
+            inflight = list(self._inflight)
+            if inflight:
+                _, pending = await asyncio.wait(inflight, timeout=shutdown_grace_sec)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            try:
+                await self._sync(0)  # зафиксировать то, что успело завершиться
+            except Exception:
+                logger.exception("scheduler: final sync failed")
+
+
+scheduler = Scheduler(session_factory)
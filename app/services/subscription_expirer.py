@@ -2,57 +2,32 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from datetime import datetime, timedelta, timezone, time as dtime
+import time
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select
+from sqlalchemy import DateTime, Integer, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.models.subscription import Subscription
 from app.models.user_subscription import UserSubscription
+from app.repository import stats
+from app.repository.plans import BASE_PLAN, PlanInfo, get_plan_by_name, plan_catalog
+from app.services.scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
-# UTC+3
-TZ_MSK = timezone(timedelta(hours=3))
-
-
-def _seconds_until_next_run(now_utc: datetime) -> int:
-    """
-    Следующий запуск: 00:01 по UTC+3
-    """
-    if now_utc.tzinfo is None:
-        now_utc = now_utc.replace(tzinfo=timezone.utc)
-
-    now_msk = now_utc.astimezone(TZ_MSK)
-    target_time = dtime(hour=0, minute=1, second=0)
-
-    target_msk = datetime.combine(now_msk.date(), target_time, tzinfo=TZ_MSK)
-    if now_msk >= target_msk:
-        target_msk = target_msk + timedelta(days=1)
-
-    target_utc = target_msk.astimezone(timezone.utc)
-    delta = target_utc - now_utc
-    sec = int(delta.total_seconds())
-    return max(sec, 1)
-
-
-async def _get_base_subscription(session: AsyncSession) -> Subscription | None:
+async def _get_base_subscription(session: AsyncSession) -> PlanInfo | None:
     """
-    Базовая подписка = план с именем "Base".
+    Базовая подписка = план с именем "Base" (из каталога планов).
     Если его нет — берём самый первый план по id.
     """
-    base = await session.scalar(
-        select(Subscription).where(Subscription.name == "Base").limit(1)
-    )
+    base = await get_plan_by_name(session, BASE_PLAN)
     if base:
         return base
     logger.warning("subscription_expirer: base plan 'Base' not found, fallback to first")
-    return await session.scalar(
-        select(Subscription).order_by(Subscription.id.asc()).limit(1)
-    )
+    return plan_catalog().first()
 
 
-def _calc_expires_at(now_utc: datetime, plan: Subscription) -> datetime:
+def _calc_expires_at(now_utc: datetime, plan: PlanInfo) -> datetime:
     days = int(getattr(plan, "duration_days", 0) or 0)
     if days > 0:
         return now_utc + timedelta(days=days)
@@ -61,107 +36,144 @@ def _calc_expires_at(now_utc: datetime, plan: Subscription) -> datetime:
 
 
 async def expire_subscriptions_once(
-    session: AsyncSession, *, batch_size: int = 500
+    session: AsyncSession,
+    *,
+    batch_size: int = 500,
+    base: PlanInfo | None = None,
 ) -> int:
     """
-    Один прогон:
-    - находим все активные подписки (status=1) у которых expires_at <= now
-    - деактивируем (status=0)
-    - создаём новую активную базовую подписку
-    Возвращает: сколько пользователей обработали
+    Один чанк (одна транзакция), без загрузки ORM-объектов:
+    - UPDATE ... SET status=0 для не более batch_size истёкших активных подписок
+      (RETURNING id — так знаем, какие именно строки погасили)
+    - INSERT ... SELECT новой активной базовой подписки для их пользователей
+    - COMMIT
+    Возвращает: сколько подписок погасили в этом чанке
     """
     now_utc = datetime.now(timezone.utc)
 
-    base = await _get_base_subscription(session)
+    if base is None:
+        base = await _get_base_subscription(session)
     if not base:
         logger.error("subscription_expirer: base subscription not found in DB")
         return 0
 
-    # берём пачку истёкших активных подписок
-    q = await session.execute(
-        select(UserSubscription)
+    due_ids = (
+        select(UserSubscription.id)
         .where(UserSubscription.status == 1)
         .where(UserSubscription.expires_at <= now_utc)
         .order_by(UserSubscription.id.asc())
         .limit(batch_size)
     )
-    expired_list = list(q.scalars().all())
 
-    if not expired_list:
-        return 0
-
-    logger.info(
-        "subscription_expirer: found_expired=%s base_plan=%s",
-        len(expired_list),
-        base.name,
+    # 1) гасим пачку одним UPDATE
+    res = await session.execute(
+        update(UserSubscription)
+        .where(UserSubscription.id.in_(due_ids))
+        .values(status=0)
+        .returning(UserSubscription.id)
     )
+    expired_ids = [int(x) for x in res.scalars().all()]
+    if not expired_ids:
+        await session.rollback()
+        return 0
 
+    # 2) выдаём базовую (новой строкой — так сохраняется история) одним INSERT…SELECT
     expires_base = _calc_expires_at(now_utc, base)
-
-    processed = 0
-    for us in expired_list:
-        # 1) деактивируем текущую
-        us.status = 0
-
-        # 2) выдаём базовую (новой строкой — так сохраняется история)
-        session.add(
-            UserSubscription(
-                user_id=us.user_id,
-                subscription_id=base.id,
-                expires_at=expires_base,
-                remaining_video=int(base.video_generations or 0),
-                remaining_photo=int(base.photo_generations or 0),
-                status=1,
+    await session.execute(
+        insert(UserSubscription).from_select(
+            [
+                "user_id",
+                "subscription_id",
+                "expires_at",
+                "remaining_video",
+                "remaining_photo",
+                "status",
+            ],
+            select(
+                UserSubscription.user_id,
+                literal(int(base.id), Integer),
+                literal(expires_base, DateTime(timezone=True)),
+                literal(int(base.video_generations or 0), Integer),
+                literal(int(base.photo_generations or 0), Integer),
+                literal(1, Integer),
             )
+            .where(UserSubscription.id.in_(expired_ids))
+            .distinct(),
         )
-        processed += 1
+    )
 
+    # active_subs не меняется: погасили одну активную — выдали одну базовую
+    await stats.bump_daily(session, stats.SUBS_EXPIRED, len(expired_ids))
     await session.commit()
-    logger.info("subscription_expirer: processed=%s committed", processed)
-    return processed
+    return len(expired_ids)
 
 
-async def run_subscription_expirer(
-    *,
-    sessionmaker: async_sessionmaker[AsyncSession],
-    batch_size: int = 500,
-) -> None:
+async def expire_due_subscriptions(
+    session: AsyncSession, *, batch_size: int = 500
+) -> int:
     """
-    Бесконечный цикл:
-    - ждём до 00:01 UTC+3
-    - прогоняем expire_subscriptions_once (в цикле, пока есть пачки)
-    - снова ждём до следующего дня
+    Полный прогон: гасим истёкшие подписки чанками по batch_size,
+    каждый чанк — отдельная короткая транзакция (не держим write-lock долго).
+    Логируем скорость в строках/сек.
     """
-    logger.info("subscription_expirer: started (runs daily at 00:01 UTC+3)")
+    base = await _get_base_subscription(session)
+    if not base:
+        logger.error("subscription_expirer: base subscription not found in DB")
+        return 0
 
+    started = time.perf_counter()
+    total = 0
+    chunks = 0
     while True:
-        now_utc = datetime.now(timezone.utc)
-        sleep_sec = _seconds_until_next_run(now_utc)
-
-        next_run_utc = now_utc + timedelta(seconds=sleep_sec)
+        cnt = await expire_subscriptions_once(
+            session, batch_size=batch_size, base=base
+        )
+        total += cnt
+        if cnt:
+            chunks += 1
+        if cnt < batch_size:
+            break
+        # отдаём event loop (и write-lock) другим задачам между чанками
+        await asyncio.sleep(0)
+
+    if total:
+        elapsed = max(time.perf_counter() - started, 1e-6)
         logger.info(
-            "subscription_expirer: next_run_in=%ss at_utc=%s",
-            sleep_sec,
-            next_run_utc.isoformat(),
+            "subscription_expirer: expired=%s chunks=%s base_plan=%s elapsed=%.3fs rows_per_sec=%.1f",
+            total,
+            chunks,
+            base.name,
+            elapsed,
+            total / elapsed,
         )
+    return total
+
+
+EXPIRER_JOB = "subscription_expirer"
+# ежедневный режим, как раньше: 00:01 по UTC+3
+EXPIRER_DAILY_CRON = "1 0 * * *"
 
-        await asyncio.sleep(sleep_sec)
-
-        try:
-            total = 0
-            async with sessionmaker() as session:
-                # если истёкших много — обработаем несколькими пачками
-                while True:
-                    cnt = await expire_subscriptions_once(
-                        session, batch_size=batch_size
-                    )
-                    total += cnt
-                    if cnt < batch_size:
-                        break
-
-            logger.info(
-                "subscription_expirer: daily_run_done total_processed=%s", total
+
+def register_expirer_job(sessionmaker: async_sessionmaker[AsyncSession]) -> None:
+    async def _job(payload: dict) -> None:
+        async with sessionmaker() as session:
+            await expire_due_subscriptions(
+                session, batch_size=int(payload.get("batch_size") or 500)
             )
 
-        except Exception:
-            logger.exception("subscription_expirer: error during daily run")
+    scheduler.register(EXPIRER_JOB, _job)
+
+
+async def schedule_subscription_expirer(
+    *, batch_size: int = 500, interval_sec: int = 0
+) -> None:
+    """
+    interval_sec > 0 — прогон каждые interval_sec секунд,
+    0 — раз в сутки в 00:01 UTC+3.
+    """
+    await scheduler.schedule_recurring(
+        EXPIRER_JOB,
+        interval_sec=interval_sec or None,
+        cron=None if interval_sec > 0 else EXPIRER_DAILY_CRON,
+        payload={"batch_size": batch_size},
+    )
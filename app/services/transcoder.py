@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Модуль импортируется и в дочерних процессах пула (spawn) — здесь только
+# stdlib и Pillow, никаких app.* с настройками/БД.
+
+Q_MAX = 90
+Q_MIN = 40
+MIN_SCALE = 0.25
+MAX_ENCODES = 8  # страховка: поиск почти всегда укладывается в 2–4
+GOOD_ENOUGH = 0.85  # ≥85% бюджета — качество выше уже не ищем
+SLOPE = 0.024  # d ln(размер) / d quality для Pillow JPEG в диапазоне 40–90
+
+
+def _encode(img: Image.Image, quality: int, scale: float) -> bytes:
+    if scale < 1.0:
+        w, h = img.size
+        img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def fit_jpeg_sync(
+    data: bytes, max_bytes: int, max_side: int | None = None
+) -> tuple[bytes, int]:
+    """
+    Перекодировать в JPEG не больше max_bytes за несколько кодирований.
+    ln(размер) почти линеен по quality, поэтому следующее качество не
+    «минус 10», а интерполяция в лог-шкале между уже известными точками
+    (первая оценка — по типичному наклону SLOPE). Ближе GOOD_ENOUGH к бюджету —
+    стоп. Не влезло даже на Q_MIN — уменьшаем: размер ~ площади,
+    scale = sqrt(бюджет / размер) с запасом.
+    max_side — сначала вписать в квадрат (превью: больше Telegram всё равно не покажет).
+    Возвращает (байты, сколько раз кодировали). Не влезло и на MIN_SCALE —
+    отдаём самый маленький вариант, решает вызывающий.
+    """
+    img = Image.open(BytesIO(data))
+    img = img.convert("RGB")
+    if max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    encodes = 0
+
+    def enc(q: int, s: float = 1.0) -> bytes:
+        nonlocal encodes
+        encodes += 1
+        return _encode(img, q, s)
+
+    out = enc(Q_MAX)
+    if len(out) <= max_bytes:
+        return out, encodes
+
+    target = math.log(max_bytes * 0.97)
+    hi, hi_log = Q_MAX, math.log(len(out))  # не влезает
+    lo, lo_log = 0, 0.0  # влезает (0 — ещё не нашли)
+    best: bytes | None = None
+    while encodes < MAX_ENCODES:
+        if lo:
+            q = lo + (hi - lo) * (target - lo_log) / max(1e-9, hi_log - lo_log)
+        else:
+            q = hi - (hi_log - target) / SLOPE
+        q = int(min(hi - 1, max(lo + 1, Q_MIN, q)))
+        cand = enc(q)
+        if len(cand) <= max_bytes:
+            best, lo, lo_log = cand, q, math.log(len(cand))
+            if len(cand) >= max_bytes * GOOD_ENOUGH or hi - lo <= 2:
+                return best, encodes
+        else:
+            hi, hi_log = q, math.log(len(cand))
+            if q <= Q_MIN:
+                break
+    if best is not None:
+        return best, encodes
+
+    # на Q_MIN не влезло — уменьшаем, качество среднее
+    q = Q_MIN + 20
+    size = math.exp(hi_log + SLOPE * (q - hi))  # оценка размера при q в полном размере
+    scale = 1.0
+    low = out
+    while encodes < MAX_ENCODES:
+        scale = max(MIN_SCALE, scale * math.sqrt(max_bytes / size) * 0.95)
+        low = enc(q, scale)
+        size = len(low)
+        if size <= max_bytes or scale <= MIN_SCALE:
+            break
+    return low, encodes
+
+
+def _noop() -> None:
+    return None
+
+
+class Transcoder:
+    """
+    Общий перекодировщик изображений в пуле процессов: Pillow держит CPU
+    (и GIL на части операций), на event loop — только ожидание future.
+    Пул создаётся при первом вызове; TRANSCODER_WORKERS — размер (по умолчанию
+    min(2, CPU)). spawn, а не fork: в основном процессе уже есть потоки
+    (логгер, watchdog loop_monitor).
+    """
+
+    def __init__(self, workers: int | None = None) -> None:
+        self._workers = workers or int(os.getenv("TRANSCODER_WORKERS", "0")) or min(2, os.cpu_count() or 1)
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def fit_jpeg(
+        self, data: bytes, max_bytes: int, *, max_side: int | None = None
+    ) -> bytes:
+        """
+        Уже влезает (и max_side не задан) — возвращаем как есть, без перекодирования.
+        """
+        if len(data) <= max_bytes and not max_side:
+            return data
+        loop = asyncio.get_running_loop()
+        try:
+            out, encodes = await loop.run_in_executor(
+                self._executor(), fit_jpeg_sync, data, max_bytes, max_side
+            )
+        except BrokenProcessPool:
+            # воркер упал (OOM на огромной картинке) — пул пересоздастся при следующем вызове
+            self._pool = None
+            raise
+        logger.info(
+            "transcoder.fit_jpeg: in=%s out=%s budget=%s encodes=%s",
+            len(data),
+            len(out),
+            max_bytes,
+            encodes,
+        )
+        return out
+
+    async def warm_up(self) -> None:
+        """
+        Поднять воркеры заранее (spawn + импорт Pillow — секунды),
+        чтобы первое превью после старта не ждало.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, _noop) for _ in range(self._workers))
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+transcoder = Transcoder()
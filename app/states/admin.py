@@ -5,6 +5,10 @@ class AdminAccessFSM(StatesGroup):
     waiting_user_id = State()
 
 
+class AdminUsersSearchFSM(StatesGroup):
+    query = State()
+
+
 class AdminPromoFSM(StatesGroup):
     code = State()
     kind = State()
@@ -12,3 +16,10 @@ class AdminPromoFSM(StatesGroup):
     video_count = State()
     max_uses = State()
     confirm = State()
+
+
+class AdminPromoBulkFSM(StatesGroup):
+    count = State()
+    photo_count = State()
+    video_count = State()
+    prefix = State()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
+import asyncio
 import logging
 
 from aiogram.types import (
@@ -10,8 +11,13 @@ from aiogram.types import (
     InputMediaPhoto,
 )
 
+from app.services.transcoder import transcoder
+
 logger = logging.getLogger(__name__)
 
+# статика не меняется — ужатые под лимит фото держим в памяти
+_fitted: dict[str, bytes] = {}
+
 
 def _content_dir() -> Path:
     return Path(__file__).resolve().parents[1] / "content"
@@ -36,8 +42,13 @@ async def send_content_photo(
         kwargs["parse_mode"] = parse_mode
 
     try:
-        path = _content_dir() / filename
-        data = path.read_bytes()
+        data = _fitted.get(filename)
+        if data is None:
+            path = _content_dir() / filename
+            data = await asyncio.to_thread(path.read_bytes)
+            if len(data) > TG_MAX_PHOTO_BYTES:
+                data = await transcoder.fit_jpeg(data, TG_MAX_PHOTO_BYTES)
+                _fitted[filename] = data
         file = BufferedInputFile(data, filename=filename)
         if len(data) > TG_MAX_PHOTO_BYTES:
             await message.answer_document(file, caption=caption, **kwargs)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+# по умолчанию cron считаем по Москве, как и остальные расписания бота
+TZ_MSK = timezone(timedelta(hours=3))
+
+_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),  # 0 = воскресенье, как в crontab
+)
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_field(raw: str, lo: int, hi: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in raw.split(","):
+        step = 1
+        if "/" in part:
+            part, step_raw = part.split("/", 1)
+            step = int(step_raw)
+            if step <= 0:
+                raise CronError(f"bad step: {raw}")
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if start < lo or end > hi or start > end:
+            raise CronError(f"out of range: {raw}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+def parse_cron(expr: str) -> tuple[frozenset[int], ...]:
+    """
+    Стандартные 5 полей crontab: "мин час день месяц день_недели".
+    Поддерживаются *, списки (1,5), диапазоны (1-5) и шаги (*/15).
+    """
+    parts = (expr or "").split()
+    if len(parts) != 5:
+        raise CronError(f"cron needs 5 fields: {expr!r}")
+    try:
+        return tuple(
+            _parse_field(raw, lo, hi) for raw, (_, lo, hi) in zip(parts, _FIELDS)
+        )
+    except ValueError as e:
+        raise CronError(f"bad cron {expr!r}: {e}") from e
+
+
+def next_cron_run(expr: str, after: datetime, *, tz: timezone = TZ_MSK) -> datetime:
+    """
+    Ближайший момент строго после after, подходящий под expr (в UTC).
+    """
+    minutes, hours, days, months, weekdays = parse_cron(expr)
+    t = after.astimezone(tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 5)
+    both_day_fields = len(days) < 31 and len(weekdays) < 7
+
+    while t < limit:
+        if t.month not in months:
+            # первое число следующего месяца
+            t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            continue
+        day_ok = t.day in days
+        weekday_ok = (t.weekday() + 1) % 7 in weekdays
+        # как в crontab: если заданы оба поля — достаточно совпадения любого
+        if both_day_fields:
+            matches_day = day_ok or weekday_ok
+        else:
+            matches_day = day_ok and weekday_ok
+        if not matches_day:
+            t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            continue
+        if t.hour not in hours:
+            t = (t + timedelta(hours=1)).replace(minute=0)
+            continue
+        if t.minute not in minutes:
+            t += timedelta(minutes=1)
+            continue
+        return t.astimezone(timezone.utc)
+
+    raise CronError(f"cron never fires: {expr!r}")
@@ -1,10 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import os
 import time
 import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from pathlib import Path
 
+import aiofiles
+import aiofiles.os
+
+from app.utils.metrics import register
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEEP_LAST = 20
+BLOBS_DIR = "blobs"
+
 
 def _root_dir() -> Path:
     # можно переопределить в .env: GENERATED_DIR=/abs/path
@@ -14,34 +29,307 @@ def _root_dir() -> Path:
     return Path.cwd() / "_generated"  # в корне проекта
 
 
-def save_generated_image_bytes(
+def _quota_bytes() -> int:
+    # общий лимит на весь _generated; 0 — без лимита
+    return int(float(os.getenv("GENERATED_QUOTA_MB", "2048")) * 1024 * 1024)
+
+
+def _orphan_ttl_sec() -> float:
+    # сколько держим файлы, найденные на диске после рестарта (ссылок на них
+    # в памяти нет, но кнопки «Оригинал» и payload'ы в чатах остались)
+    return float(os.getenv("GENERATED_ORPHAN_TTL_HOURS", "72")) * 3600
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass(slots=True)
+class _Blob:
+    path: Path
+    size: int
+    refs: int = 0
+    keep_until: float = 0.0  # сирота с прошлого запуска: без ссылок, но живёт до (time.time())
+
+
+def _scan_root(root: Path) -> list[tuple[str, Path, int, float]]:
+    """
+    Один обход root (в потоке): blobs/ и каталоги старого формата
+    <scenario>/<tg_id>/ — всё, что осталось с прошлых запусков.
+    Возвращает (ключ, путь, размер, mtime).
+    """
+    found: list[tuple[str, Path, int, float]] = []
+    if not root.is_dir():
+        return found
+    for dirpath, _, filenames in os.walk(root):
+        in_blobs = Path(dirpath).relative_to(root).parts[:1] == (BLOBS_DIR,)
+        for name in filenames:
+            path = Path(dirpath) / name
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            key = name.split(".", 1)[0] if in_blobs else f"legacy:{path}"
+            found.append((key, path, st.st_size, st.st_mtime))
+    return found
+
+
+def _unlink_all(paths: list[Path]) -> None:
+    for p in paths:
+        try:
+            p.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("generated_files: unlink failed path=%s err=%s", p, e)
+
+
+class GeneratedFileStore:
+    """
+    Результаты генераций на диске, адресация по содержимому:
+    root/blobs/ab/cd/<sha256>.<ext>. Одинаковые байты (повторная отправка,
+    оживление того же кадра) хранятся один раз.
+
+    Ссылки: у каждого владельца (сценарий, tg_id) — последние keep_last блобов
+    (из них собираются feedback/animate payload'ы). Блоб без ссылок удаляется
+    ближайшим sweep(). Сверх общего лимита GENERATED_QUOTA_MB вытесняются
+    давно не использованные блобы (LRU по сохранению/чтению) у всех
+    пользователей — читатели на этот случай уже умеют фолбэк
+    (file_id в Telegram / «сгенерируй заново»).
+
+    Индекс — в памяти; после рестарта старые файлы ничьи: первый sweep()
+    подхватывает их как сирот и держит GENERATED_ORPHAN_TTL_HOURS от mtime
+    (чтение продлевает) — «Оригинал» под уже отправленными превью и
+    дедупликация переживают деплой. Квота по-прежнему вытесняет их по LRU
+    первыми: найденное на диске старше сохранённого в этом процессе.
+    """
+
+    def __init__(self) -> None:
+        self._blobs: OrderedDict[str, _Blob] = OrderedDict()  # LRU: старые слева
+        self._owners: dict[tuple[str, int], deque[str]] = {}
+        self._writing: dict[str, asyncio.Event] = {}
+        self._deleting: dict[str, asyncio.Event] = {}  # вытеснены, unlink ещё идёт
+        self._known_dirs: set[Path] = set()
+        self._root_scanned = False
+        self._sweep_task: asyncio.Task[tuple[int, int]] | None = None
+        self.total_bytes = 0
+        self.files_written = 0
+        self.bytes_written = 0
+        self.dedup_hits = 0
+        self.files_deleted = 0
+        self.bytes_reclaimed = 0
+
+    def _blob_path(self, digest: str, ext: str) -> Path:
+        return _root_dir() / BLOBS_DIR / digest[:2] / digest[2:4] / f"{digest}{ext}"
+
+    async def save(
+        self,
+        *,
+        img_bytes: bytes,
+        filename: str,
+        scenario: str,
+        tg_id: int,
+        keep_last: int = DEFAULT_KEEP_LAST,
+    ) -> str:
+        # hashlib отпускает GIL — мегабайты хешируем в потоке
+        digest = await asyncio.to_thread(_sha256, img_bytes)
+
+        # тот же путь пишут или удаляют прямо сейчас — ждём: иначе unlink из
+        # sweep() может снести только что записанный заново файл
+        while True:
+            pending = self._writing.get(digest) or self._deleting.get(digest)
+            if pending is None:
+                break
+            await pending.wait()
+
+        blob = self._blobs.get(digest)
+        if blob is not None:
+            self.dedup_hits += 1
+            self._blobs.move_to_end(digest)
+            blob.refs += 1
+        else:
+            path = self._blob_path(digest, Path(filename).suffix or ".png")
+            blob = _Blob(path=path, size=len(img_bytes), refs=1)
+            self._blobs[digest] = blob  # сразу в индекс: sweep не тронет (refs=1)
+            self.total_bytes += blob.size
+            done = self._writing[digest] = asyncio.Event()
+            try:
+                await self._write(path, img_bytes)
+            except BaseException:
+                self._blobs.pop(digest, None)
+                self.total_bytes -= blob.size
+                raise
+            finally:
+                done.set()
+                self._writing.pop(digest, None)
+            self.files_written += 1
+            self.bytes_written += blob.size
+
+        self._add_ref((scenario, tg_id), digest, keep_last)
+        quota = _quota_bytes()
+        if quota and self.total_bytes > quota:
+            self._kick_sweep()
+        return os.path.abspath(blob.path)
+
+    async def _write(self, path: Path, data: bytes) -> None:
+        if path.parent not in self._known_dirs:
+            await aiofiles.os.makedirs(path.parent, exist_ok=True)
+            self._known_dirs.add(path.parent)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        async with aiofiles.open(tmp, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp, path)
+
+    def _add_ref(self, owner: tuple[str, int], digest: str, keep_last: int) -> None:
+        refs = self._owners.get(owner)
+        if refs is None:
+            refs = self._owners[owner] = deque()
+        refs.append(digest)
+        while len(refs) > keep_last:
+            old = self._blobs.get(refs.popleft())
+            if old is not None:
+                old.refs -= 1
+
+    async def read(self, path: str | Path) -> bytes:
+        """
+        Прочитать сохранённый результат (не на event loop) и отметить его
+        как недавно использованный. Нет файла — FileNotFoundError.
+        """
+        p = Path(path)
+        digest = p.name.split(".", 1)[0]
+        blob = self._blobs.get(digest)
+        if blob is not None:
+            self._blobs.move_to_end(digest)
+            if blob.keep_until:
+                blob.keep_until = max(blob.keep_until, time.time() + _orphan_ttl_sec())
+        async with aiofiles.open(p, "rb") as f:
+            return await f.read()
+
+    async def find(self, prefix: str) -> Path | None:
+        """
+        Блоб по префиксу sha256 (callback_data ограничена 64 байтами) —
+        листинг одного шард-каталога, работает и после рестарта.
+        """
+        if len(prefix) < 4:
+            return None
+        shard = _root_dir() / BLOBS_DIR / prefix[:2] / prefix[2:4]
+        matches = await asyncio.to_thread(lambda: sorted(shard.glob(f"{prefix}*")))
+        return matches[0] if matches else None
+
+    def _kick_sweep(self) -> None:
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self.sweep())
+
+    async def _scan_once(self) -> None:
+        if self._root_scanned:
+            return
+        found = await asyncio.to_thread(_scan_root, _root_dir())
+        self._root_scanned = True
+        scanned: OrderedDict[str, _Blob] = OrderedDict()
+        ttl = _orphan_ttl_sec()
+        for key, path, size, mtime in sorted(found, key=lambda e: e[3]):
+            if key in self._blobs or key in scanned or path.name.startswith("."):
+                continue
+            scanned[key] = _Blob(path=path, size=size, keep_until=mtime + ttl)
+            self.total_bytes += size
+        # найденное на диске старше всего, что сохранено в этом процессе
+        scanned.update(self._blobs)
+        self._blobs = scanned
+
+    async def sweep(self) -> tuple[int, int]:
+        """
+        Удалить блобы без ссылок (сироты — по истечении срока), затем —
+        LRU сверх квоты. Возвращает (файлов удалено, байт освобождено).
+        """
+        await self._scan_once()
+
+        now = time.time()
+        victims: dict[str, _Blob] = {}
+        for digest in [
+            d
+            for d, b in self._blobs.items()
+            if b.refs <= 0 and b.keep_until <= now and d not in self._writing
+        ]:
+            victims[digest] = self._blobs.pop(digest)
+        self.total_bytes -= sum(b.size for b in victims.values())
+
+        quota = _quota_bytes()
+        evicted_live = 0
+        if quota:
+            for digest in list(self._blobs):
+                if self.total_bytes <= quota:
+                    break
+                if digest in self._writing:
+                    continue
+                blob = self._blobs.pop(digest)
+                self.total_bytes -= blob.size
+                victims[digest] = blob
+                evicted_live += 1
+
+        reclaimed = sum(b.size for b in victims.values())
+        if victims:
+            deleting = {digest: asyncio.Event() for digest in victims}
+            self._deleting.update(deleting)
+            unlink = asyncio.ensure_future(
+                asyncio.to_thread(_unlink_all, [b.path for b in victims.values()])
+            )
+            # отпускаем save() только когда поток реально закончил unlink —
+            # даже если сам sweep() отменили посреди ожидания
+            unlink.add_done_callback(lambda _: self._release_deleting(deleting))
+            await asyncio.shield(unlink)
+        self.files_deleted += len(victims)
+        self.bytes_reclaimed += reclaimed
+        if evicted_live:
+            logger.info(
+                "generated_files: quota eviction evicted=%s total_bytes=%s quota=%s",
+                evicted_live,
+                self.total_bytes,
+                quota,
+            )
+        return len(victims), reclaimed
+
+    def _release_deleting(self, deleting: dict[str, asyncio.Event]) -> None:
+        for digest, event in deleting.items():
+            self._deleting.pop(digest, None)
+            event.set()
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        for name, kind, help_text, value in (
+            ("wearai_generated_files_written_total", "counter", "Generated blobs written to disk", self.files_written),
+            ("wearai_generated_bytes_written_total", "counter", "Bytes of generated blobs written", self.bytes_written),
+            ("wearai_generated_dedup_hits_total", "counter", "Saves served by an existing blob", self.dedup_hits),
+            ("wearai_generated_files_deleted_total", "counter", "Blobs removed (unreferenced or LRU)", self.files_deleted),
+            ("wearai_generated_bytes_reclaimed_total", "counter", "Bytes freed by the sweeper", self.bytes_reclaimed),
+            ("wearai_generated_bytes", "gauge", "Bytes currently stored", self.total_bytes),
+            ("wearai_generated_quota_bytes", "gauge", "Disk quota for generated blobs", _quota_bytes()),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return lines
+
+
+generated_store = GeneratedFileStore()
+register(generated_store)
+
+
+async def save_generated_image_bytes(
     *,
     img_bytes: bytes,
     filename: str,
     scenario: str,
     tg_id: int,
-    keep_last: int = 20,
+    keep_last: int = DEFAULT_KEEP_LAST,
 ) -> str:
     """
     Сохраняем изображение на диск и возвращаем абсолютный путь.
-    Храним последние keep_last файлов на пользователя/сценарий.
+    Ссылки держим на последние keep_last результатов пользователя/сценария.
     """
-    root = _root_dir()
-    out_dir = root / scenario / str(tg_id)
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    ext = Path(filename).suffix or ".png"
-    ts = int(time.time() * 1000)
-    out_name = f"{ts}_{uuid.uuid4().hex[:8]}{ext}"
-    out_path = out_dir / out_name
-    out_path.write_bytes(img_bytes)
-
-    # лёгкая чистка старых
-    try:
-        files = sorted(out_dir.glob("*"), key=lambda p: p.stat().st_mtime, reverse=True)
-        for p in files[keep_last:]:
-            p.unlink(missing_ok=True)
-    except Exception:
-        pass
+    return await generated_store.save(
+        img_bytes=img_bytes,
+        filename=filename,
+        scenario=scenario,
+        tg_id=tg_id,
+        keep_last=keep_last,
+    )
+
 
-    return str(out_path.resolve())
+async def read_generated_file(path: str | Path) -> bytes:
+    return await generated_store.read(path)
@@ -4,17 +4,25 @@ import asyncio
 import json
 import logging
 import mimetypes
+import os
 from dataclasses import dataclass
 from typing import Any, Optional
 
 import aiohttp
 
+from app.utils.metrics import stage_timer, timed_stage
+from app.utils.tracing import annotate
+
 logger = logging.getLogger(__name__)
 
-KIE_FILE_UPLOAD_URL = "https://kieai.redpandaai.co/api/file-stream-upload"
-KIE_CREATE_TASK_URL = "https://api.kie.ai/api/v1/jobs/createTask"
-KIE_TASK_INFO_URL = "https://api.kie.ai/api/v1/jobs/recordInfo"
-KIE_DOWNLOAD_URL = "https://api.kie.ai/api/v1/common/download-url"
+# базовые адреса переопределяются для локальных заглушек (bench/)
+_KIE_API_BASE = os.getenv("KIE_API_BASE", "https://api.kie.ai").rstrip("/")
+_KIE_UPLOAD_BASE = os.getenv("KIE_UPLOAD_BASE", "https://kieai.redpandaai.co").rstrip("/")
+
+KIE_FILE_UPLOAD_URL = f"{_KIE_UPLOAD_BASE}/api/file-stream-upload"
+KIE_CREATE_TASK_URL = f"{_KIE_API_BASE}/api/v1/jobs/createTask"
+KIE_TASK_INFO_URL = f"{_KIE_API_BASE}/api/v1/jobs/recordInfo"
+KIE_DOWNLOAD_URL = f"{_KIE_API_BASE}/api/v1/common/download-url"
 
 KLING_MODEL = "kling/v2-1-standard"
 
@@ -154,6 +162,7 @@ class KieKlingClient:
         }
         self._headers_auth = {"Authorization": f"Bearer {self.api_key}"}
 
+    @timed_stage("kie_upload")
     async def upload_image_bytes(
         self,
         image_bytes: bytes,
@@ -200,6 +209,7 @@ class KieKlingClient:
                 logger.info("KIE upload ok: downloadUrl=%s", download_url)
                 return str(download_url)
 
+    @timed_stage("kie_create_task")
     async def create_kling_task(
         self,
         prompt: str,
@@ -253,6 +263,7 @@ class KieKlingClient:
                     raise RuntimeError(f"KIE createTask: no taskId in payload={data}")
 
                 logger.info("KIE createTask ok: taskId=%s", task_id)
+                annotate(kie_task_id=str(task_id))
                 return str(task_id)
 
     async def get_task_result(self, task_id: str, timeout_s: int = 30) -> KieTaskResult:
@@ -296,6 +307,7 @@ class KieKlingClient:
                 logger.info("KIE task state: taskId=%s state=%s", task_id, state)
                 return KieTaskResult(state=state)
 
+    @timed_stage("kie_download_url")
     async def to_direct_download_url(self, url: str, timeout_s: int = 30) -> str:
         """
         Конвертирует kie.ai generated URL в прямой временный download URL (20 минут).
@@ -330,19 +342,23 @@ class KieKlingClient:
         loop = asyncio.get_running_loop()
         deadline = loop.time() + max_wait_s
 
-        while True:
-            if loop.time() > deadline:
-                logger.warning("KIE task timeout: taskId=%s", task_id)
-                return KieTaskResult(
-                    state="timeout", fail_msg="Timeout waiting for video generation"
-                )
+        # очередь + генерация на стороне KIE; timeout/fail не бросают исключение
+        with stage_timer("kie_wait") as stage:
+            while True:
+                if loop.time() > deadline:
+                    logger.warning("KIE task timeout: taskId=%s", task_id)
+                    stage.outcome = "timeout"
+                    return KieTaskResult(
+                        state="timeout", fail_msg="Timeout waiting for video generation"
+                    )
 
-            res = await self.get_task_result(task_id)
-            st = res.state.lower()
+                res = await self.get_task_result(task_id)
+                st = res.state.lower()
 
-            if st in {"success", "succeed", "done"}:
-                return res
-            if st in {"fail", "failed"}:
-                return res
+                if st in {"success", "succeed", "done"}:
+                    return res
+                if st in {"fail", "failed"}:
+                    stage.outcome = "kie_error"
+                    return res
 
-            await asyncio.sleep(poll_interval_s)
+                await asyncio.sleep(poll_interval_s)
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+from app.utils.tracing import TraceIdFilter
+
+# отладочные SELECT'ы на горячих путях (charge/refund, ANIMATE_DEBUG) —
+# только при DEBUG_QUERIES=1
+DEBUG_QUERIES = os.getenv("DEBUG_QUERIES", "0") == "1"
+
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+LOG_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+_listener: QueueListener | None = None
+
+
+def kv(**fields: Any) -> dict[str, Any]:
+    """
+    Структурные поля записи: logger.info("event", extra=kv(tg_id=1, ...)).
+    В строку превращаются в момент вызова (_LazyQueueHandler.prepare).
+    """
+    return {"kv": fields}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Обычный формат + " | k=v k=v" из extra=kv(...) и trace=... (TraceIdFilter).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        snapshot = getattr(record, "exc_snapshot", None)
+        if snapshot is not None and not record.exc_text:
+            # снимок из prepare(): str(исключения) уже взят, здесь только строки исходников
+            record.exc_text = "".join(snapshot.format()).rstrip("\n")
+        line = super().format(record)
+        pairs = getattr(record, "kv_text", None)
+        if pairs is None:
+            pairs = _render_kv(getattr(record, "kv", None))
+        trace_id = getattr(record, "trace_id", None)
+        if not pairs and not trace_id:
+            return line
+        if trace_id:
+            pairs = f"trace={trace_id} {pairs}".rstrip()
+        head, sep, tail = line.partition("\n")  # traceback — после полей
+        return f"{head} | {pairs}{sep}{tail}"
+
+
+def _render_kv(fields: dict[str, Any] | None) -> str:
+    return " ".join(f"{k}={_kv_value(v)}" for k, v in (fields or {}).items())
+
+
+def _kv_value(value: Any) -> str:
+    s = str(value)
+    if not s or any(ch in s for ch in " |=\n\""):
+        s = '"' + s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return s
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Для шумных логгеров пропускаем 1 из N записей уровня ниже WARNING.
+    rates: {"user_actions": 10} — каждая 10-я; WARNING+ не сэмплируются.
+    Счётчик, а не random: дёшево и предсказуемо.
+    """
+
+    def __init__(self, rates: dict[str, int]) -> None:
+        super().__init__()
+        self._rates = {name: n for name, n in rates.items() if n > 1}
+        self._counters: dict[str, int] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self._rates:
+            return True
+        n = self._rates.get(record.name)
+        if n is None:
+            return True
+        seen = self._counters.get(record.name, 0)
+        self._counters[record.name] = seen + 1
+        if seen % n == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+def parse_sample_rates(raw: str) -> dict[str, int]:
+    """
+    "user_actions=10,aiogram.event=5" -> {"user_actions": 10, "aiogram.event": 5}
+    """
+    rates: dict[str, int] = {}
+    for part in (raw or "").split(","):
+        name, sep, value = part.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            rates[name.strip()] = max(1, int(value))
+        except ValueError:
+            continue
+    return rates
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Стандартный QueueHandler.prepare() форматирует запись целиком в вызывающем
+    потоке — т.е. на event loop. Здесь в вызывающем потоке делаем только то,
+    что читает чужие объекты: msg % args, str() полей kv и исключения
+    (ORM-объекты и dict'ы, которые loop продолжает менять; ленивая загрузка
+    атрибута из чужого потока). Итоговую строку, строки исходников
+    трейсбека и вывод собирает поток QueueListener.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        fields = getattr(record, "kv", None)
+        if fields:
+            record.kv_text = _render_kv(fields)
+            record.kv = None
+        if record.exc_info and record.exc_info[1] is not None and not record.exc_text:
+            exc = record.exc_info[1]
+            # без чтения файлов: lookup_lines=False — строки подтянет форматтер
+            record.exc_snapshot = traceback.TracebackException(
+                type(exc), exc, exc.__traceback__, lookup_lines=False
+            )
+            record.exc_message = str(exc)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_log_pipeline(
+    *,
+    level: int = logging.INFO,
+    sample_rates: dict[str, int] | None = None,
+    queue_size: int = 10_000,
+) -> QueueListener:
+    """
+    Корневой логгер пишет только в очередь; вывод (stderr, репорт в Telegram)
+    выполняется фоновым потоком. Переполнена очередь — запись теряется,
+    event loop не блокируется.
+    """
+    global _listener
+
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=queue_size)
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(KeyValueFormatter(fmt=LOG_FORMAT, datefmt=LOG_DATEFMT))
+
+    queue_handler = _LazyQueueHandler(log_queue)
+    queue_handler.addFilter(TraceIdFilter())  # до сэмплинга: contextvar виден только здесь
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def attach_log_handler(handler: logging.Handler) -> None:
+    """
+    Добавить обработчик вывода. С пайплайном — в поток QueueListener,
+    без него (скрипты) — прямо на корневой логгер.
+    """
+    if _listener is None:
+        logging.getLogger().addHandler(handler)
+        return
+    # handlers — tuple; поток слушателя читает атрибут на каждой записи
+    _listener.handlers = (*_listener.handlers, handler)
+
+
+def stop_log_pipeline() -> None:
+    """
+    Дописать очередь и остановить поток (при shutdown).
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from types import FrameType
+
+from app.utils.metrics import _escape_label, register
+
+logger = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # .../app
+_ROOT_DIR = os.path.dirname(_APP_DIR)
+
+QUANTILES = (0.5, 0.9, 0.99)
+MAX_SITES = 50  # не раздуваем /metrics, если блокирующих мест много
+
+
+def _blocking_site(frame: FrameType | None) -> str:
+    """
+    Самый глубокий кадр нашего кода (app/) — его и чиним;
+    внутри библиотек (Pillow, pathlib) — только если своего кода в стеке нет.
+    """
+    deepest = None
+    f = frame
+    while f is not None:
+        code = f.f_code
+        where = f"{os.path.relpath(code.co_filename, _ROOT_DIR)}:{f.f_lineno} {code.co_name}"
+        if deepest is None:
+            deepest = where
+        if code.co_filename.startswith(_APP_DIR) and not code.co_filename.endswith("loop_monitor.py"):
+            return where
+        f = f.f_back
+    return deepest or "?"
+
+
+class LoopLagMonitor:
+    """
+    Задержка event loop: задача спит interval и меряет, на сколько проснулась позже.
+    Лаг бьёт по всем пользователям сразу, поэтому ловим и источник:
+    поток-сторож замечает, что тик не пришёл за block_threshold, и снимает стек
+    потока loop прямо в момент блокировки (sys._current_frames) — в лог уходит
+    та строка, которая держит loop (write_bytes, Pillow, open().read() ...).
+
+    asyncio_debug=True дополнительно включает loop.set_debug() и
+    slow_callback_duration (asyncio сам пишет "Executing ... took N seconds"
+    с местом создания callback) — дорого, только для разбора.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval_sec: float = 0.1,
+        block_threshold_sec: float = 0.25,
+        window: int = 3000,
+        asyncio_debug: bool = False,
+    ) -> None:
+        self.interval_sec = interval_sec
+        self.block_threshold_sec = block_threshold_sec
+        self.asyncio_debug = asyncio_debug
+
+        self._samples: deque[float] = deque(maxlen=window)  # ~5 мин при 100 мс
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self.blocked: Counter[str] = Counter()
+
+        self._last_tick = time.monotonic()
+        self._tick_no = 0
+        # (номер тика, место, стек) — сторож снял во время блокировки, тик допишет длительность
+        self._pending: tuple[int, str, str] | None = None
+
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop_thread_id = 0
+
+    # ---- loop-сторона ----
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.block_threshold_sec
+        self._task = asyncio.create_task(self._run(), name="loop_lag_monitor")
+        if self.block_threshold_sec > 0:
+            self._stop.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+        register(self)
+        logger.info(
+            "loop_monitor: started interval=%.3fs block_threshold=%.3fs asyncio_debug=%s",
+            self.interval_sec,
+            self.block_threshold_sec,
+            self.asyncio_debug,
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval_sec)
+            lag = max(0.0, loop.time() - started - self.interval_sec)
+            self._last_tick = time.monotonic()
+            self._tick_no += 1
+            self._observe(lag)
+
+    def _observe(self, lag: float) -> None:
+        self._samples.append(lag)
+        self._sum += lag
+        self._count += 1
+        self._max = max(self._max, lag)
+
+        pending, self._pending = self._pending, None
+        if pending is None or pending[0] != self._tick_no - 1:
+            return
+        _, site, stack = pending
+        if site in self.blocked or len(self.blocked) < MAX_SITES:
+            self.blocked[site] += 1
+        logger.warning(
+            "loop_monitor: event loop blocked %.0fms at %s\n%s",
+            lag * 1000,
+            site,
+            stack,
+        )
+
+    # ---- поток-сторож ----
+
+    def _watch(self) -> None:
+        reported_tick = -1
+        check_every = max(self.block_threshold_sec / 4, 0.01)
+        while not self._stop.wait(check_every):
+            tick = self._tick_no
+            stalled = time.monotonic() - self._last_tick - self.interval_sec
+            if stalled < self.block_threshold_sec or tick == reported_tick:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported_tick = tick
+            stack = "".join(traceback.format_stack(frame, limit=25))
+            self._pending = (tick, _blocking_site(frame), stack)
+            del frame
+
+    # ---- вывод ----
+
+    def percentiles(self) -> dict[float, float]:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def render(self) -> list[str]:
+        name = "wearai_event_loop_lag_seconds"
+        lines = [
+            f"# HELP {name} Event loop wake-up delay (quantiles over the recent window)",
+            f"# TYPE {name} summary",
+        ]
+        for q, v in self.percentiles().items():
+            lines.append(f'{name}{{quantile="{q:g}"}} {v:.6f}')
+        lines.append(f"{name}_sum {self._sum:.6f}")
+        lines.append(f"{name}_count {self._count}")
+        lines.append("# HELP wearai_event_loop_lag_max_seconds Max event loop lag since start")
+        lines.append("# TYPE wearai_event_loop_lag_max_seconds gauge")
+        lines.append(f"wearai_event_loop_lag_max_seconds {self._max:.6f}")
+
+        blocked = "wearai_event_loop_blocked_total"
+        lines.append(f"# HELP {blocked} Loop stalls above the threshold, by blocking call site")
+        lines.append(f"# TYPE {blocked} counter")
+        for site, n in self.blocked.most_common():
+            lines.append(f'{blocked}{{site="{_escape_label(site)}"}} {n}')
+        return lines
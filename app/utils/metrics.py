@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator, Protocol, TypeVar
+
+from aiohttp import web
+
+from app.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# секунды: от быстрых запросов к Telegram до ожидания видео в очереди KIE
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """
+    Минимальная гистограмма в формате Prometheus (без prometheus_client):
+    кумулятивные бакеты, _sum и _count на каждый набор меток.
+    Всё вызывается из event loop — без блокировок.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (не кумулятивные) + +Inf, sum]
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self._series[key] = series
+        counts, total = series
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, (counts, total) in sorted(self._series.items()):
+            base = ",".join(
+                f'{n}="{_escape_label(v)}"' for n, v in zip(self.labelnames, key)
+            )
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, cnt in zip(self.buckets, counts):
+                cumulative += cnt
+                lines.append(
+                    f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {cumulative}'
+                )
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total[0]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+GENERATION_STAGE_SECONDS = Histogram(
+    "wearai_generation_stage_seconds",
+    "Duration of a single generation stage",
+    ("scenario", "stage", "resolution", "outcome"),
+)
+GENERATION_SECONDS = Histogram(
+    "wearai_generation_seconds",
+    "End-to-end generation duration (KIE request to result sent)",
+    ("scenario", "resolution", "outcome"),
+)
+
+class Collector(Protocol):
+    def render(self) -> list[str]: ...
+
+
+_REGISTRY: list[Collector] = [GENERATION_SECONDS, GENERATION_STAGE_SECONDS]
+
+
+def register(collector: Collector) -> None:
+    """
+    Добавить метрику в вывод /metrics (loop_monitor и т.п.).
+    """
+    if collector not in _REGISTRY:
+        _REGISTRY.append(collector)
+
+
+# ---- метки текущей генерации ----
+
+
+@dataclass(slots=True)
+class GenerationLabels:
+    scenario: str
+    resolution: str = "-"
+    outcome: str = "ok"
+
+
+_current: ContextVar[GenerationLabels | None] = ContextVar(
+    "generation_labels", default=None
+)
+
+
+def set_generation_resolution(resolution: str) -> None:
+    labels = _current.get()
+    if labels is not None:
+        labels.resolution = resolution or "-"
+
+
+def current_generation_labels() -> GenerationLabels | None:
+    return _current.get()
+
+
+def _classify(exc: BaseException) -> str:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    name = type(exc).__name__
+    if "Timeout" in name:  # httpx.ReadTimeout, aiohttp ServerTimeoutError, ...
+        return "timeout"
+    if name.startswith("Kie"):
+        return "kie_error"
+    return "error"
+
+
+@contextmanager
+def generation_labels(scenario: str) -> Iterator[GenerationLabels]:
+    """
+    Только метки (без общего таймера) — для шагов сценария, разнесённых
+    по разным хендлерам (animate: загрузка фото и createTask).
+    """
+    labels = GenerationLabels(scenario=scenario)
+    token = _current.set(labels)
+    try:
+        yield labels
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def generation_timer(scenario: str) -> Iterator[GenerationLabels]:
+    """
+    Общее время генерации + метки для всех stage_timer внутри
+    (в т.ч. в KIE-клиентах и send-хелперах — через contextvar).
+    Исход: ok / timeout / kie_error / error по исключению;
+    без исключения хендлер может выставить labels.outcome сам.
+    """
+    labels = GenerationLabels(scenario=scenario)
+    token = _current.set(labels)
+    started = time.perf_counter()
+    try:
+        with span("generation", scenario=scenario) as sp:
+            try:
+                yield labels
+            finally:
+                if sp is not None and labels.outcome != "ok":
+                    sp.outcome = labels.outcome
+    except BaseException as e:
+        if labels.outcome == "ok":
+            labels.outcome = _classify(e)
+        raise
+    finally:
+        _current.reset(token)
+        GENERATION_SECONDS.observe(
+            time.perf_counter() - started,
+            scenario=labels.scenario,
+            resolution=labels.resolution,
+            outcome=labels.outcome,
+        )
+
+
+@dataclass(slots=True)
+class _Stage:
+    outcome: str = "ok"
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[_Stage]:
+    """
+    Время одного этапа (tg_download, kie_upload, kie_create_task, kie_wait,
+    result_download, tg_send) с метками текущей генерации.
+    Вне генерации scenario="-". Заодно — span в текущем трейсе.
+    """
+    st = _Stage()
+    started = time.perf_counter()
+    try:
+        with span(stage) as sp:
+            try:
+                yield st
+            finally:
+                if sp is not None and st.outcome != "ok":
+                    sp.outcome = st.outcome
+    except BaseException as e:
+        if st.outcome == "ok":
+            st.outcome = _classify(e)
+        raise
+    finally:
+        labels = _current.get()
+        GENERATION_STAGE_SECONDS.observe(
+            time.perf_counter() - started,
+            scenario=labels.scenario if labels else "-",
+            stage=stage,
+            resolution=labels.resolution if labels else "-",
+            outcome=st.outcome,
+        )
+
+
+def timed_stage(
+    stage: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Декоратор для async-функций: весь вызов — один этап stage_timer(stage).
+    """
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with stage_timer(stage):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---- HTTP /metrics ----
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner | None:
+    """
+    GET /metrics в текстовом формате Prometheus. port=0 — выключено.
+    По умолчанию слушаем только localhost: наружу — через scrape-прокси.
+    """
+    if port <= 0:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("metrics: listening on http://%s:%s/metrics", host, port)
+    return runner
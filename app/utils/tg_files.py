@@ -4,6 +4,8 @@ from typing import Dict, Tuple
 
 from aiogram import Bot
 
+from app.utils.metrics import stage_timer
+
 # (tg_id, file_id) -> bytes
 _TG_BYTES_CACHE: Dict[Tuple[int, str], bytes] = {}
 
@@ -19,9 +21,10 @@ async def tg_file_id_to_bytes(bot: Bot, file_id: str, *, tg_id: int) -> bytes:
     if key in _TG_BYTES_CACHE:
         return _TG_BYTES_CACHE[key]
 
-    file = await bot.get_file(file_id)
-    content = await bot.download_file(file.file_path)
-    data = content.read()
+    with stage_timer("tg_download"):
+        file = await bot.get_file(file_id)
+        content = await bot.download_file(file.file_path)
+        data = content.read()
 
     _TG_BYTES_CACHE[key] = data
     return data
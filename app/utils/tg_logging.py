@@ -1,87 +1,254 @@
 from __future__ import annotations
 
 import asyncio
+import html
 import logging
+import re
 import sys
+import threading
 import time
-from collections import deque
+from dataclasses import dataclass
 
 from aiogram import Bot
 
+from app.utils.log_pipeline import (
+    LOG_DATEFMT,
+    LOG_FORMAT,
+    KeyValueFormatter,
+    attach_log_handler,
+)
+
+# Telegram limit ~4096 chars
+_MAX_TEXT = 4000
+_MAX_GROUP_MESSAGE = 300  # текст группы в дайджесте (до экранирования)
+
+# переменные части сообщения -> плейсхолдеры, чтобы одна и та же ошибка
+# с разными tg_id / task_id / URL попадала в одну группу
+_NORMALIZERS = (
+    (re.compile(r"https?://\S+"), "<url>"),
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<uuid>"),
+    (re.compile(r"0x[0-9a-fA-F]+|\b[0-9a-fA-F]{16,}\b"), "<hex>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+)
+
+
+def normalize_message(message: str, *, limit: int = 200) -> str:
+    text = message.split("\n", 1)[0]
+    for pattern, repl in _NORMALIZERS:
+        text = pattern.sub(repl, text)
+    return text[:limit]
+
+
+def error_fingerprint(record: logging.LogRecord) -> tuple[str, str, str]:
+    """
+    (logger, тип исключения, нормализованное сообщение).
+    Без исключения — по сообщению; с исключением — добавляем и его текст,
+    т.к. logger.exception("... failed") часто одинаковый для разных причин.
+    """
+    exc_type = "-"
+    message = record.getMessage()
+    if record.exc_info and record.exc_info[1] is not None:
+        exc = record.exc_info[1]
+        exc_type = type(exc).__name__
+        # str(exc) снят ещё на event loop (log_pipeline._LazyQueueHandler.prepare)
+        message = f"{message}: {getattr(record, 'exc_message', None) or exc}"
+    return record.name, exc_type, normalize_message(message)
+
+
+@dataclass(slots=True)
+class _ErrorGroup:
+    count: int
+    first_seen: float
+    last_seen: float
+    sample: str  # первая запись группы за окно, уже отформатированная
+
 
 class TgErrorReporter(logging.Handler):
+    """
+    Работает в потоке QueueListener (см. app/utils/log_pipeline.py).
+    Ошибки группируются по fingerprint (logger, тип исключения, сообщение);
+    за окно window_sec копим счётчики, в конце окна — один дайджест в чат:
+    топ групп, количество, первое/последнее появление и пример первой.
+    Форматируем только первую запись каждой группы за окно.
+    """
+
     def __init__(
         self,
         *,
         bot: Bot,
         chat_id: int,
-        max_lines: int = 30,
-        cooldown_sec: int = 20,
+        loop: asyncio.AbstractEventLoop | None = None,
+        window_sec: float = 60.0,
+        top_n: int = 10,
+        max_groups: int = 500,
         ignore_loggers: set[str] | None = None,
         ignore_phrases: set[str] | None = None,
     ) -> None:
-        super().__init__(level=logging.INFO)
+        super().__init__(level=logging.ERROR)
         self._bot = bot
         self._chat_id = chat_id
-        self._buf: deque[str] = deque(maxlen=max_lines)
-        self._cooldown_sec = cooldown_sec
-        self._last_sent = 0.0
+        self._loop = loop
+        self._window_sec = window_sec
+        self._top_n = top_n
+        self._max_groups = max_groups
         self._ignore_loggers = ignore_loggers or set()
         self._ignore_phrases = ignore_phrases or set()
 
+        # пишет поток логгера, забирает (flush) event loop
+        self._lock = threading.Lock()
+        self._groups: dict[tuple[str, str, str], _ErrorGroup] = {}
+        self._overflow = 0  # ошибки сверх max_groups групп
+        self._window_started: float | None = None
+
     def emit(self, record: logging.LogRecord) -> None:
         try:
-            line = self.format(record)
-            self._buf.append(line)
-
-            if record.levelno < logging.ERROR:
-                return
-
-            if record.name in self._ignore_loggers:
+            if record.levelno < logging.ERROR or record.name in self._ignore_loggers:
                 return
-            if any(p in line for p in self._ignore_phrases):
+            fp = error_fingerprint(record)
+            if any(p in fp[2] or p in record.getMessage() for p in self._ignore_phrases):
                 return
 
             now = time.time()
-            if now - self._last_sent < self._cooldown_sec:
-                return
+            with self._lock:
+                group = self._groups.get(fp)
+                if group is not None:
+                    group.count += 1
+                    group.last_seen = now
+                    return
+                if len(self._groups) >= self._max_groups:
+                    self._overflow += 1
+                    return
+                open_window = self._window_started is None
+                if open_window:
+                    self._window_started = now
 
-            self._last_sent = now
-            self._schedule_send(line)
+            # новая группа: форматируем один раз (с трейсбеком) вне lock
+            sample = self.format(record)
+            with self._lock:
+                group = self._groups.get(fp)
+                if group is None:
+                    self._groups[fp] = _ErrorGroup(1, now, now, sample)
+                else:
+                    group.count += 1
+                    group.last_seen = now
+
+            if open_window:
+                self._schedule_flush()
         except Exception:
             # Don't break logging on reporter failure.
             pass
 
-    def _schedule_send(self, headline: str) -> None:
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
+    def _schedule_flush(self) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
             return
+        loop.call_soon_threadsafe(loop.call_later, self._window_sec, self._flush)
 
-        async def _send() -> None:
-            tail = "\n".join(self._buf)
-            text = f"❗️Ошибка:\n{headline}\n\nПоследние логи:\n{tail}"
-            # Telegram limit ~4096 chars
-            if len(text) > 4000:
-                text = text[-4000:]
-            try:
-                await self._bot.send_message(self._chat_id, text)
-            except Exception:
-                pass
+    def _take_window(self) -> tuple[dict[tuple[str, str, str], _ErrorGroup], int, float | None]:
+        with self._lock:
+            groups, self._groups = self._groups, {}
+            overflow, self._overflow = self._overflow, 0
+            started, self._window_started = self._window_started, None
+        return groups, overflow, started
 
-        loop.create_task(_send())
+    def _flush(self) -> None:
+        groups, overflow, started = self._take_window()
+        if not groups:
+            return
+        text = self.render_digest(groups, overflow=overflow, started=started)
+        self._loop.create_task(self._send(text))
+
+    def render_digest(
+        self,
+        groups: dict[tuple[str, str, str], _ErrorGroup],
+        *,
+        overflow: int = 0,
+        started: float | None = None,
+    ) -> str:
+        total = sum(g.count for g in groups.values()) + overflow
+        ranked = sorted(groups.items(), key=lambda kv: (-kv[1].count, kv[1].first_seen))
+        since = _hms(started) if started else "?"
+
+        lines = [
+            f"❗️<b>Ошибки</b> с {since}: всего {total}, групп {len(groups)}",
+            "",
+        ]
+        shown = 0
+        used = len(lines[0]) + 200  # запас под строки «ещё …»
+        for (name, exc_type, message), g in ranked[: self._top_n]:
+            if len(message) > _MAX_GROUP_MESSAGE:
+                message = message[:_MAX_GROUP_MESSAGE] + "…"
+            entry = (
+                f"<b>×{g.count}</b> {html.escape(name)} · {html.escape(exc_type)}\n"
+                f"{html.escape(message)}\n"
+                f"<i>{_hms(g.first_seen)} – {_hms(g.last_seen)}</i>"
+            )
+            if used + len(entry) + 1 > _MAX_TEXT:
+                break
+            lines.append(entry)
+            used += len(entry) + 1
+            shown += 1
+        rest = len(ranked) - shown
+        if rest > 0:
+            lines.append(f"… ещё групп: {rest}")
+        if overflow:
+            lines.append(f"… без группировки (лимит групп): {overflow}")
+
+        head = "\n".join(lines)
+        # пример самой частой ошибки — сколько влезет (хвост трейсбека важнее)
+        # считаем по уже экранированному тексту и HTML не режем — иначе
+        # Telegram отвергнет разметку и дайджест молча потеряется
+        wrapper = "\n\nПример:\n<pre></pre>"
+        room = _MAX_TEXT - len(head) - len(wrapper)
+        if room > 200:
+            sample = _tail_escaped(ranked[0][1].sample, room)
+            head += f"\n\nПример:\n<pre>{sample}</pre>"
+        return head
+
+    async def _send(self, text: str) -> None:
+        try:
+            await self._bot.send_message(self._chat_id, text)
+        except Exception:
+            pass
+
+
+def _tail_escaped(text: str, room: int) -> str:
+    """
+    html.escape(text), от которого оставлен хвост не длиннее room;
+    сущность &…; на границе не разрезаем.
+    """
+    escaped = html.escape(text)
+    if len(escaped) <= room:
+        return escaped
+    cut = len(escaped) - (room - 1)  # 1 — под «…»
+    amp = escaped.rfind("&", max(0, cut - 8), cut)
+    if amp != -1 and ";" not in escaped[amp:cut]:
+        cut = escaped.index(";", cut) + 1
+    return "…" + escaped[cut:]
+
+
+def _hms(ts: float) -> str:
+    return time.strftime("%H:%M:%S", time.localtime(ts))
 
 
 def install_tg_error_logging(
     *,
     bot: Bot,
     chat_id: int,
+    window_sec: float = 60.0,
     logger: logging.Logger | None = None,
 ) -> None:
     logger = logger or logging.getLogger()
+    try:
+        running_loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
     handler = TgErrorReporter(
         bot=bot,
         chat_id=chat_id,
+        loop=running_loop,
+        window_sec=window_sec,
         ignore_loggers={"aiogram.dispatcher"},
         ignore_phrases={
             "Failed to fetch updates - TelegramNetworkError",
@@ -90,12 +257,9 @@ def install_tg_error_logging(
             "Bad Gateway",
         },
     )
-    formatter = logging.Formatter(
-        fmt="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    formatter = KeyValueFormatter(fmt=LOG_FORMAT, datefmt=LOG_DATEFMT)
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    attach_log_handler(handler)
 
     def _excepthook(exc_type, exc, tb) -> None:
         logger.exception("Unhandled exception", exc_info=(exc_type, exc, tb))
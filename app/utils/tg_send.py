@@ -1,35 +1,139 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
 
+import aiohttp
+from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.types import BufferedInputFile, Message
+from aiogram.types import (
+    BufferedInputFile,
+    InputMediaDocument,
+    InputMediaPhoto,
+    Message,
+    URLInputFile,
+)
+
+from app.keyboards.result import original_kb, originals_kb
+from app.services.transcoder import transcoder
+from app.utils.generated_files import save_generated_image_bytes
+from app.utils.metrics import stage_timer, timed_stage
 
 logger = logging.getLogger(__name__)
 
 TG_MAX_PHOTO_BYTES = 10_485_760  # 10 MB
+TG_MEDIA_GROUP_MAX = 10
+
+# превью вместо полного файла: RESULT_PREVIEW=0 — слать оригинал как раньше
+RESULT_PREVIEW = os.getenv("RESULT_PREVIEW", "1") == "1"
+PREVIEW_MAX_BYTES = int(os.getenv("RESULT_PREVIEW_MAX_KB", "800")) * 1024
+PREVIEW_MAX_SIDE = 2560  # больше Telegram в фото всё равно не хранит
+ORIGINAL_TOKEN_LEN = 32  # hex sha256: "orig:" + 32 — в лимит callback_data (64 байта)
+
+# отправка по ссылке: результат у KIE забирает сам Telegram, бот байты не гоняет.
+# RESULT_SEND_BY_URL=0 — всегда скачиваем и загружаем сами
+SEND_BY_URL = os.getenv("RESULT_SEND_BY_URL", "1") == "1"
+TG_URL_MAX_PHOTO_BYTES = 5 * 1024 * 1024  # лимиты Bot API на отправку по URL
+TG_URL_MAX_FILE_BYTES = 20 * 1024 * 1024
+_URL_PHOTO_TYPES = frozenset({"image/jpeg", "image/png"})
+PROBE_TIMEOUT_SEC = 10
+VIDEO_STREAM_TIMEOUT_SEC = 240
+
+# «Оригинал» для отправленных по ссылке: токен -> (url, имя файла); в памяти,
+# после рестарта кнопка честно отвечает «удалён»
+_ORIGINAL_URLS_MAX = 5000
+_original_urls: OrderedDict[str, tuple[str, str]] = OrderedDict()
+
+
+@dataclass(slots=True)
+class SentImage:
+    message: Message
+    filename: str
+    local_path: str = ""  # копия в хранилище генераций (keep_copy=True), иначе ""
+
+    def output_file(self) -> dict[str, str] | None:
+        """Запись для output_files в feedback payload."""
+        if self.message.photo:
+            return {"kind": "photo", "file_id": self.message.photo[-1].file_id, "filename": self.filename}
+        if self.message.document:
+            return {"kind": "document", "file_id": self.message.document.file_id, "filename": self.filename}
+        return None
+
+
+async def _photo_payload(
+    img_bytes: bytes, *, filename: str, scenario: str, chat_id: int
+) -> tuple[BufferedInputFile, str | None] | None:
+    """
+    Что отправить фотографией: (файл, токен «Оригинала» или None).
+    Большой результат (> RESULT_PREVIEW_MAX_KB) — JPEG-превью, полный файл
+    в хранилище генераций, уходит документом по кнопке. Иначе / без превью:
+    больше 10MB — ужимаем в JPEG под лимит (пул процессов).
+    None — фото не получилось, слать документом.
+    """
+    stem = Path(filename).stem or "image"
+    if RESULT_PREVIEW and len(img_bytes) > PREVIEW_MAX_BYTES:
+        try:
+            with stage_timer("preview_encode"):
+                preview = await transcoder.fit_jpeg(img_bytes, PREVIEW_MAX_BYTES, max_side=PREVIEW_MAX_SIDE)
+            path = await save_generated_image_bytes(
+                img_bytes=img_bytes,
+                filename=filename,
+                scenario=scenario,
+                tg_id=chat_id,
+            )
+            token = Path(path).name[:ORIGINAL_TOKEN_LEN]
+            return BufferedInputFile(preview, filename=f"{stem}.jpg"), token
+        except Exception as e:
+            logger.warning("send_image_smart: preview failed, sending full file=%s err=%s", filename, e)
+
+    if len(img_bytes) <= TG_MAX_PHOTO_BYTES:
+        return BufferedInputFile(img_bytes, filename=filename), None
+    try:
+        photo_bytes = await transcoder.fit_jpeg(img_bytes, TG_MAX_PHOTO_BYTES)
+    except Exception as e:
+        logger.warning("send_image_smart: transcode failed file=%s err=%s", filename, e)
+        return None
+    if len(photo_bytes) > TG_MAX_PHOTO_BYTES:
+        return None
+    return BufferedInputFile(photo_bytes, filename=f"{stem}.jpg"), None
 
 
+@timed_stage("tg_send")
 async def send_image_smart(
-    message: Message, *, img_bytes: bytes, filename: str, caption: str | None = None
+    message: Message,
+    *,
+    img_bytes: bytes,
+    filename: str,
+    caption: str | None = None,
+    scenario: str = "result",
 ) -> Message:
     """
-    Если <= 10MB — photo, иначе document.
+    Фото по правилам _photo_payload (превью + «Оригинал» / ужатие под 10MB);
+    не вышло или Telegram отказал — document с оригиналом.
     Всегда возвращает Message (что реально отправили).
     """
-    size = len(img_bytes)
-
-    if size <= TG_MAX_PHOTO_BYTES:
+    payload = await _photo_payload(
+        img_bytes, filename=filename, scenario=scenario, chat_id=message.chat.id
+    )
+    if payload is not None:
+        photo, token = payload
         try:
             return await message.answer_photo(
-                BufferedInputFile(img_bytes, filename=filename),
+                photo,
                 caption=caption,
+                reply_markup=original_kb(token) if token else None,
             )
         except TelegramBadRequest as e:
             logger.warning(
                 "sendPhoto failed, fallback to document. file=%s size=%d err=%s",
                 filename,
-                size,
+                len(img_bytes),
                 e,
             )
 
@@ -37,3 +141,304 @@ async def send_image_smart(
         BufferedInputFile(img_bytes, filename=filename),
         caption=caption,
     )
+
+
+async def _probe(url: str) -> tuple[int | None, str]:
+    """
+    HEAD без скачивания: (размер, content-type). Не ответил / без длины —
+    (None, ...), такой URL Telegram'у не отдаём.
+    """
+    try:
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT_SEC)
+        ) as session:
+            async with session.head(url, allow_redirects=True) as resp:
+                if resp.status != 200:
+                    return None, ""
+                return resp.content_length, resp.content_type
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.info("tg_send.probe: failed url=%s err=%s", url, e)
+        return None, ""
+
+
+@timed_stage("result_download")
+async def download_result(url: str, timeout_s: int = 180) -> bytes:
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout_s)
+    ) as session:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+
+def remember_original_url(url: str, filename: str) -> str:
+    token = hashlib.sha256(url.encode()).hexdigest()[:ORIGINAL_TOKEN_LEN]
+    _original_urls[token] = (url, filename)
+    _original_urls.move_to_end(token)
+    while len(_original_urls) > _ORIGINAL_URLS_MAX:
+        _original_urls.popitem(last=False)
+    return token
+
+
+def original_url(token: str) -> tuple[str, str] | None:
+    return _original_urls.get(token)
+
+
+def _fits_url_photo(size: int | None, content_type: str) -> bool:
+    return size is not None and size <= TG_URL_MAX_PHOTO_BYTES and content_type in _URL_PHOTO_TYPES
+
+
+def _url_original_token(url: str, filename: str, size: int) -> str | None:
+    # Telegram сам ужмёт фото — оригинал по кнопке, как у превью
+    if RESULT_PREVIEW and size > PREVIEW_MAX_BYTES:
+        return remember_original_url(url, filename)
+    return None
+
+
+async def _send_photo_by_url(
+    message: Message, *, url: str, filename: str, caption: str | None
+) -> Message | None:
+    size, content_type = await _probe(url)
+    if not _fits_url_photo(size, content_type):
+        return None
+    token = _url_original_token(url, filename, size)
+    markup = original_kb(token) if token else None
+    try:
+        with stage_timer("tg_send"):
+            return await message.answer_photo(url, caption=caption, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # не смог скачать / не понравились размеры — отправим сами
+        logger.warning("send_image_url: by-url rejected size=%s err=%s", size, e)
+        return None
+
+
+def _consume_error(task: asyncio.Task[bytes]) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+def _start_download(url: str) -> asyncio.Task[bytes]:
+    task = asyncio.create_task(download_result(url))
+    task.add_done_callback(_consume_error)
+    return task
+
+
+async def send_image_url(
+    message: Message,
+    *,
+    url: str,
+    filename: str,
+    caption: str | None = None,
+    scenario: str = "result",
+    keep_copy: bool = False,
+) -> SentImage:
+    """
+    Результат генерации по ссылке KIE. В лимитах Telegram на фото по URL
+    (≤5MB, jpeg/png по HEAD) — отдаём ссылку; иначе или при отказе Telegram —
+    скачиваем и send_image_smart (превью/ужатие/документ).
+    keep_copy — файл нужен дальше (feedback, оживление): качаем параллельно
+    с отправкой и кладём в хранилище генераций, путь — в local_path.
+    """
+    download: asyncio.Task[bytes] | None = None
+
+    def fetch() -> asyncio.Task[bytes]:
+        nonlocal download
+        if download is None:
+            download = _start_download(url)
+        return download
+
+    if keep_copy or not SEND_BY_URL:
+        fetch()
+    try:
+        sent = None
+        if SEND_BY_URL:
+            sent = await _send_photo_by_url(message, url=url, filename=filename, caption=caption)
+        if sent is None:
+            sent = await send_image_smart(
+                message,
+                img_bytes=await fetch(),
+                filename=filename,
+                caption=caption,
+                scenario=scenario,
+            )
+    except BaseException:
+        if download is not None:
+            download.cancel()
+        raise
+
+    local_path = ""
+    if keep_copy:
+        try:
+            local_path = await save_generated_image_bytes(
+                img_bytes=await fetch(),
+                filename=filename,
+                scenario=scenario,
+                tg_id=message.chat.id,
+            )
+        except Exception as e:
+            # пользователь результат уже получил; дальше читатели уйдут в фолбэк
+            logger.warning("send_image_url: local copy failed url=%s err=%s", url, e)
+    return SentImage(message=sent, filename=filename, local_path=local_path)
+
+
+async def send_video_url(
+    bot: Bot,
+    chat_id: int,
+    *,
+    url: str,
+    filename: str,
+    caption: str | None = None,
+) -> Message:
+    """
+    Видео-результат: ≤20MB и video/* — ссылкой, качает Telegram.
+    Иначе — URLInputFile: aiogram читает чанками и сразу отдаёт в upload,
+    целиком в памяти бота файл не лежит.
+    """
+    if SEND_BY_URL:
+        size, content_type = await _probe(url)
+        if size is not None and size <= TG_URL_MAX_FILE_BYTES and content_type.startswith("video/"):
+            try:
+                with stage_timer("tg_send"):
+                    return await bot.send_video(
+                        chat_id=chat_id,
+                        video=url,
+                        caption=caption,
+                        supports_streaming=True,
+                    )
+            except TelegramBadRequest as e:
+                logger.warning("send_video_url: by-url rejected size=%s err=%s", size, e)
+
+    with stage_timer("tg_send"):
+        return await bot.send_video(
+            chat_id=chat_id,
+            video=URLInputFile(url, filename=filename, timeout=VIDEO_STREAM_TIMEOUT_SEC),
+            caption=caption,
+            supports_streaming=True,
+        )
+
+
+async def _send_group(message: Message, items: list[InputMediaPhoto | InputMediaDocument]) -> list[Message]:
+    if len(items) == 1:
+        # альбом из одного — обычное сообщение
+        item = items[0]
+        if isinstance(item, InputMediaPhoto):
+            return [await message.answer_photo(item.media)]
+        return [await message.answer_document(item.media)]
+    return await message.answer_media_group(items)
+
+
+async def send_result_images(
+    message: Message,
+    *,
+    results: Sequence[tuple[str, str]],
+    scenario: str = "result",
+    keep_copy: bool = False,
+) -> list[SentImage]:
+    """
+    Все картинки результата, (filename, url) от KIE. Одна — send_image_url.
+    Несколько — альбомом: один sendMediaGroup на 10 штук вместо запроса
+    на каждую (и меньше упираемся в лимиты чата). Фото по ссылке — как в
+    send_image_url, остальные скачиваются параллельно и готовятся
+    _photo_payload; что фото не стало — отдельной группой документов
+    (в альбоме фото с документами не смешать). Кнопки к альбому не
+    прикрепить — «Оригиналы» одним сообщением следом.
+    Telegram отказал альбому — досылаем оставшиеся по одной.
+    Возвращает SentImage в порядке results.
+    """
+    if len(results) == 1:
+        filename, url = results[0]
+        return [
+            await send_image_url(
+                message, url=url, filename=filename, scenario=scenario, keep_copy=keep_copy
+            )
+        ]
+
+    downloads: dict[int, asyncio.Task[bytes]] = {}
+
+    def fetch(i: int) -> asyncio.Task[bytes]:
+        if i not in downloads:
+            downloads[i] = _start_download(results[i][1])
+        return downloads[i]
+
+    sent: dict[int, Message] = {}
+    groups = 0
+    try:
+        if SEND_BY_URL:
+            probes = await asyncio.gather(*(_probe(url) for _, url in results))
+        else:
+            probes = [(None, "")] * len(results)
+        for i, (size, content_type) in enumerate(probes):
+            if keep_copy or not _fits_url_photo(size, content_type):
+                fetch(i)
+
+        photos: list[tuple[int, InputMediaPhoto]] = []
+        documents: list[tuple[int, InputMediaDocument]] = []
+        originals: list[tuple[int, str]] = []
+        for i, ((filename, url), (size, content_type)) in enumerate(zip(results, probes)):
+            token: str | None
+            if _fits_url_photo(size, content_type):
+                photos.append((i, InputMediaPhoto(media=url)))
+                token = _url_original_token(url, filename, size)
+            else:
+                img_bytes = await fetch(i)
+                payload = await _photo_payload(
+                    img_bytes, filename=filename, scenario=scenario, chat_id=message.chat.id
+                )
+                if payload is None:
+                    documents.append(
+                        (i, InputMediaDocument(media=BufferedInputFile(img_bytes, filename=filename)))
+                    )
+                    continue
+                photo, token = payload
+                photos.append((i, InputMediaPhoto(media=photo)))
+            if token:
+                originals.append((i + 1, token))
+
+        try:
+            with stage_timer("tg_send"):
+                for group in (photos, documents):
+                    for k in range(0, len(group), TG_MEDIA_GROUP_MAX):
+                        chunk = group[k : k + TG_MEDIA_GROUP_MAX]
+                        msgs = await _send_group(message, [item for _, item in chunk])
+                        groups += 1
+                        sent.update(zip((i for i, _ in chunk), msgs))
+                if originals:
+                    await message.answer("Оригиналы без сжатия 👇", reply_markup=originals_kb(originals))
+        except TelegramBadRequest as e:
+            logger.warning(
+                "send_result_images: media group rejected sent=%s/%s err=%s",
+                len(sent),
+                len(results),
+                e,
+            )
+            for i, (filename, _) in enumerate(results):
+                if i not in sent:
+                    sent[i] = await send_image_smart(
+                        message, img_bytes=await fetch(i), filename=filename, scenario=scenario
+                    )
+    except BaseException:
+        for task in downloads.values():
+            task.cancel()
+        raise
+
+    delivered: list[SentImage] = []
+    for i, (filename, url) in enumerate(results):
+        local_path = ""
+        if keep_copy:
+            try:
+                local_path = await save_generated_image_bytes(
+                    img_bytes=await fetch(i),
+                    filename=filename,
+                    scenario=scenario,
+                    tg_id=message.chat.id,
+                )
+            except Exception as e:
+                logger.warning("send_result_images: local copy failed url=%s err=%s", url, e)
+        delivered.append(SentImage(message=sent[i], filename=filename, local_path=local_path))
+    logger.info(
+        "send_result_images: chat_id=%s images=%s requests=%s",
+        message.chat.id,
+        len(results),
+        groups,
+    )
+    return delivered
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import functools
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# защита от бесконечного роста (polling-циклы, длинные фоновые задачи)
+MAX_SPANS_PER_TRACE = 200
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    start: float  # секунды от начала трейса
+    depth: int
+    duration: float | None = None
+    outcome: str = "ok"
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Trace:
+    """
+    Всё, что произошло в рамках одного апдейта, включая фоновые задачи,
+    запущенные из него (_run_video_job, отложенные задачи планировщика).
+    """
+
+    trace_id: str
+    tg_id: int | None
+    kind: str
+    started_at: float = field(default_factory=time.time)
+    started_mono: float = field(default_factory=time.perf_counter)
+    spans: list[Span] = field(default_factory=list)
+    attrs: dict[str, Any] = field(default_factory=dict)
+    dropped_spans: int = 0
+
+    def has_span(self, name: str) -> bool:
+        return any(s.name == name for s in self.spans)
+
+
+class TraceStore:
+    """
+    Последние трейсы (только те, где есть хоть один span) — в памяти процесса:
+    по tg_id — до per_user штук, плюс индекс по trace_id для продолжения
+    трейса из задач планировщика.
+    """
+
+    def __init__(self, *, per_user: int = 20, max_users: int = 5000) -> None:
+        self._per_user = per_user
+        self._max_users = max_users
+        self._by_user: OrderedDict[int, deque[Trace]] = OrderedDict()
+        self._by_id: OrderedDict[str, Trace] = OrderedDict()
+
+    def add(self, trace: Trace) -> None:
+        self._by_id[trace.trace_id] = trace
+        self._by_id.move_to_end(trace.trace_id)
+        while len(self._by_id) > self._per_user * self._max_users // 4:
+            self._by_id.popitem(last=False)
+
+        if trace.tg_id is None:
+            return
+        traces = self._by_user.get(trace.tg_id)
+        if traces is None:
+            traces = deque(maxlen=self._per_user)
+            self._by_user[trace.tg_id] = traces
+        self._by_user.move_to_end(trace.tg_id)
+        if not any(t is trace for t in traces):
+            traces.append(trace)
+        while len(self._by_user) > self._max_users:
+            self._by_user.popitem(last=False)
+
+    def get(self, trace_id: str) -> Trace | None:
+        return self._by_id.get(trace_id)
+
+    def find(self, query: str) -> Trace | None:
+        """
+        По trace_id или по значению атрибута (kie_task_id из жалобы/лога).
+        """
+        trace = self._by_id.get(query)
+        if trace is not None:
+            return trace
+        for trace in reversed(self._by_id.values()):
+            if any(str(v) == query for v in trace.attrs.values()):
+                return trace
+        return None
+
+    def recent(self, tg_id: int, *, span_name: str | None = None, limit: int = 5) -> list[Trace]:
+        traces = list(self._by_user.get(tg_id) or ())
+        if span_name:
+            traces = [t for t in traces if t.has_span(span_name)]
+        return traces[-limit:]
+
+
+trace_store = TraceStore()
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_span_depth: ContextVar[int] = ContextVar("span_depth", default=0)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+def current_trace_id() -> str | None:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def use_trace(
+    trace_id: str | None = None, *, tg_id: int | None = None, kind: str = "update"
+) -> Iterator[Trace]:
+    """
+    Сделать трейс текущим. С известным trace_id (задача планировщика) —
+    продолжаем тот же трейс, если он ещё в памяти.
+    Задачи, созданные внутри (asyncio.create_task), наследуют его сами.
+    """
+    trace = trace_store.get(trace_id) if trace_id else None
+    if trace is None:
+        trace = Trace(trace_id=trace_id or new_trace_id(), tg_id=tg_id, kind=kind)
+    token = _current_trace.set(trace)
+    depth_token = _span_depth.set(0)
+    try:
+        yield trace
+    finally:
+        _span_depth.reset(depth_token)
+        _current_trace.reset(token)
+
+
+def annotate(**attrs: Any) -> None:
+    """
+    Атрибуты трейса (kie_task_id и т.п.) — по ним трейс ищется в /trace.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | None]:
+    """
+    Отрезок времени внутри текущего трейса. Вне трейса — no-op.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+        trace.dropped_spans += 1
+        yield None
+        return
+
+    depth = _span_depth.get()
+    started = time.perf_counter()
+    sp = Span(name=name, start=started - trace.started_mono, depth=depth, attrs=attrs)
+    if not trace.spans:
+        trace_store.add(trace)
+    trace.spans.append(sp)
+    token = _span_depth.set(depth + 1)
+    try:
+        yield sp
+    except BaseException as e:
+        if sp.outcome == "ok":
+            sp.outcome = type(e).__name__
+        raise
+    finally:
+        _span_depth.reset(token)
+        sp.duration = time.perf_counter() - started
+
+
+def traced(name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Декоратор для async-функций: весь вызов — один span.
+    """
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Проставляет record.trace_id. Висит на QueueHandler — т.е. выполняется
+    в вызывающем потоке/задаче, где contextvar ещё виден.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _current_trace.get()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+        return True
+
+
+# ---- вывод для админки ----
+
+
+def _fmt_duration(sec: float | None) -> str:
+    if sec is None:
+        return "…"
+    if sec < 1:
+        return f"{sec * 1000:.0f}ms"
+    return f"{sec:.1f}s"
+
+
+def render_trace(trace: Trace) -> str:
+    head = (
+        f"trace {trace.trace_id} · "
+        f"{time.strftime('%d.%m %H:%M:%S', time.localtime(trace.started_at))} · "
+        f"{trace.kind}"
+    )
+    if trace.attrs:
+        head += " · " + " ".join(f"{k}={v}" for k, v in trace.attrs.items())
+    lines = [head]
+    for sp in trace.spans:
+        attrs = " ".join(f"{k}={v}" for k, v in sp.attrs.items())
+        outcome = "" if sp.outcome == "ok" else f" ✗{sp.outcome}"
+        lines.append(
+            f"{'  ' * (sp.depth + 1)}+{sp.start:.1f}s {sp.name}"
+            f"{' ' + attrs if attrs else ''} {_fmt_duration(sp.duration)}{outcome}"
+        )
+    if trace.dropped_spans:
+        lines.append(f"  … ещё spans: {trace.dropped_spans}")
+    return "\n".join(lines)
@@ -0,0 +1,371 @@
+"""
+Локальные заглушки внешних API для нагрузочного теста (bench/load.py).
+
+Один aiohttp-сервер, пути не пересекаются:
+- KIE:      /api/file-stream-upload, /api/v1/jobs/createTask,
+            /api/v1/jobs/recordInfo, /api/v1/common/download-url, /files/<name>
+- Platega:  /transaction/process, /transaction/<id>
+- Bot API:  /bot<token>/<method>, /file/bot<token>/<path>
+- служебное: /_stats
+
+Задержки и доля ошибок задаются на сервис (FakeConfig).
+Отдельный запуск: python -m bench.fakes --port 18080
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiohttp import ClientSession, web
+
+
+@dataclass(slots=True)
+class ServiceProfile:
+    latency_ms: tuple[float, float] = (20.0, 60.0)
+    failure_rate: float = 0.0
+
+    async def delay(self) -> None:
+        lo, hi = self.latency_ms
+        if hi > 0:
+            await asyncio.sleep(random.uniform(lo, hi) / 1000)
+
+    def fails(self) -> bool:
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+@dataclass(slots=True)
+class FakeConfig:
+    host: str = "127.0.0.1"
+    port: int = 18080
+    kie: ServiceProfile = field(default_factory=lambda: ServiceProfile((50.0, 150.0)))
+    # время «генерации» задачи на стороне KIE (очередь + рендер)
+    kie_gen_sec: tuple[float, float] = (2.0, 5.0)
+    # доля задач, завершившихся state=fail
+    kie_task_fail_rate: float = 0.0
+    telegram: ServiceProfile = field(default_factory=lambda: ServiceProfile((20.0, 60.0)))
+    platega: ServiceProfile = field(default_factory=lambda: ServiceProfile((50.0, 150.0)))
+    # через сколько секунд транзакция становится CONFIRMED
+    platega_confirm_sec: float = 5.0
+    photo_kb: int = 200
+    result_kb: int = 800
+    results_per_task: int = 1
+    video_kb: int = 3000
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+
+def _noise_png(approx_bytes: int) -> bytes:
+    """
+    Настоящий PNG (шум почти не сжимается — размер ~ w*h*3): превью и
+    перекодирование в боте работают как с реальным результатом.
+    """
+    from io import BytesIO
+
+    from PIL import Image
+
+    side = max(16, int((approx_bytes / 3) ** 0.5))
+    img = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FakeServices:
+    def __init__(self, cfg: FakeConfig) -> None:
+        self.cfg = cfg
+        self.stats: Counter[str] = Counter()
+        self._tasks: dict[str, tuple[float, bool, bool]] = {}  # id -> (ready_at, failed, video)
+        self._transactions: dict[str, float] = {}  # id -> created_at
+        self._message_id = 0
+        self._blobs = {
+            "photo": os.urandom(cfg.photo_kb * 1024),
+            "result": _noise_png(cfg.result_kb * 1024),
+            "video": os.urandom(cfg.video_kb * 1024),
+        }
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        r = app.router
+        r.add_post("/api/file-stream-upload", self.kie_upload)
+        r.add_post("/api/v1/jobs/createTask", self.kie_create_task)
+        r.add_get("/api/v1/jobs/recordInfo", self.kie_record_info)
+        r.add_post("/api/v1/common/download-url", self.kie_download_url)
+        r.add_get("/files/{name}", self.kie_file)
+        r.add_post("/transaction/process", self.platega_process)
+        r.add_get("/transaction/{tx_id}", self.platega_status)
+        r.add_get("/file/bot{token}/{path:.+}", self.tg_file)
+        r.add_post("/bot{token}/{method}", self.tg_method)
+        r.add_get("/_stats", self.get_stats)
+        return app
+
+    # ---- KIE ----
+
+    async def kie_upload(self, request: web.Request) -> web.Response:
+        await request.read()
+        await self.cfg.kie.delay()
+        self.stats["kie.upload"] += 1
+        if self.cfg.kie.fails():
+            self.stats["kie.upload.failed"] += 1
+            return web.json_response({"code": 500, "success": False, "msg": "bench failure"})
+        name = f"{uuid.uuid4().hex}.jpg"
+        return web.json_response(
+            {
+                "code": 200,
+                "success": True,
+                "data": {"downloadUrl": f"{self.cfg.base_url}/files/{name}"},
+            }
+        )
+
+    async def kie_create_task(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self.cfg.kie.delay()
+        self.stats["kie.create_task"] += 1
+        if self.cfg.kie.fails():
+            self.stats["kie.create_task.failed"] += 1
+            return web.json_response({"code": 500, "msg": "bench failure"})
+        task_id = uuid.uuid4().hex
+        lo, hi = self.cfg.kie_gen_sec
+        failed = random.random() < self.cfg.kie_task_fail_rate
+        video = str(body.get("model", "")).startswith("kling")
+        self._tasks[task_id] = (time.monotonic() + random.uniform(lo, hi), failed, video)
+        return web.json_response({"code": 200, "data": {"taskId": task_id}})
+
+    async def kie_record_info(self, request: web.Request) -> web.Response:
+        await self.cfg.kie.delay()
+        self.stats["kie.record_info"] += 1
+        task_id = request.query.get("taskId", "")
+        task = self._tasks.get(task_id)
+        if task is None:
+            return web.json_response({"code": 404, "msg": "task not found"})
+        ready_at, failed, video = task
+        if time.monotonic() < ready_at:
+            return web.json_response({"code": 200, "data": {"state": "generating"}})
+        if failed:
+            self.stats["kie.task.failed"] += 1
+            return web.json_response(
+                {"code": 200, "data": {"state": "fail", "failMsg": "bench failure", "failCode": "500"}}
+            )
+        if video:
+            urls = [f"{self.cfg.base_url}/files/{task_id}.mp4"]
+        else:
+            urls = [f"{self.cfg.base_url}/files/{task_id}_{k}.png" for k in range(self.cfg.results_per_task)]
+        result = {"resultUrls": urls}
+        return web.json_response(
+            {"code": 200, "data": {"state": "success", "resultJson": json.dumps(result)}}
+        )
+
+    async def kie_download_url(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self.cfg.kie.delay()
+        self.stats["kie.download_url"] += 1
+        return web.json_response({"code": 200, "data": body.get("url")})
+
+    async def kie_file(self, request: web.Request) -> web.Response:
+        await self.cfg.kie.delay()
+        name = request.match_info["name"]
+        self.stats["kie.head" if request.method == "HEAD" else "kie.file"] += 1
+        if name.endswith(".mp4"):
+            return web.Response(body=self._blobs["video"], content_type="video/mp4")
+        if name.endswith(".png"):
+            return web.Response(body=self._blobs["result"], content_type="image/png")
+        return web.Response(body=self._blobs["photo"], content_type="image/jpeg")
+
+    # ---- Platega ----
+
+    async def platega_process(self, request: web.Request) -> web.Response:
+        await request.read()
+        await self.cfg.platega.delay()
+        self.stats["platega.process"] += 1
+        if self.cfg.platega.fails():
+            self.stats["platega.process.failed"] += 1
+            return web.json_response({"error": "bench failure"}, status=500)
+        tx_id = str(uuid.uuid4())
+        self._transactions[tx_id] = time.monotonic()
+        return web.json_response(
+            {
+                "transactionId": tx_id,
+                "redirect": f"{self.cfg.base_url}/pay/{tx_id}",
+                "status": "PENDING",
+            }
+        )
+
+    async def platega_status(self, request: web.Request) -> web.Response:
+        await self.cfg.platega.delay()
+        self.stats["platega.status"] += 1
+        created = self._transactions.get(request.match_info["tx_id"])
+        if created is None:
+            return web.json_response({"error": "not found"}, status=404)
+        confirmed = time.monotonic() - created >= self.cfg.platega_confirm_sec
+        return web.json_response({"status": "CONFIRMED" if confirmed else "PENDING"})
+
+    # ---- Telegram Bot API ----
+
+    def _message(self, chat_id: Any, **extra: Any) -> dict[str, Any]:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            **extra,
+        }
+
+    @staticmethod
+    def _file(prefix: str) -> dict[str, Any]:
+        fid = f"{prefix}_{uuid.uuid4().hex[:16]}"
+        return {"file_id": fid, "file_unique_id": fid}
+
+    async def tg_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        await self.cfg.telegram.delay()
+        self.stats[f"tg.{method}"] += 1
+        # исходящий трафик бота: байты загруженных файлов
+        self.stats["tg.upload_bytes"] += sum(
+            len(v.file.read()) for v in form.values() if isinstance(v, web.FileField)
+        )
+        if self.cfg.telegram.fails():
+            self.stats["tg.failed"] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error (bench)"}
+            )
+
+        chat_id = form.get("chat_id")
+        m = method.lower()
+        # отправка по ссылке: как настоящий Bot API, скачиваем сами (лимиты 5/20MB)
+        refs = [(form.get(f), f) for f in ("photo", "video", "document")]
+        if m == "sendmediagroup":
+            refs += [(item.get("media"), item.get("type")) for item in json.loads(str(form.get("media") or "[]"))]
+        for ref, kind in refs:
+            if isinstance(ref, str) and ref.startswith("http"):
+                self.stats["tg.url_send"] += 1
+                async with ClientSession() as s, s.get(ref) as resp:
+                    body = await resp.read()
+                if resp.status != 200 or len(body) > (5 << 20 if kind == "photo" else 20 << 20):
+                    self.stats["tg.url_send.rejected"] += 1
+                    return web.json_response(
+                        {"ok": False, "error_code": 400, "description": "Bad Request: failed to get HTTP URL content"}
+                    )
+        result: Any = True
+        if m == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif m == "getfile":
+            fid = str(form.get("file_id"))
+            result = {
+                "file_id": fid,
+                "file_unique_id": fid,
+                "file_size": self.cfg.photo_kb * 1024,
+                "file_path": f"photos/{fid}.jpg",
+            }
+        elif m == "getchatmember":
+            result = {
+                "status": "member",
+                "user": {"id": int(form.get("user_id") or 0), "is_bot": False, "first_name": "u"},
+            }
+        elif m == "sendphoto":
+            photo = {**self._file("ph"), "width": 1024, "height": 1024}
+            result = self._message(chat_id, photo=[photo])
+        elif m == "senddocument":
+            result = self._message(chat_id, document=self._file("doc"))
+        elif m == "sendvideo":
+            video = {**self._file("vid"), "width": 720, "height": 1280, "duration": 5}
+            result = self._message(chat_id, video=video)
+        elif m == "sendmediagroup":
+            media = json.loads(str(form.get("media") or "[]"))
+            result = [
+                self._message(chat_id, document=self._file("doc"))
+                if item.get("type") == "document"
+                else self._message(chat_id, photo=[{**self._file("ph"), "width": 1024, "height": 1024}])
+                for item in media
+            ]
+        elif m.startswith("send") and m != "sendchataction":
+            result = self._message(chat_id, text=str(form.get("text") or ""))
+        elif m.startswith("editmessage"):
+            result = self._message(chat_id, text=str(form.get("text") or ""))
+        return web.json_response({"ok": True, "result": result})
+
+    async def tg_file(self, request: web.Request) -> web.Response:
+        await self.cfg.telegram.delay()
+        self.stats["tg.file"] += 1
+        return web.Response(body=self._blobs["photo"], content_type="image/jpeg")
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+
+async def serve(cfg: FakeConfig, ready: Any = None) -> None:
+    runner = web.AppRunner(FakeServices(cfg).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=cfg.host, port=cfg.port, backlog=4096).start()
+    if ready is not None:
+        ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_in_process(cfg: FakeConfig, ready: Any) -> None:
+    """
+    Точка входа для multiprocessing: заглушки в отдельном процессе,
+    чтобы не делить event loop (и CPU) с ботом.
+    """
+    try:
+        asyncio.run(serve(cfg, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_range(raw: str) -> tuple[float, float]:
+    """
+    "50-150" -> (50.0, 150.0), "80" -> (80.0, 80.0)
+    """
+    lo, _, hi = raw.partition("-")
+    return float(lo), float(hi or lo)
+
+
+def add_fake_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--kie-latency-ms", type=parse_range, default=(50.0, 150.0))
+    parser.add_argument("--kie-fail-rate", type=float, default=0.0)
+    parser.add_argument("--kie-gen-sec", type=parse_range, default=(2.0, 5.0))
+    parser.add_argument("--kie-task-fail-rate", type=float, default=0.0)
+    parser.add_argument("--tg-latency-ms", type=parse_range, default=(20.0, 60.0))
+    parser.add_argument("--tg-fail-rate", type=float, default=0.0)
+    parser.add_argument("--platega-latency-ms", type=parse_range, default=(50.0, 150.0))
+    parser.add_argument("--platega-fail-rate", type=float, default=0.0)
+    parser.add_argument("--platega-confirm-sec", type=float, default=5.0)
+    parser.add_argument("--result-kb", type=int, default=800, help="size of generated result PNG")
+    parser.add_argument("--results-per-task", type=int, default=1, help="resultUrls per image task")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        port=args.port,
+        kie=ServiceProfile(args.kie_latency_ms, args.kie_fail_rate),
+        kie_gen_sec=args.kie_gen_sec,
+        kie_task_fail_rate=args.kie_task_fail_rate,
+        telegram=ServiceProfile(args.tg_latency_ms, args.tg_fail_rate),
+        platega=ServiceProfile(args.platega_latency_ms, args.platega_fail_rate),
+        platega_confirm_sec=args.platega_confirm_sec,
+        result_kb=args.result_kb,
+        results_per_task=args.results_per_task,
+    )
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Local KIE / Platega / Bot API stand-ins")
+    add_fake_args(p)
+    cfg = config_from_args(p.parse_args())
+    print(f"fakes listening on {cfg.base_url}")
+    asyncio.run(serve(cfg))
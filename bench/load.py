@@ -0,0 +1,443 @@
+"""
+Нагрузочный тест бота целиком: реальные хендлеры, middleware и SQLite,
+внешние API — локальные заглушки (bench/fakes.py) в отдельном процессе.
+
+    python -m bench.load --users 2000 --concurrency 200 \
+        --flows model,tryon,radar,nano_banana,animate,pay \
+        --kie-gen-sec 2-5 --kie-fail-rate 0.01 --tg-latency-ms 20-60
+
+Фаза 1: /start для всех пользователей (регистрация, подписка по умолчанию),
+затем всем выдаются генерации. Фаза 2: каждый пользователь проходит свой
+сценарий через Dispatcher.feed_raw_update, как при polling.
+
+Отчёт: апдейты/сек, p50/p95/p99 end-to-end по сценариям и по апдейтам,
+ожидание блокировок SQLite (время пишущих запросов, "database is locked"),
+пиковый RSS. Сеть не нужна — всё на 127.0.0.1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from bench.fakes import add_fake_args, config_from_args, run_in_process
+
+ALL_FLOWS = ("model", "tryon", "radar", "nano_banana", "animate", "pay")
+BOT_TOKEN = "123456:bench-token"
+USER_ID_BASE = 7_000_000_000
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — килобайты, macOS — байты
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+@dataclass(slots=True)
+class BenchStats:
+    update_latency: list[float] = field(default_factory=list)
+    flow_latency: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    flow_errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    updates: int = 0
+    db_writes: list[float] = field(default_factory=list)
+    db_locked: int = 0
+    errors_logged: int = 0
+
+
+class _ErrorCounter(logging.Handler):
+    def __init__(self, stats: BenchStats) -> None:
+        super().__init__(level=logging.ERROR)
+        self._stats = stats
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._stats.errors_logged += 1
+
+
+def _install_db_probes(engine: Any, stats: BenchStats) -> None:
+    """
+    Ожидание блокировки SQLite видно как время пишущего запроса:
+    первый INSERT/UPDATE/DELETE транзакции ждёт RESERVED lock (busy timeout).
+    """
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["bench_t0"].pop()
+        if statement.lstrip()[:6].upper() in {"INSERT", "UPDATE", "DELETE"}:
+            stats.db_writes.append(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("bench_t0") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        if "database is locked" in str(ctx.original_exception):
+            stats.db_locked += 1
+
+
+class UpdateFactory:
+    def __init__(self) -> None:
+        self._ids = itertools.count(1)
+
+    def _user(self, uid: int) -> dict[str, Any]:
+        return {"id": uid, "is_bot": False, "first_name": f"bench{uid}", "username": f"bench{uid}"}
+
+    def _message(self, uid: int, **extra: Any) -> dict[str, Any]:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self._user(uid),
+            **extra,
+        }
+
+    def text(self, uid: int, text: str) -> dict[str, Any]:
+        return {"update_id": next(self._ids), "message": self._message(uid, text=text)}
+
+    def photo(self, uid: int) -> dict[str, Any]:
+        fid = f"bench_{uid}_{next(self._ids)}"
+        photo = [{"file_id": fid, "file_unique_id": fid, "width": 1280, "height": 1280}]
+        return {"update_id": next(self._ids), "message": self._message(uid, photo=photo)}
+
+    def callback(self, uid: int, data: str) -> dict[str, Any]:
+        bot_message = self._message(uid, text="menu")
+        bot_message["from"] = {"id": 1, "is_bot": True, "first_name": "bench"}
+        return {
+            "update_id": next(self._ids),
+            "callback_query": {
+                "id": str(next(self._ids)),
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "message": bot_message,
+                "data": data,
+            },
+        }
+
+
+def build_flows(f: UpdateFactory) -> dict[str, Callable[[int], list[dict[str, Any]]]]:
+    from app.keyboards.confirm import ConfirmCallbacks
+    from app.keyboards.extra import ExtraCallbacks
+    from app.keyboards.menu import MenuCallbacks
+
+    return {
+        "model": lambda u: [
+            f.callback(u, MenuCallbacks.MODEL),
+            f.text(u, "девушка 25 лет, рост 170, тёмные волосы"),
+            f.callback(u, ConfirmCallbacks.YES),
+            f.photo(u),
+            f.text(u, "покажи товар в городе, дневной свет"),
+            f.callback(u, ConfirmCallbacks.YES),
+        ],
+        "tryon": lambda u: [
+            f.callback(u, MenuCallbacks.TRYON),
+            f.photo(u),
+            f.photo(u),
+            f.callback(u, ConfirmCallbacks.YES),
+            f.text(u, "надень куртку, застёгнутую наполовину"),
+        ],
+        "radar": lambda u: [
+            f.callback(u, MenuCallbacks.RADAR),
+            f.photo(u),
+            f.text(u, "чёрный седан"),
+            f.text(u, "А777АА77"),
+            f.text(u, "машут в камеру"),
+            f.text(u, "МКАД, вечер"),
+            f.callback(u, ConfirmCallbacks.YES),
+        ],
+        "nano_banana": lambda u: [
+            f.callback(u, MenuCallbacks.NANO_BANANA),
+            f.photo(u),
+            f.text(u, "сделай фон студийным"),
+        ],
+        "animate": lambda u: [
+            f.callback(u, MenuCallbacks.ANIMATE),
+            f.photo(u),
+            f.text(u, "человек улыбается и машет рукой"),
+        ],
+        "pay": lambda u: [
+            f.callback(u, ExtraCallbacks.BUY_NOVA_CARD),
+            f.text(u, "/start pay_ok"),
+        ],
+    }
+
+
+async def _feed(dp: Any, bot: Any, update: dict[str, Any], stats: BenchStats) -> None:
+    started = time.perf_counter()
+    await dp.feed_raw_update(bot, update)
+    stats.update_latency.append(time.perf_counter() - started)
+    stats.updates += 1
+
+
+async def _run_user(
+    uid: int,
+    flow: str,
+    steps: list[dict[str, Any]],
+    *,
+    dp: Any,
+    bot: Any,
+    stats: BenchStats,
+    think_sec: float,
+    wait_job: Callable[[int], Awaitable[None]],
+) -> None:
+    started = time.perf_counter()
+    try:
+        for i, update in enumerate(steps):
+            if i and think_sec:
+                await asyncio.sleep(think_sec)
+            await _feed(dp, bot, update, stats)
+        if flow == "animate":
+            await wait_job(uid)  # видео отправляется фоновой задачей
+    except Exception:
+        stats.flow_errors[flow] += 1
+        logging.getLogger("bench").exception("flow failed uid=%s flow=%s", uid, flow)
+        return
+    stats.flow_latency[flow].append(time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict[str, Any]:
+    # импорт приложения — только после настройки окружения (settings читаются при импорте)
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from sqlalchemy import update as sa_update
+
+    from app.db import engine, session_factory
+    from app.db.init_db import init_db
+    from app.handlers import animate_photo
+    from app.models.user_subscription import UserSubscription
+    from app.repository.plans import reload_plan_catalog
+    from app.services.subscription_seed import seed_subscriptions
+    from app.services.transcoder import transcoder
+    from app.utils.log_pipeline import setup_log_pipeline, stop_log_pipeline
+    from main import setup_middlewares, setup_routers
+
+    stats = BenchStats()
+    setup_log_pipeline(level=logging.getLevelName(args.log_level.upper()))
+    logging.getLogger().addHandler(_ErrorCounter(stats))  # считаем в вызывающем потоке
+    _install_db_probes(engine, stats)
+
+    await init_db()
+    async with session_factory() as session:
+        await seed_subscriptions(session)
+        await reload_plan_catalog(session)
+
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    await transcoder.warm_up()  # как в main(): воркеры превью подняты до трафика
+    dp = Dispatcher(storage=MemoryStorage())
+    setup_middlewares(dp)
+    setup_routers(dp)
+
+    factory = UpdateFactory()
+    flows = build_flows(factory)
+    users = [USER_ID_BASE + i for i in range(args.users)]
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def wait_job(uid: int) -> None:
+        task = animate_photo._active_jobs.get(uid)
+        if task is not None:
+            await asyncio.wait_for(asyncio.shield(task), timeout=args.flow_timeout)
+
+    async def limited(coro_fn: Callable[[], Awaitable[None]]) -> None:
+        async with sem:
+            await coro_fn()
+
+    report: dict[str, Any] = {"users": args.users, "concurrency": args.concurrency}
+    try:
+        # ---- фаза 1: /start ----
+        t0 = time.perf_counter()
+        await asyncio.gather(
+            *(
+                limited(
+                    lambda u=u: _run_user(
+                        u, "start", [factory.text(u, "/start")],
+                        dp=dp, bot=bot, stats=stats, think_sec=0, wait_job=wait_job,
+                    )
+                )
+                for u in users
+            )
+        )
+        report["start_phase_sec"] = round(time.perf_counter() - t0, 2)
+
+        async with session_factory() as session:
+            await session.execute(
+                sa_update(UserSubscription)
+                .where(UserSubscription.status == 1)
+                .values(remaining_photo=1000, remaining_video=1000)
+            )
+            await session.commit()
+
+        # ---- фаза 2: сценарии ----
+        names = [n for n in args.flows.split(",") if n]
+        unknown = set(names) - set(flows)
+        if unknown:
+            raise SystemExit(f"unknown flows: {', '.join(sorted(unknown))}")
+        updates_before = stats.updates
+        t1 = time.perf_counter()
+        await asyncio.gather(
+            *(
+                limited(
+                    lambda u=u, name=names[i % len(names)]: _run_user(
+                        u, name, flows[name](u),
+                        dp=dp, bot=bot, stats=stats,
+                        think_sec=args.think_ms / 1000, wait_job=wait_job,
+                    )
+                )
+                for i, u in enumerate(users)
+            )
+        )
+        wall = time.perf_counter() - t1
+        report["flow_phase_sec"] = round(wall, 2)
+        report["updates"] = stats.updates - updates_before
+        report["updates_per_sec"] = round((stats.updates - updates_before) / wall, 1) if wall else 0.0
+    finally:
+        await bot.session.close()
+        transcoder.shutdown()
+        await engine.dispose()
+        stop_log_pipeline()
+
+    def pcts(values: list[float]) -> dict[str, float]:
+        return {
+            "n": len(values),
+            "p50": round(percentile(values, 0.50), 3),
+            "p95": round(percentile(values, 0.95), 3),
+            "p99": round(percentile(values, 0.99), 3),
+            "max": round(max(values), 3) if values else 0.0,
+        }
+
+    report["update_latency_sec"] = pcts(stats.update_latency)
+    report["flows"] = {
+        name: {**pcts(values), "errors": stats.flow_errors.get(name, 0)}
+        for name, values in sorted(stats.flow_latency.items())
+    }
+    report["db"] = {
+        "writes": len(stats.db_writes),
+        "write_p95_ms": round(percentile(stats.db_writes, 0.95) * 1000, 1),
+        "write_p99_ms": round(percentile(stats.db_writes, 0.99) * 1000, 1),
+        "write_max_ms": round(max(stats.db_writes, default=0.0) * 1000, 1),
+        "writes_over_100ms": sum(1 for w in stats.db_writes if w > 0.1),
+        "locked_errors": stats.db_locked,
+    }
+    report["errors_logged"] = stats.errors_logged
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return report
+
+
+async def _fetch_fake_stats(base_url: str) -> dict[str, int]:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as s:
+        async with s.get(f"{base_url}/_stats") as resp:
+            return await resp.json()
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"\nusers={report['users']} concurrency={report['concurrency']}")
+    print(f"/start phase: {report['start_phase_sec']}s")
+    print(
+        f"flow phase:   {report['flow_phase_sec']}s, updates={report['updates']}, "
+        f"{report['updates_per_sec']} upd/s"
+    )
+    u = report["update_latency_sec"]
+    print(f"per-update:   p50={u['p50']}s p95={u['p95']}s p99={u['p99']}s max={u['max']}s")
+    print("\nflow          n      err   p50     p95     p99     max")
+    for name, f in report["flows"].items():
+        print(
+            f"{name:<13} {f['n']:<6} {f['errors']:<5} "
+            f"{f['p50']:<7} {f['p95']:<7} {f['p99']:<7} {f['max']}"
+        )
+    d = report["db"]
+    print(
+        f"\nsqlite: writes={d['writes']} p95={d['write_p95_ms']}ms p99={d['write_p99_ms']}ms "
+        f"max={d['write_max_ms']}ms >100ms={d['writes_over_100ms']} locked={d['locked_errors']}"
+    )
+    print(f"errors logged: {report['errors_logged']}")
+    print(f"peak RSS (bot process): {report['peak_rss_mb']} MB")
+    if report.get("fakes"):
+        print("fake API calls: " + ", ".join(f"{k}={v}" for k, v in sorted(report["fakes"].items())))
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="WearAI end-to-end load test")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=200)
+    p.add_argument("--flows", default=",".join(ALL_FLOWS))
+    p.add_argument("--think-ms", type=float, default=0.0, help="pause between user steps")
+    p.add_argument("--flow-timeout", type=float, default=900.0)
+    p.add_argument("--db", default="", help="SQLite file (default: temp file)")
+    p.add_argument("--log-level", default="WARNING")
+    p.add_argument("--json", default="", help="also write the report to this file")
+    add_fake_args(p)
+    args = p.parse_args()
+
+    fake_cfg = config_from_args(args)
+    base_url = fake_cfg.base_url
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="wearai-bench-"), "bench.db")
+
+    os.environ.update(
+        {
+            "BOT_TOKEN": BOT_TOKEN,
+            "KIE_API_KEY": "bench",
+            "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+            "KIE_API_BASE": base_url,
+            "KIE_UPLOAD_BASE": base_url,
+            "PLATEGA_BASE_URL": base_url,
+            "PLATEGA_MERCHANT_ID": "bench",
+            "PLATEGA_SECRET": "bench",
+            "TELEGRAM_API_BASE": base_url,
+        }
+    )
+
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    fakes = ctx.Process(target=run_in_process, args=(fake_cfg, ready), daemon=True)
+    fakes.start()
+    try:
+        if not ready.wait(timeout=30):
+            raise SystemExit("fake services did not start")
+        report = asyncio.run(run(args, base_url))
+        report["fakes"] = asyncio.run(_fetch_fake_stats(base_url))
+    finally:
+        fakes.terminate()
+        fakes.join(timeout=5)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Микробенчмарк репозитория на синтетической большой SQLite-базе.
+
+    python -m bench.repo_bench --users 1000000 --out bench/results/$(git rev-parse --short HEAD).json
+    python -m bench.repo_bench --db /tmp/seed.db --reuse --compare old.json
+
+1) Генерирует базу: N пользователей, история подписок (несколько строк на
+   пользователя, одна активная), платежи, рефералы, счётчики stats_counters.
+   Схема — init_db() текущей версии, данные — пачками через sqlite3.
+2) Для каждого варианта схемы (baseline — как в моделях, proposed —
+   плюс PROPOSED_INDEXES) копирует базу и гоняет горячие вызовы репозитория,
+   каждый в своей сессии/транзакции, как в хендлерах.
+3) Пишет JSON (p50/p95/p99/ops/s и EXPLAIN QUERY PLAN на вызов) — для
+   сравнения между версиями (--compare).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+# кандидаты в индексы: имя -> DDL. Вариант "proposed" = baseline + эти индексы.
+# Частичные индексы (WHERE status = 1) не годятся: SQLAlchemy передаёт status
+# параметром, а SQLite применяет частичный индекс только к литералу.
+PROPOSED_INDEXES: dict[str, str] = {
+    # _get_active_us_id / _get_active_user_subscription: WHERE user_id=? AND status=1
+    "ix_user_subscription_user_status": (
+        "CREATE INDEX IF NOT EXISTS ix_user_subscription_user_status "
+        "ON user_subscription (user_id, status, activated_at)"
+    ),
+    # expirer: WHERE status=1 AND expires_at<=now ORDER BY id LIMIT — обход в порядке id
+    # без сортировки всех истёкших (expires_at — чтобы индекс был покрывающим)
+    "ix_user_subscription_status_id": (
+        "CREATE INDEX IF NOT EXISTS ix_user_subscription_status_id "
+        "ON user_subscription (status, id, expires_at)"
+    ),
+    # poller: ORDER BY next_check_at NULLS FIRST, id — без temp b-tree на равных next_check_at
+    "ix_payments_status_next_check_id": (
+        "CREATE INDEX IF NOT EXISTS ix_payments_status_next_check_id "
+        "ON payments (status, next_check_at, id)"
+    ),
+}
+
+TG_ID_BASE = 100_000_000
+_DT_FMT = "%Y-%m-%d %H:%M:%S.%f"  # как SQLAlchemy DateTime хранит в SQLite
+
+
+def _dt(value: datetime) -> str:
+    return value.strftime(_DT_FMT)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+# ---- генерация базы ----
+
+
+@dataclass(slots=True)
+class SeedConfig:
+    users: int
+    history: float  # среднее число строк user_subscription на пользователя
+    paid_share: float  # доля пользователей на платном тарифе
+    expired_share: float  # доля активных подписок с истёкшим сроком
+    no_sub_share: float  # доля пользователей совсем без подписок
+    payments_per_user: float
+    pending_share: float
+    referral_share: float
+    seed: int
+
+
+def _create_schema(db_path: str) -> None:
+    # settings читаются при импорте app — окружение уже настроено в main()
+    from app.db import engine, session_factory
+    from app.db.init_db import init_db
+    from app.services.subscription_seed import seed_subscriptions
+    import app.models.payment  # noqa: F401  — не все модели есть в app.models.__init__
+    import app.models.user_subscription  # noqa: F401
+
+    async def _run() -> None:
+        try:
+            await init_db()
+            async with session_factory() as session:
+                await seed_subscriptions(session)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(_run())
+
+
+def generate_database(db_path: str, cfg: SeedConfig, *, chunk: int = 50_000) -> dict[str, int]:
+    rng = random.Random(cfg.seed)
+    _create_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    plans = dict(conn.execute("SELECT name, id FROM subscription"))
+    paid_ids = [plans[n] for n in ("Orbit", "Nova", "Cosmic") if n in plans]
+    base_id = plans["Base"]
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    counts = {"users": 0, "user_subscription": 0, "payments": 0, "referrals": 0, "active_subs": 0}
+
+    users_sql = (
+        "INSERT INTO users (id, tg_id, username, generated_photos, generated_videos, "
+        "free_channel_bonus_used, free_channel_bonus_pending, free_channel_reminder_sent, "
+        "referred_by_id, referrals_count, created_at) VALUES (?,?,?,?,?,0,0,0,?,0,?)"
+    )
+    subs_sql = (
+        "INSERT INTO user_subscription (user_id, subscription_id, activated_at, expires_at, "
+        "remaining_video, remaining_photo, status) VALUES (?,?,?,?,?,?,?)"
+    )
+    pay_sql = (
+        "INSERT INTO payments (user_tg_id, plan_name, amount, currency, platega_transaction_id, "
+        "status, created_at, confirmed_at, next_check_at, check_attempts) "
+        "VALUES (?,?,?,'RUB',?,?,?,?,?,?)"
+    )
+    ref_sql = "INSERT INTO referrals (referrer_user_id, referred_user_id, created_at) VALUES (?,?,?)"
+
+    started = time.perf_counter()
+    for lo in range(1, cfg.users + 1, chunk):
+        hi = min(cfg.users, lo + chunk - 1)
+        users, subs, pays, refs = [], [], [], []
+        for uid in range(lo, hi + 1):
+            created = now - timedelta(days=rng.uniform(0, 365))
+            referrer = rng.randint(1, uid - 1) if uid > 1 and rng.random() < cfg.referral_share else None
+            users.append(
+                (uid, TG_ID_BASE + uid, f"user{uid}", rng.randint(0, 50), rng.randint(0, 5), referrer, _dt(created))
+            )
+            if referrer is not None:
+                refs.append((referrer, uid, _dt(created)))
+
+            if rng.random() >= cfg.no_sub_share:
+                # история: погашенные строки + одна активная
+                n_hist = max(0, int(rng.expovariate(1 / max(cfg.history - 1, 0.01))))
+                t = created
+                for _ in range(n_hist):
+                    exp = t + timedelta(days=30)
+                    subs.append((uid, rng.choice(paid_ids), _dt(t), _dt(exp), 0, 0, 0))
+                    t = exp
+                paid = rng.random() < cfg.paid_share
+                expired = rng.random() < cfg.expired_share
+                exp = now - timedelta(hours=rng.uniform(1, 48)) if expired else now + timedelta(days=rng.uniform(1, 30))
+                subs.append(
+                    (
+                        uid,
+                        rng.choice(paid_ids) if paid else base_id,
+                        _dt(min(t, now)),
+                        _dt(exp),
+                        rng.randint(0, 100),
+                        rng.randint(1, 300),  # >0: charge не упирается в NoGenerationsLeft
+                        1,
+                    )
+                )
+                counts["active_subs"] += 1
+
+            n_pay = int(cfg.payments_per_user) + (rng.random() < cfg.payments_per_user % 1)
+            for _ in range(n_pay):
+                p_created = created + timedelta(hours=rng.uniform(0, 24 * 30))
+                pending = rng.random() < cfg.pending_share
+                status = "PENDING" if pending else rng.choice(("CONFIRMED", "CONFIRMED", "CANCELED", "EXPIRED"))
+                next_check = None
+                if pending and rng.random() < 0.8:
+                    next_check = _dt(now + timedelta(minutes=rng.uniform(-60, 60)))
+                pays.append(
+                    (
+                        TG_ID_BASE + uid,
+                        rng.choice(("Orbit", "Nova", "Cosmic")),
+                        rng.choice((990, 3650, 9850)),
+                        f"bench-{uid}-{len(pays)}-{rng.getrandbits(32):08x}",
+                        status,
+                        _dt(p_created),
+                        _dt(p_created) if status == "CONFIRMED" else None,
+                        next_check,
+                        rng.randint(0, 10) if pending else 0,
+                    )
+                )
+
+        with conn:
+            conn.executemany(users_sql, users)
+            conn.executemany(subs_sql, subs)
+            conn.executemany(pay_sql, pays)
+            conn.executemany(ref_sql, refs)
+        counts["users"] += len(users)
+        counts["user_subscription"] += len(subs)
+        counts["payments"] += len(pays)
+        counts["referrals"] += len(refs)
+        print(f"  seeded users {hi}/{cfg.users} ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+
+    with conn:
+        conn.execute(
+            "UPDATE users SET referrals_count = "
+            "(SELECT COUNT(*) FROM referrals r WHERE r.referrer_user_id = users.id) "
+            "WHERE id IN (SELECT referrer_user_id FROM referrals)"
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO stats_counters (name, value, updated_at) VALUES (?,?,?)",
+            [
+                ("users_total", counts["users"], _dt(now)),
+                ("active_subs", counts["active_subs"], _dt(now)),
+                ("_backfilled", 1, _dt(now)),
+            ],
+        )
+    conn.execute("ANALYZE")
+    conn.close()
+    return counts
+
+
+# ---- замеры ----
+
+
+@dataclass(slots=True)
+class Case:
+    name: str
+    calls: int
+    fn: Callable[[Any, int], Awaitable[Any]]  # (session, i) -> ...
+
+
+def _build_cases(args: argparse.Namespace, n_users: int, rng: random.Random) -> list[Case]:
+    from app.repository.admin import get_users_keyset, get_users_stats
+    from app.repository.generations import (
+        NoGenerationsLeft,
+        charge_photo_generation,
+        ensure_default_subscription,
+    )
+    from app.repository.payments import apply_plan_to_user, get_pending_payments_batch
+    from app.repository.plans import get_plan_by_name
+    from app.services.subscription_expirer import expire_subscriptions_once
+
+    def rand_tg() -> int:
+        return TG_ID_BASE + rng.randint(1, n_users)
+
+    charge_ids = [rand_tg() for _ in range(args.calls)]
+    ensure_ids = [rand_tg() for _ in range(args.calls)]
+    apply_ids = [rand_tg() for _ in range(args.calls)]
+    page_cursors = [rng.randint(1, n_users) for _ in range(args.calls)]
+
+    async def charge(session: Any, i: int) -> None:
+        try:
+            await charge_photo_generation(session, charge_ids[i])
+        except NoGenerationsLeft:
+            pass
+
+    async def ensure(session: Any, i: int) -> None:
+        await ensure_default_subscription(session, ensure_ids[i])
+
+    async def apply_plan(session: Any, i: int) -> None:
+        plan = await get_plan_by_name(session, "Nova")
+        await apply_plan_to_user(session, apply_ids[i], plan)
+
+    async def users_stats(session: Any, i: int) -> None:
+        await get_users_stats(session)
+
+    async def users_page(session: Any, i: int) -> None:
+        # первая страница и «глубокие» страницы по курсору
+        await get_users_keyset(session, limit=20, before_id=None if i % 10 == 0 else page_cursors[i])
+
+    async def expire(session: Any, i: int) -> None:
+        await expire_subscriptions_once(session, batch_size=500)
+
+    async def pending(session: Any, i: int) -> None:
+        await get_pending_payments_batch(session, limit=50)
+
+    return [
+        Case("charge_photo_generation", args.calls, charge),
+        Case("ensure_default_subscription", args.calls, ensure),
+        Case("apply_plan_to_user", args.calls, apply_plan),
+        Case("get_users_stats", args.calls, users_stats),
+        Case("get_users_keyset", args.calls, users_page),
+        Case("expire_subscriptions_once", args.expire_calls, expire),
+        Case("get_pending_payments_batch", args.calls, pending),
+    ]
+
+
+def _explain(db_path: str, statements: list[tuple[str, Any]]) -> list[str]:
+    """
+    EXPLAIN QUERY PLAN для реально выполненных вызовом запросов
+    (SQL и параметры сняты на прогреве).
+    """
+    conn = sqlite3.connect(db_path)
+    plans: list[str] = []
+    try:
+        for sql, params in statements:
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            steps = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())]
+            plans.append(" | ".join(steps))
+    finally:
+        conn.close()
+    return list(dict.fromkeys(plans))
+
+
+async def _run_variant(db_path: str, cases: list[Case]) -> dict[str, Any]:
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    factory = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+    captured: list[tuple[str, Any]] | None = None
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if captured is not None and not executemany:
+            captured.append((statement, parameters))
+
+    results: dict[str, Any] = {}
+    try:
+        for case in cases:
+            # прогрев: кеш страниц SQLite и каталог тарифов; заодно снимаем SQL для планов
+            captured = []
+            async with factory() as session:
+                await case.fn(session, 0)
+            statements, captured = captured, None
+            timings: list[float] = []
+            wall = time.perf_counter()
+            for i in range(case.calls):
+                async with factory() as session:
+                    t0 = time.perf_counter()
+                    await case.fn(session, i)
+                    timings.append(time.perf_counter() - t0)
+            wall = time.perf_counter() - wall
+            results[case.name] = {
+                "calls": case.calls,
+                "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+                "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+                "ops_per_sec": round(case.calls / wall, 1) if wall else 0.0,
+                "plan": _explain(db_path, statements),
+            }
+            print(f"    {case.name:<30} p50={results[case.name]['p50_ms']}ms", file=sys.stderr)
+    finally:
+        await engine.dispose()
+    return results
+
+
+def _prepare_variant(seed_path: str, workdir: str, variant: str) -> str:
+    path = os.path.join(workdir, f"{variant}.db")
+    shutil.copyfile(seed_path, path)
+    if variant == "proposed":
+        conn = sqlite3.connect(path)
+        with conn:
+            for ddl in PROPOSED_INDEXES.values():
+                conn.execute(ddl)
+        conn.execute("ANALYZE")
+        conn.close()
+    return path
+
+
+def _git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict[str, Any], previous: dict[str, Any], *, threshold: float) -> int:
+    """
+    Печатает p50 было/стало по каждому вызову; возвращает число регрессий
+    (стало медленнее более чем в threshold раз).
+    """
+    regressions = 0
+    print(f"\ncompare {previous['meta'].get('git_rev')} -> {current['meta'].get('git_rev')}")
+    for variant, cases in current["variants"].items():
+        old_cases = previous.get("variants", {}).get(variant, {})
+        for name, res in cases.items():
+            old = old_cases.get(name)
+            if not old or not old.get("p50_ms"):
+                continue
+            ratio = res["p50_ms"] / old["p50_ms"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {variant:<9} {name:<30} {old['p50_ms']:>9}ms -> {res['p50_ms']:>9}ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Repository micro-benchmarks on a synthetic SQLite DB")
+    p.add_argument("--users", type=int, default=1_000_000)
+    p.add_argument("--history", type=float, default=3.0, help="avg user_subscription rows per user")
+    p.add_argument("--paid-share", type=float, default=0.1)
+    p.add_argument("--expired-share", type=float, default=0.05)
+    p.add_argument("--no-sub-share", type=float, default=0.02)
+    p.add_argument("--payments-per-user", type=float, default=0.3)
+    p.add_argument("--pending-share", type=float, default=0.05)
+    p.add_argument("--referral-share", type=float, default=0.2)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--calls", type=int, default=2000, help="calls per repository function")
+    p.add_argument("--expire-calls", type=int, default=20)
+    p.add_argument("--variants", default="baseline,proposed")
+    p.add_argument("--db", default="", help="seed DB path (kept; default: temp)")
+    p.add_argument("--reuse", action="store_true", help="reuse --db if it exists")
+    p.add_argument("--out", default="", help="write JSON results here")
+    p.add_argument("--compare", default="", help="previous JSON to compare against")
+    p.add_argument("--threshold", type=float, default=1.25, help="p50 ratio counted as regression")
+    args = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wearai-repo-bench-")
+    seed_path = args.db or os.path.join(workdir, "seed.db")
+    os.environ.update(
+        {
+            "BOT_TOKEN": os.getenv("BOT_TOKEN") or "123456:bench",
+            "KIE_API_KEY": os.getenv("KIE_API_KEY") or "bench",
+            "DATABASE_URL": f"sqlite+aiosqlite:///{seed_path}",
+        }
+    )
+    # apply_plan_to_user и др. пишут INFO/WARNING на каждый вызов — в замер не нужно
+    logging.basicConfig(level=logging.ERROR)
+
+    seed_cfg = SeedConfig(
+        users=args.users,
+        history=args.history,
+        paid_share=args.paid_share,
+        expired_share=args.expired_share,
+        no_sub_share=args.no_sub_share,
+        payments_per_user=args.payments_per_user,
+        pending_share=args.pending_share,
+        referral_share=args.referral_share,
+        seed=args.seed,
+    )
+
+    try:
+        if args.reuse and os.path.exists(seed_path):
+            conn = sqlite3.connect(seed_path)
+            counts = {
+                t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                for t in ("users", "user_subscription", "payments", "referrals")
+            }
+            conn.close()
+            print(f"reusing {seed_path}: {counts}", file=sys.stderr)
+        else:
+            if os.path.exists(seed_path):
+                os.remove(seed_path)
+            t0 = time.perf_counter()
+            counts = generate_database(seed_path, seed_cfg)
+            print(f"seeded in {time.perf_counter() - t0:.1f}s: {counts}", file=sys.stderr)
+
+        report: dict[str, Any] = {
+            "meta": {
+                "git_rev": _git_rev(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "seed": asdict(seed_cfg) | {"calls": args.calls, "expire_calls": args.expire_calls},
+                "rows": counts,
+                "proposed_indexes": PROPOSED_INDEXES,
+            },
+            "variants": {},
+        }
+        for variant in [v for v in args.variants.split(",") if v]:
+            print(f"  variant {variant}", file=sys.stderr)
+            path = _prepare_variant(seed_path, workdir, variant)
+            # одинаковые tg_id в каждом варианте — сравнение честное
+            cases = _build_cases(args, counts["users"], random.Random(args.seed))
+            report["variants"][variant] = asyncio.run(_run_variant(path, cases))
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)  # --db лежит вне workdir и остаётся
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            previous = json.load(fh)
+        if compare(report, previous, threshold=args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
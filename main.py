@@ -6,12 +6,15 @@ import os
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from app.db.init_db import init_db
 from app.db import engine, session_factory
-from app.middlewares import DbSessionMiddleware, UserActionLogMiddleware
+from app.db.writer import start_group_writer
+from app.middlewares import DbSessionMiddleware, TraceMiddleware, UserActionLogMiddleware
 
 from app.handlers.faq import router as faq_router
 from app.handlers.feedback import router as feedback_router
@@ -26,26 +29,49 @@ from app.handlers.menu import router as menu_router
 from app.handlers.love_is import router as love_is_router
 from app.handlers.radar import router as radar_router
 from app.handlers.feedback_offer_video import router as feedback_offer_video_router
+from app.handlers.result_original import router as result_original_router
 from app.handlers.admin_panel import router as admin_panel_router
 from app.handlers.admin_broadcast import router as admin_broadcast_router
 from app.handlers.extra import router as extra_router
 from app.handlers.admin_access import router as admin_access_router
 from app.handlers.referrals import router as referrals_router
+from app.handlers.channel_member import router as channel_member_router
 from app.handlers.errors import router as errors_router
 
 from app.services.subscription_seed import seed_subscriptions
-from app.services.subscription_expirer import run_subscription_expirer
+from app.services.subscription_expirer import (
+    register_expirer_job,
+    schedule_subscription_expirer,
+)
 from app.services.payment_poller import run_payment_poller  # NEW
-from app.services.admin_log_cleanup import run_admin_log_cleanup
+from app.services.platega import close_platega_client
+from app.services.transcoder import transcoder
+from app.services.admin_log_cleanup import (
+    register_admin_log_cleanup_job,
+    schedule_admin_log_cleanup,
+)
+from app.services.free_channel_bonus import register_bonus_jobs
+from app.services.generated_sweeper import (
+    register_generated_sweep_job,
+    schedule_generated_sweep,
+)
+from app.services.scheduler import scheduler
+from app.services.admin_action_buffer import admin_action_buffer
 from app.utils.tg_logging import install_tg_error_logging
+from app.utils.log_pipeline import parse_sample_rates, setup_log_pipeline, stop_log_pipeline
+from app.utils.metrics import start_metrics_server
+from app.utils.loop_monitor import LoopLagMonitor
 from app.services.admin_seed import ensure_root_admin
+from app.repository.stats import backfill_stats_once
+from app.repository.plans import reload_plan_catalog
 
 
 def setup_logging() -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
+    # вывод логов — в фоновом потоке, event loop только кладёт записи в очередь
+    setup_log_pipeline(
+        level=logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper()),
+        # напр. LOG_SAMPLE="user_actions=10": шумные INFO-логгеры, 1 из N
+        sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE", "")),
     )
 
 
@@ -71,11 +97,14 @@ def setup_routers(dp: Dispatcher) -> None:
     dp.include_router(animate_router)
     dp.include_router(faq_router)
     dp.include_router(feedback_offer_video_router)
+    dp.include_router(result_original_router)
     dp.include_router(admin_panel_router)
     dp.include_router(admin_broadcast_router)
     dp.include_router(extra_router)
     dp.include_router(admin_access_router)
     dp.include_router(referrals_router)
+    # chat_member апдейты канала -> кэш подписки
+    dp.include_router(channel_member_router)
     # Роутеры с более “общими” хендлерами — ниже
     dp.include_router(help_router)
     dp.include_router(settings_router)
@@ -83,6 +112,8 @@ def setup_routers(dp: Dispatcher) -> None:
 
 
 def setup_middlewares(dp: Dispatcher) -> None:
+    # первым: trace_id должен быть уже в логах MSG/CBQ
+    dp.update.outer_middleware(TraceMiddleware())
     dp.update.outer_middleware(UserActionLogMiddleware())
     dp.update.outer_middleware(DbSessionMiddleware(session_factory))
 
@@ -91,11 +122,19 @@ async def main() -> None:
     setup_logging()
     log = logging.getLogger(__name__)
 
+    # свой Bot API сервер (local bot-api или заглушка из bench/) — TELEGRAM_API_BASE
+    api_base = os.getenv("TELEGRAM_API_BASE", "").strip()
     bot = Bot(
         token=get_bot_token(),
+        session=AiohttpSession(api=TelegramAPIServer.from_base(api_base)) if api_base else None,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    install_tg_error_logging(bot=bot, chat_id=830091750)
+    # ошибки -> один дайджест в админ-чат за окно (группировка по fingerprint)
+    install_tg_error_logging(
+        bot=bot,
+        chat_id=830091750,
+        window_sec=float(os.getenv("ERROR_DIGEST_WINDOW_SEC", "60")),
+    )
 
     dp = Dispatcher(storage=MemoryStorage())
 
@@ -105,7 +144,33 @@ async def main() -> None:
     await init_db()
     async with session_factory() as session:
         await seed_subscriptions(session)
+        await reload_plan_catalog(session)  # каталог планов в памяти
         await ensure_root_admin(session)
+        await backfill_stats_once(session)
+
+    # опционально (DB_GROUP_COMMIT=1): мелкие записи группируются в одну транзакцию
+    writer_task = start_group_writer(
+        session_factory,
+        max_batch=int(os.getenv("DB_GROUP_COMMIT_BATCH", "100")),
+        max_delay_sec=float(os.getenv("DB_GROUP_COMMIT_DELAY_MS", "5")) / 1000,
+    )
+
+    # опционально (METRICS_PORT): гистограммы этапов генерации в формате Prometheus
+    metrics_runner = await start_metrics_server(
+        host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        port=int(os.getenv("METRICS_PORT", "0")),
+    )
+
+    # воркеры перекодирования (превью результатов) — поднимаем заранее
+    await transcoder.warm_up()
+
+    # лаг event loop (в /metrics) + стек блокирующего вызова в лог при залипании
+    loop_monitor = LoopLagMonitor(
+        interval_sec=float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000,
+        block_threshold_sec=float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000,
+        asyncio_debug=os.getenv("LOOP_ASYNCIO_DEBUG", "0") == "1",
+    )
+    loop_monitor.start()
 
     # NEW: запускаем polling платежей (без вебхуков)
     poller_task = asyncio.create_task(
@@ -114,30 +179,68 @@ async def main() -> None:
             sessionmaker=session_factory,  # у тебя это async_sessionmaker[AsyncSession]
             interval_sec=int(os.getenv("PAYMENTS_POLL_INTERVAL", "20")),
             batch_size=int(os.getenv("PAYMENTS_POLL_BATCH", "50")),
+            concurrency=int(os.getenv("PAYMENTS_POLL_CONCURRENCY", "8")),
+            expire_after_hours=int(os.getenv("PAYMENTS_EXPIRE_AFTER_HOURS", "24")),
         )
     )
-    # NEW: ежедневная проверка просроченных подписок в 00:01 UTC+3
-    expirer_task = asyncio.create_task(
-        run_subscription_expirer(sessionmaker=session_factory)
+    # отложенные и периодические задачи — один планировщик на таблице scheduled_jobs
+    register_bonus_jobs(bot)
+    register_expirer_job(session_factory)
+    register_admin_log_cleanup_job()
+    register_generated_sweep_job()
+    # проверка просроченных подписок каждые N сек (0 = раз в сутки в 00:01 UTC+3)
+    await schedule_subscription_expirer(
+        batch_size=int(os.getenv("SUBSCRIPTION_EXPIRE_BATCH", "500")),
+        interval_sec=int(os.getenv("SUBSCRIPTION_EXPIRE_INTERVAL", "300")),
+    )
+    await schedule_admin_log_cleanup()
+    # ротация _generated (keep_last на каталог) — вне пути сохранения
+    await schedule_generated_sweep(
+        interval_sec=int(os.getenv("GENERATED_SWEEP_INTERVAL_SEC", "600")),
+    )
+    scheduler_task = asyncio.create_task(
+        scheduler.run(
+            horizon_sec=float(os.getenv("SCHEDULER_HORIZON_SEC", "60")),
+            concurrency=int(os.getenv("SCHEDULER_CONCURRENCY", "32")),
+        )
+    )
+    # лог действий админов пишется пачками в фоне
+    admin_actions_task = asyncio.create_task(
+        admin_action_buffer.run(
+            sessionmaker=session_factory,
+            batch_size=int(os.getenv("ADMIN_ACTIONS_BATCH", "50")),
+            flush_interval_sec=float(os.getenv("ADMIN_ACTIONS_FLUSH_SEC", "2")),
+        )
     )
-    admin_log_cleanup_task = asyncio.create_task(run_admin_log_cleanup())
 
     try:
         log.info("Bot started. Polling...")
-        await dp.start_polling(bot)
+        # chat_member не приходит по умолчанию — список берём из хендлеров
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
-        poller_task.cancel()
-        expirer_task.cancel()
-        admin_log_cleanup_task.cancel()
-        try:
-            await poller_task
-            await expirer_task
-            await admin_log_cleanup_task
-        except asyncio.CancelledError:
-            pass
-
+        tasks = [
+            poller_task,
+            scheduler_task,  # незавершённые задачи перезапустятся после рестарта
+            admin_actions_task,  # при отмене дописывает очередь в БД
+        ]
+        for task in tasks:
+            task.cancel()
+        # ждём все задачи (каждая сама обрабатывает отмену), до engine.dispose()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # writer — последним: задачи выше могли отправить в него записи
+        if writer_task is not None:
+            writer_task.cancel()
+            await asyncio.gather(writer_task, return_exceptions=True)
+
+        await loop_monitor.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_platega_client()
+        transcoder.shutdown()
         await engine.dispose()
         log.info("Shutdown OK: DB engine disposed.")
+        stop_log_pipeline()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from app.utils import generated_files
+from app.utils.generated_files import GeneratedFileStore
+
+
+def test_save_during_sweep_unlink_keeps_file(tmp_path, monkeypatch):
+    """
+    save() тех же байт, пока sweep() удаляет блоб в потоке, не должен
+    остаться с индексом на удалённый файл.
+    """
+    monkeypatch.setenv("GENERATED_DIR", str(tmp_path))
+    monkeypatch.setenv("GENERATED_QUOTA_MB", "0")
+
+    unlink_started = threading.Event()
+    release_unlink = threading.Event()
+    real_unlink_all = generated_files._unlink_all
+
+    def slow_unlink_all(paths):
+        unlink_started.set()
+        release_unlink.wait(5)
+        real_unlink_all(paths)
+
+    monkeypatch.setattr(generated_files, "_unlink_all", slow_unlink_all)
+
+    async def scenario() -> None:
+        store = GeneratedFileStore()
+        data = b"\x89PNG same bytes"
+        path = await store.save(img_bytes=data, filename="a.png", scenario="model", tg_id=1)
+        digest = next(iter(store._blobs))
+        store._blobs[digest].refs = 0  # ссылок не осталось — жертва sweep()
+
+        sweep = asyncio.create_task(store.sweep())
+        await asyncio.to_thread(unlink_started.wait, 5)
+        save = asyncio.create_task(
+            store.save(img_bytes=data, filename="a.png", scenario="model", tg_id=1)
+        )
+        await asyncio.sleep(0.05)  # save() успевает дойти до ожидания
+        release_unlink.set()
+
+        assert await sweep == (1, len(data))
+        assert await save == path
+        assert digest in store._blobs
+        assert await store.read(path) == data
+
+    asyncio.run(scenario())